@@ -18,9 +18,9 @@ service cron start
 
 # Run initial collection
 echo "Running initial data collection..."
-python /app/scripts/data_collector.py -c update
-python /app/scripts/release_old_ips.py --days 30
-python /app/scripts/network_cleanup.py
+python /app/scripts/job_runner.py run collect --jitter 0
+python /app/scripts/job_runner.py run release_old_ips --jitter 0
+python /app/scripts/job_runner.py run cleanup --jitter 0
 
 # Keep container running
 echo "Data collector is ready. Monitoring for scheduled runs..."
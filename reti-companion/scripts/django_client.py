@@ -2,11 +2,21 @@ import requests
 import json
 import logging
 from datetime import datetime
+from config import config
 from config.config import DJANGO_API_BASE_URL, DJANGO_API_TOKEN
 import time
 
 logger = logging.getLogger(__name__)
 
+# Rows per page when walking /api/ips/ (the server caps it at API_IP_MAX_PAGE_SIZE)
+IP_PAGE_SIZE = 1000
+
+# Fields the companion reads from /api/ips/ (sparse fieldset: smaller JSON and SELECT)
+IP_FIELDS = 'ip,stato,mac_address,ultimo_controllo,disponibilita,responsabile,vlan'
+
+# IPs per POST /api/ips/lookup/ request (the server accepts up to 5000)
+LOOKUP_CHUNK_SIZE = 5000
+
 class DjangoAPIClient:
     def __init__(self):
         self.base_url = DJANGO_API_BASE_URL
@@ -32,30 +42,39 @@ class DjangoAPIClient:
             return False
     
     def get_ip_by_address(self, ip_address):
-        """Get IP address details by IP string"""
+        """Get the compact record of an IP (None if it does not exist or the lookup failed)"""
+        records = self.lookup_ips([ip_address])
+        return records.get(ip_address) if records else None
+
+    def lookup_ips(self, ip_addresses, chunk_size=LOOKUP_CHUNK_SIZE):
+        """Look up many IPs with POST /ips/lookup/ (one IN query per chunk server-side)
+
+        Returns:
+            dict: {ip: compact record, or None if the IP does not exist}, or
+            None if the requests failed (nothing is known about existence)
+        """
+        url = f"{self.base_url}/ips/lookup/"
+        ip_addresses = list(ip_addresses)
+        records = {}
         try:
-            url = f"{self.base_url}/ips/"
-            params = {'ip': ip_address}
-            logger.debug(f"Searching for IP {ip_address} at {url} with params {params}")
-            response = self.session.get(url, params=params)
-            
-            # Debug authentication
-            if response.status_code == 401:
-                logger.error(f"Authentication failed! Token: {'SET' if DJANGO_API_TOKEN else 'NOT SET'}")
-                return None
-            elif response.status_code == 403:
-                logger.error(f"Permission denied for IP lookup: {ip_address}")
-                return None
-                
-            response.raise_for_status()
-            
-            data = response.json()
-            results = data.get('results', [])
-            logger.debug(f"Found {len(results)} results for IP {ip_address}")
-            return results[0] if results else None
-            
-        except requests.RequestException as e:
-            logger.error(f"Error getting IP {ip_address}: {e}")
+            for i in range(0, len(ip_addresses), chunk_size):
+                chunk = ip_addresses[i:i + chunk_size]
+                logger.debug(f"Looking up {len(chunk)} IPs at {url}")
+                response = self.session.post(url, json={'ips': chunk})
+
+                if response.status_code == 401:
+                    logger.error(f"Authentication failed! Token: {'SET' if DJANGO_API_TOKEN else 'NOT SET'}")
+                    return None
+                elif response.status_code == 403:
+                    logger.error("Permission denied for IP lookup")
+                    return None
+
+                response.raise_for_status()
+                records.update(response.json()['risultati'])
+            return records
+
+        except (requests.RequestException, ValueError, KeyError) as e:
+            logger.error(f"Error looking up IPs: {e}")
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response status: {e.response.status_code}")
                 logger.error(f"Response content: {e.response.text}")
@@ -121,6 +140,39 @@ class DjangoAPIClient:
                 logger.error(f"Response content: {e.response.text}")
             return None
     
+    def bulk_update_ips(self, items, atomic=False, chunk_size=1000):
+        """Update many IPs with PATCH /ips/bulk/ ({ip, fields...} objects)
+
+        Returns:
+            dict: {ip: True/False} with the per-item outcome, or None if the
+            requests failed (nothing is known about the outcome)
+        """
+        url = f"{self.base_url}/ips/bulk/"
+        outcome = {}
+        try:
+            for i in range(0, len(items), chunk_size):
+                payload = {'atomic': atomic, 'items': items[i:i + chunk_size]}
+                response = self.session.patch(url, json=payload)
+
+                if response.status_code == 401:
+                    logger.error("Authentication failed! Check API token.")
+                    return None
+                if response.status_code not in (200, 207, 400) or 'risultati' not in response.json():
+                    response.raise_for_status()
+
+                for result in response.json()['risultati']:
+                    outcome[result['ip']] = result['status'] == 200
+                    if result['status'] != 200:
+                        logger.error(f"Bulk update of IP {result['ip']} failed: {result.get('errori')}")
+            return outcome
+
+        except (requests.RequestException, ValueError) as e:
+            logger.error(f"Error in bulk IP update: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response status: {e.response.status_code}")
+                logger.error(f"Response content: {e.response.text}")
+            return None
+    
     def create_or_update_ip(self, ip_address, mac_address, router_name):
         """Create or update IP with MAC address and router info"""
         # First try to get existing IP
@@ -133,7 +185,8 @@ class DjangoAPIClient:
             update_data = {
                 'mac_address': mac_address,
                 'stato': 'attivo',
-                'ultimo_controllo': current_time
+                'ultimo_controllo': current_time,
+                'sorgente': router_name
             }
             
             # Add note if IP was inactive
@@ -167,15 +220,29 @@ class DjangoAPIClient:
     def bulk_update_ips_from_router(self, ip_mac_dict, router_name):
         """Update multiple IPs from a router's ARP table"""
         logger.info(f"Processing {len(ip_mac_dict)} IPs from {router_name}")
+
+        if getattr(config, 'OBSERVATION_STAGING', False):
+            # One append-only call; IPs, last checks and sightings are merged server-side
+            queued = self.record_observations(ip_mac_dict, router_name) if ip_mac_dict else {}
+            if queued is None:
+                return {'created': 0, 'updated': 0, 'errors': len(ip_mac_dict)}
+            logger.info(f"Router {router_name} - Observations queued: {queued.get('accodate', 0)}")
+            return {'created': 0, 'updated': queued.get('accodate', 0), 'errors': 0}
         
         created_count = 0
         updated_count = 0
         error_count = 0
+
+        # One lookup for the whole ARP table instead of one list query per IP
+        existing_ips = self.lookup_ips(ip_mac_dict) if ip_mac_dict else {}
+        if existing_ips is None:
+            logger.error(f"Router {router_name} - IP lookup failed, nothing updated")
+            return {'created': 0, 'updated': 0, 'errors': len(ip_mac_dict)}
         
         for ip_address, mac_address in ip_mac_dict.items():
             try:
                 logger.debug(f"Processing IP {ip_address} with MAC {mac_address}")
-                existing_ip = self.get_ip_by_address(ip_address)
+                existing_ip = existing_ips.get(ip_address)
                 
                 if existing_ip:
                     logger.debug(f"IP {ip_address} exists, updating...")
@@ -183,7 +250,9 @@ class DjangoAPIClient:
                     update_data = {
                         'mac_address': mac_address,
                         'stato': 'attivo',
-                        'ultimo_controllo': datetime.now().isoformat()
+                        'ultimo_controllo': datetime.now().isoformat(),
+                        # Heartbeat: the server stores it in the narrow ControlloIP table
+                        'sorgente': router_name
                     }
                     
                     if self.update_ip(ip_address, update_data):
@@ -217,6 +286,12 @@ class DjangoAPIClient:
                 error_count += 1
         
         logger.info(f"Router {router_name} - Created: {created_count}, Updated: {updated_count}, Errors: {error_count}")
+
+        # Sighting history: one bulk call per device, independent of the per-IP updates above
+        sightings = self.record_sightings(ip_mac_dict, router_name) if ip_mac_dict else None
+        if sightings:
+            logger.info(f"Router {router_name} - Sightings extended: {sightings.get('estesi', 0)}, new: {sightings.get('nuovi', 0)}")
+
         return {
             'created': created_count,
             'updated': updated_count,
@@ -230,14 +305,16 @@ class DjangoAPIClient:
             
             net = IPNetwork(network_cidr)
             created_count = 0
+
+            # Skip network and broadcast addresses
+            ip_strs = [str(ip) for ip in net if ip not in [net.network, net.broadcast]]
+            existing_ips = self.lookup_ips(ip_strs)
+            if existing_ips is None:
+                logger.error(f"IP lookup failed for LAN {network_cidr}, nothing created")
+                return 0
             
-            for ip in net:
-                # Skip network and broadcast addresses
-                if ip in [net.network, net.broadcast]:
-                    continue
-                
-                ip_str = str(ip)
-                existing = self.get_ip_by_address(ip_str)
+            for ip_str in ip_strs:
+                existing = existing_ips.get(ip_str)
                 
                 if not existing:
                     create_data = {
@@ -279,14 +356,27 @@ class DjangoAPIClient:
                 url = None
         return vlans
     
-    def get_all_ips(self):
-        """Recupera tutti gli indirizzi IP dal backend Django tramite API REST"""
+    def get_all_ips(self, params=None):
+        """Recupera gli indirizzi IP dal backend Django tramite API REST
+
+        Args:
+            params: Filtri opzionali dell'API (es. {'vlan__isnull': 'true'} o
+                {'ultimo_controllo__lt': '2025-05-30T12:00:00+00:00'}) per scaricare
+                solo le righe di interesse invece dell'intera tabella
+
+        Returns:
+            list: Gli IP di tutte le pagine ([] se nessun IP corrisponde), oppure
+            None se una richiesta fallisce: un elenco parziale non va scambiato
+            per quello completo
+        """
         try:
             url = f"{self.base_url}/ips/"
+            # Large keyset pages: the walk costs O(n) on the server
+            params = {'page_size': IP_PAGE_SIZE, 'fields': IP_FIELDS, **(params or {})}
             ips = []
             
             while url:
-                response = self.session.get(url)
+                response = self.session.get(url, params=params)
                 response.raise_for_status()
                 data = response.json()
                 
@@ -294,6 +384,8 @@ class DjangoAPIClient:
                 if isinstance(data, dict) and 'results' in data:
                     ips.extend(data['results'])
                     url = data.get('next')
+                    # I link 'next' della paginazione includono già i filtri
+                    params = None
                 else:
                     ips.extend(data)
                     url = None
@@ -306,7 +398,102 @@ class DjangoAPIClient:
             if hasattr(e, 'response') and e.response is not None:
                 logger.error(f"Response status: {e.response.status_code}")
                 logger.error(f"Response content: {e.response.text}")
-            return []
+            return None
+
+    def deactivate_stale_ips(self, hours, dry_run=False, sample_size=20):
+        """Deactivate server-side all active IPs not seen for more than `hours` hours"""
+        try:
+            url = f"{self.base_url}/ips/deactivate_stale/"
+            payload = {'hours': hours, 'dry_run': dry_run, 'sample_size': sample_size}
+            response = self.session.post(url, json=payload)
+
+            if response.status_code == 401:
+                logger.error("Authentication failed! Check API token.")
+                return None
+            elif response.status_code == 403:
+                logger.error("Permission denied for stale IP deactivation (staff user required).")
+                return None
+
+            response.raise_for_status()
+            return response.json()
+
+        except requests.RequestException as e:
+            logger.error(f"Error deactivating stale IPs: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response status: {e.response.status_code}")
+                logger.error(f"Response content: {e.response.text}")
+            return None
+
+    def record_observations(self, ip_mac_dict, source):
+        """Queue the IP/MAC pairs seen by a device in the server-side observation staging table"""
+        try:
+            url = f"{self.base_url}/observations/"
+            payload = {'sorgente': source, 'osservazioni': ip_mac_dict}
+            response = self.session.post(url, json=payload)
+
+            if response.status_code == 401:
+                logger.error("Authentication failed! Check API token.")
+                return None
+            elif response.status_code == 403:
+                logger.error("Permission denied for observation ingestion (staff user required).")
+                return None
+
+            response.raise_for_status()
+            return response.json()
+
+        except requests.RequestException as e:
+            logger.error(f"Error queueing observations from {source}: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response status: {e.response.status_code}")
+                logger.error(f"Response content: {e.response.text}")
+            return None
+
+    def record_sightings(self, ip_mac_dict, source):
+        """Record the IP/MAC pairs seen by a device in one call (extends open sighting intervals)"""
+        try:
+            url = f"{self.base_url}/sightings/registra/"
+            payload = {'sorgente': source, 'avvistamenti': ip_mac_dict}
+            response = self.session.post(url, json=payload)
+
+            if response.status_code == 401:
+                logger.error("Authentication failed! Check API token.")
+                return None
+            elif response.status_code == 403:
+                logger.error("Permission denied for sighting registration (staff user required).")
+                return None
+
+            response.raise_for_status()
+            return response.json()
+
+        except requests.RequestException as e:
+            logger.error(f"Error recording sightings from {source}: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response status: {e.response.status_code}")
+                logger.error(f"Response content: {e.response.text}")
+            return None
+
+    def recount_vlans(self, associate_unassigned=True):
+        """Recount num_indirizzi for all VLANs server-side (single aggregate query)"""
+        try:
+            url = f"{self.base_url}/vlans/recount/"
+            response = self.session.post(url, json={'associa': associate_unassigned})
+
+            if response.status_code == 401:
+                logger.error("Authentication failed! Check API token.")
+                return None
+            elif response.status_code == 403:
+                logger.error("Permission denied for VLAN recount (staff user required).")
+                return None
+
+            response.raise_for_status()
+            return response.json()
+
+        except requests.RequestException as e:
+            logger.error(f"Error recounting VLANs: {e}")
+            if hasattr(e, 'response') and e.response is not None:
+                logger.error(f"Response status: {e.response.status_code}")
+                logger.error(f"Response content: {e.response.text}")
+            return None
 
     def update_vlan(self, vlan_numero, vlan_data):
         """Aggiorna una VLAN esistente usando il numero VLAN come identificatore"""
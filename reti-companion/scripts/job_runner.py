@@ -0,0 +1,289 @@
+#!/usr/bin/env python3
+"""
+Coordinated execution of the companion maintenance jobs.
+
+Every job runs under a named lock (flock on a persistent lock file) so that two
+cron invocations of the same job never overlap: if the lock is held the new run
+is skipped. The kernel releases the lock when the owning process exits, so a
+crashed run never leaves a stale lock behind, and each job is killed after its
+maximum duration.
+
+The 'pipeline' command runs the recurring jobs in dependency order
+(collect -> cleanup -> VLAN assign -> recount) under a pipeline lock and stops
+at the first failing step, so that e.g. a failed collection never feeds the
+cleanup with stale 'ultimo_controllo' values.
+
+Each run (success, failure or skip) is recorded in the stats store.
+
+Usage:
+    python job_runner.py pipeline
+    python job_runner.py run release_old_ips
+    python job_runner.py status
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import fcntl
+import socket
+import logging
+import argparse
+import subprocess
+from datetime import datetime
+
+sys.path.insert(0, '/app')
+
+from stats_manager import StatsManager
+
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+)
+logger = logging.getLogger(__name__)
+
+SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+LOCK_DIR = '/var/log/data-collector/locks'
+LOG_DIR = '/var/log/data-collector'
+
+# Maximum random delay (seconds) before starting, to spread jobs fired on the same minute
+DEFAULT_JITTER = 60
+
+# Job definitions: command, log file (always appended) and maximum expected duration
+# after which the job is killed
+JOBS = {
+    'collect': {
+        'command': ['data_collector.py', '-c', 'update'],
+        'log': 'cron.log',
+        'max_duration': 45 * 60,
+    },
+    'cleanup': {
+        'command': ['network_cleanup.py'],
+        'log': 'cleanup.log',
+        'max_duration': 20 * 60,
+    },
+    'vlan_assign': {
+        'command': ['vlan_assigner.py', '--incremental', '--skip-counts'],
+        'log': 'vlan.log',
+        'max_duration': 30 * 60,
+    },
+    'recount': {
+        'command': ['vlan_assigner.py', '--counts-only'],
+        'log': 'vlan.log',
+        'max_duration': 15 * 60,
+    },
+    'release_old_ips': {
+        'command': ['release_old_ips.py', '--days', '30'],
+        'log': 'release_old_ips.log',
+        'max_duration': 60 * 60,
+    },
+}
+
+# Recurring jobs in dependency order
+PIPELINE = ['collect', 'cleanup', 'vlan_assign', 'recount']
+
+
+class JobLock:
+    """Named lock held with flock on a lock file that is never removed"""
+
+    def __init__(self, name, max_age, lock_dir=None):
+        lock_dir = lock_dir or LOCK_DIR
+        self.name = name
+        self.max_age = max_age
+        self.path = os.path.join(lock_dir, f"{name}.lock")
+        self.acquired = False
+        self.fd = None
+        os.makedirs(lock_dir, exist_ok=True)
+
+    def read_owner(self):
+        """Return the lock content (pid, host, started_at) or None"""
+        try:
+            with open(self.path, 'r') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def acquire(self):
+        """Try to take the lock; return False if held by a running job"""
+        fd = os.open(self.path, os.O_CREAT | os.O_RDWR, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            os.close(fd)
+            owner = self.read_owner() or {}
+            if time.time() - owner.get('started_at', time.time()) > self.max_age:
+                logger.warning(f"Lock {self.name} held by pid {owner.get('pid')} for more than {self.max_age}s")
+            return False
+
+        # The content only describes the owner (status and logs): the flock decides
+        payload = json.dumps({
+            'pid': os.getpid(),
+            'host': socket.gethostname(),
+            'started_at': time.time(),
+        })
+        os.ftruncate(fd, 0)
+        os.write(fd, payload.encode())
+        self.fd = fd
+        self.acquired = True
+        return True
+
+    def release(self):
+        if self.acquired:
+            # The file stays: unlinking it would let the next run lock a new inode
+            # while another process still waits on the old one
+            os.ftruncate(self.fd, 0)
+            fcntl.flock(self.fd, fcntl.LOCK_UN)
+            os.close(self.fd)
+            self.fd = None
+            self.acquired = False
+
+    def __enter__(self):
+        return self.acquire()
+
+    def __exit__(self, exc_type, exc, tb):
+        self.release()
+
+
+class JobRunner:
+    """Runs companion jobs under locks and records their history"""
+
+    def __init__(self, jitter=DEFAULT_JITTER):
+        self.jitter = jitter
+        self.stats_manager = StatsManager()
+
+    def apply_jitter(self):
+        if self.jitter > 0:
+            delay = random.uniform(0, self.jitter)
+            logger.info(f"Start jitter: sleeping {delay:.1f}s")
+            time.sleep(delay)
+
+    def run_job(self, name, extra_args=None):
+        """Run a single job under its lock. Returns 'success', 'failed' or 'skipped'"""
+        job = JOBS[name]
+        lock = JobLock(name, job['max_duration'])
+
+        if not lock.acquire():
+            owner = lock.read_owner() or {}
+            logger.warning(f"Job {name} already running (pid {owner.get('pid')}), skipping")
+            self.stats_manager.record_job_run(name, 'skipped', 0, message=f"Already running (pid {owner.get('pid')})")
+            return 'skipped'
+
+        started = time.time()
+        command = [sys.executable, os.path.join(SCRIPTS_DIR, job['command'][0])] + job['command'][1:] + list(extra_args or [])
+        log_path = os.path.join(LOG_DIR, job['log'])
+        logger.info(f"Starting job {name}: {' '.join(command)} (log: {log_path})")
+
+        try:
+            with open(log_path, 'a') as log_file:
+                log_file.write(f"--- {datetime.now().isoformat()} job {name} ---\n")
+                log_file.flush()
+                result = subprocess.run(
+                    command,
+                    stdout=log_file,
+                    stderr=subprocess.STDOUT,
+                    timeout=job['max_duration'],
+                )
+            status = 'success' if result.returncode == 0 else 'failed'
+            message = f"Exit code {result.returncode}"
+        except subprocess.TimeoutExpired:
+            status = 'failed'
+            message = f"Timeout after {job['max_duration']}s"
+        except Exception as e:
+            status = 'failed'
+            message = str(e)
+        finally:
+            lock.release()
+
+        duration = round(time.time() - started, 2)
+        logger.info(f"Job {name} finished: {status} in {duration}s ({message})")
+        self.stats_manager.record_job_run(name, status, duration, message=message)
+        if status == 'failed':
+            self.stats_manager.add_error(f"Job {name} failed: {message}", source='job_runner')
+        return status
+
+    def run_pipeline(self):
+        """Run the recurring jobs in dependency order, stopping at the first failure"""
+        lock = JobLock('pipeline', sum(JOBS[name]['max_duration'] for name in PIPELINE))
+        if not lock.acquire():
+            owner = lock.read_owner() or {}
+            logger.warning(f"Pipeline already running (pid {owner.get('pid')}), skipping")
+            self.stats_manager.record_job_run('pipeline', 'skipped', 0, message=f"Already running (pid {owner.get('pid')})")
+            return 'skipped'
+
+        started = time.time()
+        status = 'success'
+        message = ''
+        try:
+            for name in PIPELINE:
+                job_status = self.run_job(name)
+                if job_status != 'success':
+                    status = 'failed' if job_status == 'failed' else 'skipped'
+                    message = f"Stopped at {name} ({job_status})"
+                    logger.warning(f"Pipeline stopped: job {name} {job_status}, dependent jobs not run")
+                    break
+        finally:
+            lock.release()
+
+        duration = round(time.time() - started, 2)
+        self.stats_manager.record_job_run('pipeline', status, duration, message=message)
+        return status
+
+
+def print_status(stats_manager):
+    stats = stats_manager.load_stats()
+    job_runs = stats.get('job_runs', {})
+    if not job_runs:
+        print("No job runs recorded")
+        return
+    for name, info in sorted(job_runs.items()):
+        print(f"{name:16} last={info.get('last_run')} status={info.get('last_status')} "
+              f"duration={info.get('last_duration')}s runs={info.get('runs', 0)} "
+              f"failures={info.get('failures', 0)} skips={info.get('skips', 0)}")
+
+
+def parse_args(argv=None):
+    """
+    Parse the command line.
+
+    Options the runner does not know (and anything after '--') are passed to the
+    job script, so --jitter is recognised wherever it appears.
+    """
+    parser = argparse.ArgumentParser(description='Coordinated runner for companion maintenance jobs',
+                                     allow_abbrev=False)
+    parser.add_argument('command', choices=['pipeline', 'run', 'status'],
+                        help='pipeline: collect -> cleanup -> VLAN assign -> recount; run: single job; status: job history')
+    parser.add_argument('job', nargs='?', choices=sorted(JOBS.keys()),
+                        help='Job to run (for the run command)')
+    parser.add_argument('--jitter', type=int, default=DEFAULT_JITTER,
+                        help=f'Maximum random start delay in seconds (default: {DEFAULT_JITTER}, 0 to disable)')
+
+    args, job_args = parser.parse_known_args(argv)
+    args.job_args = [a for a in job_args if a != '--']
+    if args.command == 'run' and not args.job:
+        parser.error("the run command requires a job name")
+    if args.job_args and args.command != 'run':
+        parser.error(f"unrecognized arguments: {' '.join(args.job_args)}")
+    return args
+
+
+def main():
+    args = parse_args()
+    runner = JobRunner(jitter=args.jitter)
+
+    if args.command == 'status':
+        print_status(runner.stats_manager)
+        return
+
+    runner.apply_jitter()
+
+    if args.command == 'pipeline':
+        status = runner.run_pipeline()
+    else:
+        status = runner.run_job(args.job, args.job_args)
+
+    sys.exit(1 if status == 'failed' else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,9 @@
 """
 Script for automatic release of long-term inactive IPs.
 
-This script checks all IPs via API and automatically releases
-those that meet the criteria:
-- ultimo_controllo > threshold days (default 30 days)
+This script asks the API to release, in a single bulk operation,
+all IPs that meet the criteria:
+- ultimo_controllo > threshold days (default 30 days), or never checked
 - stato = 'disattivo'
 - disponibilita = 'usato'
 
@@ -22,8 +22,8 @@ import json
 import argparse
 import sys
 import logging
-from datetime import datetime, timedelta
-from typing import List, Dict, Optional
+from datetime import datetime
+from typing import Dict, Optional
 import os
 from stats_manager import StatsManager
 
@@ -63,141 +63,60 @@ class OldIPReleaser:
             logger.warning(f"Unable to initialize StatsManager: {e}")
             self.stats = None
     
-    def get_all_ips(self) -> List[Dict]:
+    def release_inactive_ips(self, days_threshold: int, dry_run: bool = False) -> Optional[Dict]:
         """
-        Retrieve all IPs from the system via API
+        Release all candidate IPs server-side with a single bulk API call
         
-        Returns:
-            List of dictionaries with IP data
-        """
-        try:
-            url = f"{self.base_url}/api/ips/"
-            all_ips = []
-            
-            while url:
-                logger.debug(f"Fetching: {url}")
-                response = self.session.get(url, timeout=30)
-                response.raise_for_status()
-                
-                data = response.json()
-                all_ips.extend(data.get('results', []))
-                url = data.get('next')  # Pagination
-                
-            logger.info(f"Retrieved {len(all_ips)} IPs from system")
-            return all_ips
-            
-        except requests.exceptions.RequestException as e:
-            logger.error(f"Error retrieving IPs: {e}")
-            return []
-    
-    def is_ip_candidate_for_release(self, ip_data: Dict, days_threshold: int) -> Dict:
-        """
-        Check if an IP is a candidate for release
+        Candidates (used, inactive, with a responsible person and not checked
+        for days_threshold days) are selected in SQL and released with the
+        same history records written by the per-IP /libera/ endpoint. With
+        dry_run the server only counts them and returns a sample.
         
         Args:
-            ip_data: IP data
             days_threshold: Threshold days of inactivity
+            dry_run: If True, only count candidates without releasing them
             
         Returns:
-            Dict with 'eligible' (bool) and 'reason' (str)
-        """
-        ip_address = ip_data.get('ip')
-        ultimo_controllo = ip_data.get('ultimo_controllo')
-        stato = ip_data.get('stato')
-        disponibilita = ip_data.get('disponibilita')
-        responsabile = ip_data.get('responsabile')
-        
-        # Check basic conditions
-        if disponibilita != 'usato':
-            return {'eligible': False, 'reason': f'Availability: {disponibilita} (not used)'}
-        
-        if stato != 'disattivo':
-            return {'eligible': False, 'reason': f'Status: {stato} (not inactive)'}
-        
-        if not responsabile:
-            return {'eligible': False, 'reason': 'No responsible person assigned'}
-        
-        # Check last control date
-        if not ultimo_controllo:
-            logger.warning(f"IP {ip_address}: ultimo_controllo is None, considered very old")
-            return {'eligible': True, 'reason': f'Last check: Never (considered > {days_threshold} days)'}
-        
-        try:
-            # Parse date (ISO format)
-            if ultimo_controllo.endswith('Z'):
-                ultimo_controllo = ultimo_controllo[:-1] + '+00:00'
-            
-            last_check = datetime.fromisoformat(ultimo_controllo.replace('Z', '+00:00'))
-            now = datetime.now(last_check.tzinfo)
-            days_inactive = (now - last_check).days
-            
-            if days_inactive >= days_threshold:
-                return {'eligible': True, 'reason': f'Inactive for {days_inactive} days (threshold: {days_threshold})'}
-            else:
-                return {'eligible': False, 'reason': f'Inactive for only {days_inactive} days (threshold: {days_threshold})'}
-                
-        except (ValueError, TypeError) as e:
-            logger.error(f"Date parsing error for IP {ip_address}: {e}")
-            return {'eligible': False, 'reason': f'Date parsing error: {e}'}
-    
-    def release_ip(self, ip_address: str, reason: str, dry_run: bool = False) -> bool:
-        """
-        Release an IP using the API's rilascia_ip method
-        
-        Args:
-            ip_address: IP address to release
-            reason: Reason for release
-            dry_run: If True, simulate operation without applying
-            
-        Returns:
-            True if operation succeeded, False otherwise
+            API response dict, or None on error
         """
-        if dry_run:
-            logger.info(f"[DRY-RUN] Would release IP {ip_address}: {reason}")
-            return True
-        
         try:
-            # Use the release endpoint that automatically handles history
-            url = f"{self.base_url}/api/ips/{ip_address}/libera/"
-            
+            url = f"{self.base_url}/api/ips/release_inactive/"
             payload = {
-                'force': True,  # Force release even if not expired
+                'days': days_threshold,
+                'dry_run': dry_run,
                 'motivo': 'inattivita',
-                'note': f"Automatic release due to prolonged inactivity: {reason}",
-                'created_by': 'script_release_old_ips'
+                'note': f"Automatic release due to prolonged inactivity (threshold: {days_threshold} days)",
+                'created_by': 'script_release_old_ips',
+                'sample_size': 100
             }
             
-            logger.info(f"Releasing IP {ip_address}: {reason}")
-            response = self.session.post(url, json=payload, timeout=30)
-            
+            response = self.session.post(url, json=payload, timeout=300)
             if response.status_code == 200:
-                result = response.json()
-                logger.info(f"✅ IP {ip_address} released successfully. Was assigned to: {result.get('era_assegnato_a', 'N/A')}")
-                
-                return True
-            else:
-                logger.error(f"❌ Error releasing IP {ip_address}: {response.status_code} - {response.text}")
-                return False
-                
+                return response.json()
+            
+            logger.error(f"❌ Error releasing inactive IPs: {response.status_code} - {response.text}")
+            return None
+            
         except requests.exceptions.RequestException as e:
-            logger.error(f"❌ Network error releasing IP {ip_address}: {e}")
-            return False
+            logger.error(f"❌ Network error releasing inactive IPs: {e}")
+            return None
     
     def process_old_ips(self, days_threshold: int = 30, dry_run: bool = False, 
                        clear_notes: bool = False) -> Dict:
         """
-        Process all IPs to release old and inactive ones
+        Release old and inactive IPs with a single server-side bulk operation
         
         Args:
             days_threshold: Threshold days of inactivity
             dry_run: If True, simulate operations without applying
-            clear_notes: If True, also clear notes (not implemented in current API)
+            clear_notes: Kept for compatibility: released IPs always have their notes cleared
             
         Returns:
             Dict with operation statistics
         """
         logger.info(f"{'[DRY-RUN] ' if dry_run else ''}Starting processing of old and inactive IPs")
         logger.info(f"Inactivity threshold: {days_threshold} days")
+        start_time = datetime.now()
         
         # Statistics
         stats = {
@@ -208,42 +127,29 @@ class OldIPReleaser:
             'skipped': 0
         }
         
-        # Retrieve all IPs
-        all_ips = self.get_all_ips()
-        if not all_ips:
-            logger.error("No IPs retrieved, stopping processing")
+        result = self.release_inactive_ips(days_threshold, dry_run)
+        if result is None:
+            stats['release_errors'] += 1
             return stats
         
-        stats['total_ips'] = len(all_ips)
+        released = result.get('rilasciati', 0)
+        stats['total_ips'] = released
+        stats['candidates_found'] = released
+        stats['released_successfully'] = released
         
-        logger.info(f"Analyzing {len(all_ips)} IPs...")
+        for ip_info in result.get('campione', []):
+            logger.info(f"{'[DRY-RUN] Would release' if dry_run else '✅ Released'} IP {ip_info['ip']}. "
+                        f"Was assigned to: {ip_info.get('era_assegnato_a') or 'N/A'}")
+        if released > len(result.get('campione', [])):
+            logger.info(f"  ... and {released - len(result.get('campione', []))} more")
         
-        for ip_data in all_ips:
-            ip_address = ip_data.get('ip')
-            
-            # Check if it's a candidate for release
-            check_result = self.is_ip_candidate_for_release(ip_data, days_threshold)
-            
-            if check_result['eligible']:
-                stats['candidates_found'] += 1
-                logger.info(f"🎯 Candidate IP: {ip_address} - {check_result['reason']}")
-                
-                # Try to release the IP
-                if self.release_ip(ip_address, check_result['reason'], dry_run):
-                    stats['released_successfully'] += 1
-                else:
-                    stats['release_errors'] += 1
-            else:
-                stats['skipped'] += 1
-                logger.debug(f"⏭️  Skipped IP: {ip_address} - {check_result['reason']}")
+        duration = (datetime.now() - start_time).total_seconds()
         
         # Final log
-        logger.info(f"{'[DRY-RUN] ' if dry_run else ''}Processing completed:")
-        logger.info(f"  📊 Total IPs analyzed: {stats['total_ips']}")
+        logger.info(f"{'[DRY-RUN] ' if dry_run else ''}Processing completed in {duration:.1f}s:")
         logger.info(f"  🎯 Candidate IPs for release: {stats['candidates_found']}")
         logger.info(f"  ✅ IPs released successfully: {stats['released_successfully']}")
         logger.info(f"  ❌ Release errors: {stats['release_errors']}")
-        logger.info(f"  ⏭️  Skipped IPs: {stats['skipped']}")
         
         # Update global statistics using correct methods
         if self.stats and not dry_run:
@@ -255,7 +161,7 @@ class OldIPReleaser:
                     'created': 0,  # We don't create IPs, we release them
                     'updated': stats['released_successfully'],  # Released IPs = updates
                     'errors': stats['release_errors'],
-                    'duration': 0,  # You could add timing if needed
+                    'duration': duration,
                     'total_analyzed': stats['total_ips'],
                     'candidates_found': stats['candidates_found']
                 }
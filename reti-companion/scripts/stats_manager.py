@@ -49,7 +49,8 @@ class StatsManager:
             },
             'recent_errors': [],
             'last_successful_run': None,
-            'cron_status': 'running'
+            'cron_status': 'running',
+            'job_runs': {}
         }
     
     def save_stats(self, stats):
@@ -146,6 +147,45 @@ class StatsManager:
         self.save_stats(current_stats)
         logger.error(f"Error added to stats: {error_message}")
     
+    def record_job_run(self, job_name, status, duration, message=None):
+        """Record a maintenance job run (success, failed or skipped) in the job history"""
+        current_stats = self.load_stats()
+        current_time = datetime.now().isoformat()
+        
+        job_runs = current_stats.setdefault('job_runs', {})
+        job_stats = job_runs.setdefault(job_name, {
+            'runs': 0,
+            'failures': 0,
+            'skips': 0,
+            'last_run': None,
+            'last_status': None,
+            'last_duration': 0,
+            'last_success': None,
+            'history': []
+        })
+        
+        job_stats['runs'] += 1
+        if status == 'failed':
+            job_stats['failures'] += 1
+        elif status == 'skipped':
+            job_stats['skips'] += 1
+        elif status == 'success':
+            job_stats['last_success'] = current_time
+        job_stats['last_run'] = current_time
+        job_stats['last_status'] = status
+        job_stats['last_duration'] = duration
+        
+        job_stats['history'].append({
+            'timestamp': current_time,
+            'status': status,
+            'duration': duration,
+            'message': message
+        })
+        job_stats['history'] = job_stats['history'][-20:]  # Keep last 20 runs per job
+        
+        self.save_stats(current_stats)
+        logger.info(f"Job run recorded for {job_name}: {status} ({duration}s)")
+    
     def update_cron_status(self, status):
         """Update cron job status"""
         current_stats = self.load_stats()
@@ -205,6 +245,10 @@ class StatsManager:
                 'collections': len(recent_activity)
             },
             'devices': stats.get('device_stats', {}),
+            'jobs': {
+                name: {key: value for key, value in info.items() if key != 'history'}
+                for name, info in stats.get('job_runs', {}).items()
+            },
             'recent_errors': stats.get('recent_errors', [])[-10:],  # Last 10 errors
             'recent_activity': recent_activity[:10]  # Last 10 activities
         } 
\ No newline at end of file
@@ -2,7 +2,10 @@
 import sys
 import os
 import logging
-from datetime import datetime
+import json
+import hashlib
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
 import ipaddress
 import argparse
 
@@ -23,6 +26,96 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+# Stato dell'ultima esecuzione (watermark + hash delle subnet) per la modalità incrementale
+STATE_FILE = '/var/log/data-collector/vlan_assigner_state.json'
+# Margine di sovrapposizione sul watermark per coprire differenze di orologio con il server
+WATERMARK_OVERLAP = timedelta(minutes=10)
+
+
+class SubnetTrie:
+    """Trie binario sui bit dell'indirizzo per il longest-prefix-match subnet -> VLAN.
+
+    Viene costruito una sola volta per esecuzione; ogni lookup costa al massimo
+    32 passi indipendentemente dal numero di subnet configurate.
+    """
+
+    def __init__(self):
+        # Ogni nodo è [figlio_0, figlio_1, vlan]
+        self.root = [None, None, None]
+        self.size = 0
+
+    def insert(self, network, vlan_num):
+        """Inserisce una subnet IPv4Network; a parità di prefisso vince la prima inserita"""
+        net_int = int(network.network_address)
+        node = self.root
+        for i in range(network.prefixlen):
+            bit = (net_int >> (31 - i)) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            node[2] = vlan_num
+            self.size += 1
+        elif node[2] != vlan_num:
+            logger.warning(f"Subnet {network} già associata alla VLAN {node[2]}, ignoro VLAN {vlan_num}")
+
+    def lookup(self, ip_int):
+        """Restituisce la VLAN della subnet più specifica che contiene ip_int, o None"""
+        node = self.root
+        found = node[2]
+        for shift in range(31, -1, -1):
+            node = node[(ip_int >> shift) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                found = node[2]
+        return found
+
+
+def ip_to_int(ip_addr):
+    """Converte un IPv4 in notazione puntata in intero; None se non è un IPv4 valido"""
+    parts = ip_addr.split('.')
+    if len(parts) != 4:
+        return None
+    value = 0
+    for part in parts:
+        if not part.isdigit():
+            return None
+        octet = int(part)
+        if octet > 255:
+            return None
+        value = (value << 8) | octet
+    return value
+
+
+def compute_subnet_hash(vlan_subnet_map):
+    """Hash stabile dell'insieme subnet/VLAN: se cambia serve una riassegnazione completa"""
+    entries = sorted(f"{subnet}={vlan_num}" for subnet, vlan_num in vlan_subnet_map)
+    return hashlib.sha256('\n'.join(entries).encode('utf-8')).hexdigest()
+
+
+def load_state(state_file=STATE_FILE):
+    """Carica lo stato dell'ultima esecuzione completata"""
+    try:
+        if os.path.exists(state_file):
+            with open(state_file, 'r') as f:
+                return json.load(f)
+    except Exception as e:
+        logger.warning(f"Impossibile leggere lo stato {state_file}: {e}")
+    return None
+
+
+def save_state(state, state_file=STATE_FILE):
+    """Salva lo stato dell'esecuzione corrente"""
+    try:
+        Path(state_file).parent.mkdir(parents=True, exist_ok=True)
+        tmp_file = f"{state_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump(state, f, indent=2)
+        os.replace(tmp_file, state_file)
+    except Exception as e:
+        logger.error(f"Impossibile salvare lo stato {state_file}: {e}")
+
 def fix_subnet_format(subnet):
     """Fix common subnet format issues"""
     if not subnet or not subnet.strip():
@@ -69,7 +162,7 @@ def fix_subnet_format(subnet):
     except:
         return None
 
-def update_ip_vlans():
+def update_ip_vlans(unassigned_only=False, incremental=False, skip_counts=False):
     django_client = DjangoAPIClient()
     
     # Log configurazione per debug
@@ -81,7 +174,7 @@ def update_ip_vlans():
     logger.info("Verifica connessione API...")
     if not django_client.health_check():
         logger.error("API non raggiungibile, interrompo l'esecuzione")
-        return
+        return False
     
     # 1. Recupera tutte le VLAN e le subnet
     logger.info("Recupero VLAN...")
@@ -91,6 +184,12 @@ def update_ip_vlans():
     vlan_subnet_map = []
     for vlan in vlans:
         logger.debug(f"Processando VLAN {vlan.get('numero', 'N/A')}: {vlan}")
+        # Le subnet normalizzate dal server ('reti') non richiedono correzioni lato client
+        if vlan.get('reti'):
+            for cidr in vlan['reti']:
+                vlan_subnet_map.append((ipaddress.IPv4Network(cidr), vlan['numero']))
+            continue
+        
         subnets = vlan.get('subnets', [])
         if isinstance(subnets, str):
             # Gestisce caso stringa separata da virgole o newline
@@ -113,35 +212,55 @@ def update_ip_vlans():
 
     logger.info(f"Mappatura subnet-VLAN creata con {len(vlan_subnet_map)} entry")
 
-    # 2. Recupera tutti gli IP
-    logger.info("Recupero IP...")
-    all_ips = django_client.get_all_ips()
+    # Indice longest-prefix-match costruito una sola volta per esecuzione
+    subnet_trie = SubnetTrie()
+    for subnet, vlan_num in vlan_subnet_map:
+        subnet_trie.insert(subnet, vlan_num)
+    subnet_hash = compute_subnet_hash(vlan_subnet_map)
+
+    # 2. Recupera gli IP da elaborare
+    run_started = datetime.now(timezone.utc)
+    params = {}
+    if unassigned_only:
+        # Solo gli IP senza VLAN: il filtro è applicato lato server
+        params['vlan__isnull'] = 'true'
+    if incremental:
+        state = load_state()
+        if not state or not state.get('watermark'):
+            logger.info("Nessuna esecuzione precedente registrata: elaborazione completa")
+        elif state.get('subnet_hash') != subnet_hash:
+            logger.info("Subnet/VLAN modificate dall'ultima esecuzione: elaborazione completa")
+        else:
+            # data_modifica viene valorizzata anche alla creazione: copre IP nuovi e modificati
+            params['data_modifica__gte'] = state['watermark']
+            logger.info(f"Modalità incrementale: IP creati/modificati dal {state['watermark']}")
+
+    logger.info(f"Recupero IP (filtri: {params or 'nessuno'})...")
+    all_ips = django_client.get_all_ips(params=params or None)
+    if all_ips is None:
+        # Esecuzione fallita: il watermark non avanza, altrimenti gli IP delle pagine
+        # non scaricate verrebbero saltati da tutte le esecuzioni incrementali successive
+        logger.error("Recupero degli IP fallito, interrompo l'esecuzione (watermark non aggiornato)")
+        return False
     logger.info(f"Trovati {len(all_ips)} IP")
     
     updated = 0
     checked = 0
+    failed = 0
     no_vlan_fixed = 0  # IP che non avevano VLAN e sono stati assegnati
     wrong_vlan_fixed = 0  # IP che avevano VLAN errata e sono stati corretti
     already_correct = 0  # IP che avevano già la VLAN corretta
     no_subnet_match = 0  # IP che non appartengono a nessuna subnet conosciuta
-    vlan_updates = {}  # Traccia le VLAN che hanno avuto cambiamenti
+    pending_updates = []  # Aggiornamenti VLAN da inviare in blocco
     
     for ip_data in all_ips:
         ip_addr = ip_data['ip']
         current_vlan = ip_data.get('vlan')
-        found_vlan = None
         
         logger.debug(f"Processing IP {ip_addr}, current VLAN: {current_vlan}")
         
-        for subnet, vlan_num in vlan_subnet_map:
-            try:
-                if ipaddress.IPv4Address(ip_addr) in subnet:
-                    found_vlan = vlan_num
-                    logger.debug(f"IP {ip_addr} appartiene alla subnet {subnet} (VLAN {vlan_num})")
-                    break
-            except Exception as e:
-                logger.warning(f"Errore parsing IP {ip_addr}: {e}")
-                continue
+        ip_int = ip_to_int(ip_addr)
+        found_vlan = subnet_trie.lookup(ip_int) if ip_int is not None else None
         
         checked += 1
         
@@ -171,16 +290,22 @@ def update_ip_vlans():
                     wrong_vlan_fixed += 1
                     logger.info(f"Correcting VLAN for IP {ip_addr}: {current_vlan_num} -> {found_vlan}")
                 
-                # Update via API
-                update_data = {'vlan': found_vlan}
-                success = django_client.update_ip(ip_addr, update_data)
-                if not success:
-                    logger.error(f"Failed to update VLAN for IP {ip_addr}")
+                # Sent below in bulk (il serializer di update accetta la VLAN come 'vlan_id')
+                pending_updates.append({'ip': ip_addr, 'vlan_id': found_vlan})
         else:
             # IP that doesn't belong to any known subnet
             no_subnet_match += 1
             logger.debug(f"IP {ip_addr} doesn't belong to any known subnet")
     
+    # Una PATCH /ips/bulk/ ogni 1000 IP invece di una PATCH per IP
+    if pending_updates:
+        outcome = django_client.bulk_update_ips(pending_updates)
+        if outcome is None:
+            failed += len(pending_updates)
+            logger.error(f"Bulk VLAN update failed for {len(pending_updates)} IPs")
+        else:
+            failed += sum(1 for item in pending_updates if not outcome.get(item['ip']))
+    
     # Print final report
     logger.info("VLAN ASSIGNMENT REPORT")
     logger.info("=" * 50)
@@ -190,58 +315,47 @@ def update_ip_vlans():
     logger.info(f"IPs with wrong VLAN (now corrected): {wrong_vlan_fixed}")
     logger.info(f"IPs without matching subnet: {no_subnet_match}")
     logger.info(f"TOTAL IPs updated: {updated}")
+    logger.info(f"Failed updates: {failed}")
     logger.info("=" * 50)
     
+    # Il watermark avanza solo se l'esecuzione ha coperto tutti gli IP rilevanti senza errori,
+    # altrimenti la prossima esecuzione incrementale riprova dagli stessi IP
+    if unassigned_only:
+        logger.debug("Modalità --unassigned-only: stato incrementale non aggiornato")
+    elif failed:
+        logger.warning(f"{failed} aggiornamenti falliti: watermark non aggiornato")
+    else:
+        save_state({
+            'watermark': (run_started - WATERMARK_OVERLAP).isoformat(),
+            'subnet_hash': subnet_hash,
+            'last_run': run_started.isoformat(),
+            'ips_checked': checked,
+            'ips_updated': updated,
+        })
+    
     # 4. Update num_indirizzi count for all VLANs
-    logger.info("Updating IP count in VLANs...")
-    update_vlan_counts(django_client)
+    if skip_counts:
+        logger.info("IP count update skipped (--skip-counts)")
+    elif incremental and not updated:
+        logger.info("No VLAN changes, skipping IP count update")
+    else:
+        logger.info("Updating IP count in VLANs...")
+        update_vlan_counts(django_client)
+    
+    return True
 
 def update_vlan_counts(django_client):
-    """Update the num_indirizzi count for all VLANs"""
-    try:
-        logger.info("Retrieving all VLANs...")
-        vlans = django_client.get_all_vlans()
-        logger.info(f"Found {len(vlans)} VLANs")
-        
-        logger.info("Retrieving all IPs...")
-        ips = django_client.get_all_ips()
-        logger.info(f"Found {len(ips)} IPs")
-        
-        # Count IPs by VLAN
-        vlan_counts = {}
-        for ip in ips:
-            vlan_info = ip.get('vlan')
-            if vlan_info:
-                vlan_numero = vlan_info.get('numero')
-                if vlan_numero:
-                    vlan_counts[vlan_numero] = vlan_counts.get(vlan_numero, 0) + 1
-        
-        logger.info(f"IP count by VLAN: {vlan_counts}")
-        
-        updated_count = 0
-        for vlan in vlans:
-            vlan_numero = vlan.get('numero')
-            current_count = vlan.get('num_indirizzi', 0)
-            count = vlan_counts.get(vlan_numero, 0)
-            
-            if count != current_count:
-                logger.info(f"Update needed for VLAN {vlan_numero}: {current_count} -> {count}")
-                update_data = {'num_indirizzi': count}
-                result = django_client.update_vlan(vlan_numero, update_data)
-                if result:
-                    logger.info(f"VLAN {vlan_numero} ({vlan.get('nome', '')}): updated from {current_count} to {count} IP addresses")
-                    updated_count += 1
-                else:
-                    logger.error(f"Error updating count for VLAN {vlan_numero}")
-            else:
-                logger.debug(f"VLAN {vlan_numero} ({vlan.get('nome', '')}): count already correct ({count} IP addresses)")
-        
-        logger.info(f"Update completed: {updated_count} VLANs updated")
-            
-    except Exception as e:
-        logger.error(f"Error during VLAN count update: {e}")
-        import traceback
-        logger.error(f"Traceback: {traceback.format_exc()}")
+    """Update the num_indirizzi count for all VLANs with a single server-side recount"""
+    result = django_client.recount_vlans()
+    if result is None:
+        logger.error("Error during VLAN count update")
+        return False
+    
+    for change in result.get('variazioni', []):
+        logger.info(f"VLAN {change['numero']} ({change.get('nome', '')}): updated from {change['precedente']} to {change['attuale']} IP addresses")
+    logger.info(f"Update completed: {result.get('vlan_aggiornate', 0)} VLANs updated, "
+                f"{result.get('ip_associati', 0)} unassigned IPs associated")
+    return True
 
 def test_api_connection():
     """Test di connessione API per debug"""
@@ -270,6 +384,9 @@ def test_api_connection():
     # Test recupero IP
     try:
         ips = django_client.get_all_ips()
+        if ips is None:
+            logger.error("Errore recupero IP")
+            return False
         logger.info(f"Test IP: Recuperati {len(ips)} IP")
         if ips:
             logger.info(f"Primo IP: {ips[0]}")
@@ -308,7 +425,7 @@ def test_ip_update():
     logger.info(f"Current VLAN: {current_vlan_num}")
     
     # Try updating with a simple format
-    update_data = {'vlan': 777}  # Use a test VLAN
+    update_data = {'vlan_id': 777}  # Use a test VLAN
     
     logger.info(f"2. Attempting update with data: {update_data}")
     result = django_client.update_ip(test_ip, update_data)
@@ -333,7 +450,7 @@ def test_ip_update():
                 
                 # 4. Restore original VLAN
                 if current_vlan_num:
-                    restore_data = {'vlan': current_vlan_num}
+                    restore_data = {'vlan_id': current_vlan_num}
                     logger.info(f"4. Restoring original VLAN: {restore_data}")
                     restore_result = django_client.update_ip(test_ip, restore_data)
                     if restore_result:
@@ -362,6 +479,10 @@ if __name__ == "__main__":
     parser.add_argument('--test', action='store_true', help='Run only API connection test')
     parser.add_argument('--test-update', action='store_true', help='Specific test to verify if IP update works')
     parser.add_argument('--debug', action='store_true', help='Enable DEBUG logging')
+    parser.add_argument('--unassigned-only', action='store_true', help='Only process IPs without a VLAN (skips wrong-VLAN corrections)')
+    parser.add_argument('--incremental', action='store_true', help='Only process IPs created/modified since the last run (full run if subnets changed)')
+    parser.add_argument('--skip-counts', action='store_true', help='Do not update num_indirizzi at the end (run it as a separate recount step)')
+    parser.add_argument('--counts-only', action='store_true', help='Only update num_indirizzi for all VLANs')
     
     args = parser.parse_args()
     
@@ -373,13 +494,23 @@ if __name__ == "__main__":
     
     logger.info(f"--- Starting VLAN IP assignment ({datetime.now().isoformat()}) ---")
     
+    success = True
     if args.test:
         logger.info("API TEST mode activated")
-        test_api_connection()
+        success = test_api_connection()
     elif args.test_update:
         logger.info("TEST UPDATE mode activated")
-        test_ip_update()
+        success = test_ip_update()
+    elif args.counts_only:
+        logger.info("Updating IP count in VLANs...")
+        success = update_vlan_counts(DjangoAPIClient())
     else:
-        update_ip_vlans()
+        success = update_ip_vlans(unassigned_only=args.unassigned_only, incremental=args.incremental,
+                                  skip_counts=args.skip_counts)
+    
+    logger.info(f"--- End VLAN IP assignment ({datetime.now().isoformat()}) ---")
     
-    logger.info(f"--- End VLAN IP assignment ({datetime.now().isoformat()}) ---") 
+    # Exit code non zero per permettere al job runner di fermare i job dipendenti
+    if not success:
+        sys.exit(1)
+
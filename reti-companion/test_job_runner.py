@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Unit test del job runner (parsing della riga di comando e lock dei job)
+
+    python -m unittest test_job_runner
+"""
+
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), 'scripts'))
+
+import job_runner
+
+
+class ParseArgsTest(unittest.TestCase):
+
+    def test_jitter_after_job_name(self):
+        # Forma usata da entrypoint.sh e dal Dockerfile all'avvio del container
+        args = job_runner.parse_args(['run', 'collect', '--jitter', '0'])
+        self.assertEqual(args.command, 'run')
+        self.assertEqual(args.job, 'collect')
+        self.assertEqual(args.jitter, 0)
+        self.assertEqual(args.job_args, [])
+
+    def test_jitter_before_command(self):
+        args = job_runner.parse_args(['--jitter', '5', 'run', 'cleanup'])
+        self.assertEqual((args.job, args.jitter, args.job_args), ('cleanup', 5, []))
+
+    def test_job_args_after_separator(self):
+        args = job_runner.parse_args(['run', 'release_old_ips', '--jitter', '0', '--', '--dry-run'])
+        self.assertEqual(args.jitter, 0)
+        self.assertEqual(args.job_args, ['--dry-run'])
+
+    def test_unknown_options_go_to_the_job(self):
+        args = job_runner.parse_args(['run', 'release_old_ips', '--days', '7'])
+        self.assertEqual(args.jitter, job_runner.DEFAULT_JITTER)
+        self.assertEqual(args.job_args, ['--days', '7'])
+
+    def test_run_requires_job(self):
+        with self.assertRaises(SystemExit):
+            job_runner.parse_args(['run'])
+
+    def test_job_args_only_for_run(self):
+        with self.assertRaises(SystemExit):
+            job_runner.parse_args(['pipeline', '--days', '7'])
+
+
+class JobLockTest(unittest.TestCase):
+
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_dir)
+
+    def test_second_lock_is_refused(self):
+        primo = job_runner.JobLock('collect', 60, lock_dir=self.lock_dir)
+        secondo = job_runner.JobLock('collect', 60, lock_dir=self.lock_dir)
+        self.assertTrue(primo.acquire())
+        self.assertEqual(secondo.read_owner()['pid'], os.getpid())
+        self.assertFalse(secondo.acquire())
+        primo.release()
+        self.assertTrue(secondo.acquire())
+        secondo.release()
+
+    def test_empty_lock_file_is_not_taken_over(self):
+        # Finestra tra la creazione del file e la scrittura del proprietario
+        primo = job_runner.JobLock('cleanup', 60, lock_dir=self.lock_dir)
+        self.assertTrue(primo.acquire())
+        os.truncate(primo.path, 0)
+        self.assertFalse(job_runner.JobLock('cleanup', 60, lock_dir=self.lock_dir).acquire())
+        primo.release()
+
+    def test_release_without_acquire_keeps_other_lock(self):
+        primo = job_runner.JobLock('recount', 60, lock_dir=self.lock_dir)
+        secondo = job_runner.JobLock('recount', 60, lock_dir=self.lock_dir)
+        self.assertTrue(primo.acquire())
+        self.assertFalse(secondo.acquire())
+        secondo.release()
+        self.assertTrue(os.path.exists(primo.path))
+        self.assertFalse(job_runner.JobLock('recount', 60, lock_dir=self.lock_dir).acquire())
+        primo.release()
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -9,7 +9,9 @@ from django.http import HttpResponseRedirect, HttpResponse
 from django.urls import reverse
 from django.template.response import TemplateResponse
 from django.utils.translation import gettext_lazy as _
-from .models import IndirizzoIP, Vlan, StoricoResponsabile, UserProfile
+from .models import IndirizzoIP, Vlan, Subnet, StoricoResponsabile, StoricoResponsabileArchivio, AvvistamentoIP, UserProfile
+from .indice_vlan import get_indice_vlan
+from .ricerca import cerca_indirizzi
 import csv
 import io
 from django.utils import timezone
@@ -103,6 +105,17 @@ def check_ldap_user_and_create(email):
     
     return None
 
+class SubnetInline(admin.TabularInline):
+    """Subnet normalizzate della VLAN, derivate dal campo Subnets"""
+    model = Subnet
+    extra = 0
+    can_delete = False
+    fields = ('cidr', 'prefisso', 'gateway')
+    readonly_fields = ('cidr', 'prefisso', 'gateway')
+    
+    def has_add_permission(self, request, obj=None):
+        return False
+
 class StoricoResponsabileInline(admin.TabularInline):
     model = StoricoResponsabile
     extra = 0
@@ -125,10 +138,11 @@ class StoricoResponsabileInline(admin.TabularInline):
 
 @admin.register(IndirizzoIP)
 class IndirizzoIPAdmin(admin.ModelAdmin):
-    list_display = ('ip', 'mac_address', 'stato', 'disponibilita', 'responsabile', 'utente_finale', 'ultimo_controllo')
-    list_filter = ('stato', 'disponibilita', 'vlan')
+    list_display = ('ip', 'mac_address', 'stato', 'disponibilita', 'responsabile', 'utente_finale', 'ultimo_controllo_display')
+    list_filter = ('stato', 'disponibilita', 'anomalo', 'vlan')
+    list_select_related = ('controllo',)
     search_fields = ('ip', 'mac_address', 'responsabile', 'utente_finale', 'note')
-    readonly_fields = ('data_creazione', 'data_modifica')
+    readonly_fields = ('data_creazione', 'data_modifica', 'ultimo_controllo', 'ultimo_mac', 'ultima_sorgente')
     change_list_template = 'admin/change_list_import_csv.html'
     actions = ['elimina_indirizzi_ip', 'export_selected_ips']
     inlines = [StoricoResponsabileInline]
@@ -141,13 +155,28 @@ class IndirizzoIPAdmin(admin.ModelAdmin):
             'fields': ('responsabile', 'utente_finale', 'assegnato_a_utente')
         }),
         (_('Date'), {
-            'fields': ('ultimo_controllo', 'data_scadenza', 'data_creazione', 'data_modifica')
+            'fields': ('data_scadenza', 'data_creazione', 'data_modifica')
+        }),
+        (_('Controlli di rete'), {
+            'fields': ('ultimo_controllo', 'ultimo_mac', 'ultima_sorgente')
         }),
         (_('Note'), {
             'fields': ('note',)
         }),
     )
     
+    def ultimo_controllo_display(self, obj):
+        return obj.ultimo_controllo
+    ultimo_controllo_display.short_description = _("Ultimo Controllo")
+    ultimo_controllo_display.admin_order_field = 'controllo__ultimo_controllo'
+
+    def get_search_results(self, request, queryset, search_term):
+        """Usa la stessa ricerca dell'elenco web e dell'API (vedi ricerca.py)"""
+        if not search_term.strip():
+            return queryset, False
+        # L'ordinamento resta quello scelto nell'elenco dell'admin
+        return cerca_indirizzi(search_term, queryset, ordina_per_rilevanza=False), False
+
     def elimina_indirizzi_ip(self, request, queryset):
         """Azione per eliminare tutti gli indirizzi IP selezionati"""
         num_deleted, _ = queryset.delete()
@@ -171,7 +200,7 @@ class IndirizzoIPAdmin(admin.ModelAdmin):
         ])
         
         # Dati
-        for ip in queryset.select_related('vlan'):
+        for ip in queryset.select_related('vlan', 'controllo'):
             writer.writerow([
                 ip.ip,
                 ip.mac_address or '',
@@ -202,7 +231,7 @@ class IndirizzoIPAdmin(admin.ModelAdmin):
         ])
         
         # Ottieni tutti gli IP con ottimizzazione delle query
-        all_ips = IndirizzoIP.objects.select_related('vlan').order_by('ip')
+        all_ips = IndirizzoIP.objects.select_related('vlan', 'controllo').ordinati_per_ip()
         
         # Dati
         for ip in all_ips:
@@ -458,54 +487,15 @@ class IndirizzoIPAdmin(admin.ModelAdmin):
                             level=messages.INFO
                         )
                         
-                        # Ottimizzazione: Ottieni un dizionario di prefissi IP per filtrare rapidamente
-                        # la maggior parte degli IP che non possono appartenere a una VLAN
-                        ip_prefix_map = {}
-                        for ip in batch_ip_addresses:
-                            # Estrai il prefisso dell'IP (es. da 192.168.1.1 ottieni 192.168)
-                            parts = ip.split('.')
-                            if len(parts) >= 2:
-                                prefix = '.'.join(parts[:2])  # Primi due ottetti (es. 192.168)
-                                if prefix not in ip_prefix_map:
-                                    ip_prefix_map[prefix] = []
-                                ip_prefix_map[prefix].append(ip)
-                        
-                        # Ottieni tutte le VLAN con subnet
-                        vlans = Vlan.objects.exclude(subnets__isnull=True).exclude(subnets='')
-                        vlan_map = {}  # Dizionario per memorizzare la mappatura IP -> VLAN
-                        
-                        # Per ogni VLAN, controlla solo gli IP con prefissi compatibili
-                        for vlan in vlans:
-                            subnet_prefixes = set()
-                            for subnet in vlan.get_subnets_list():
-                                try:
-                                    # Estrai il prefisso dalla subnet (es. da 192.168.1.0/24 ottieni 192.168)
-                                    subnet_parts = subnet.split('/')
-                                    if len(subnet_parts) > 0:
-                                        ip_part = subnet_parts[0]
-                                        parts = ip_part.split('.')
-                                        if len(parts) >= 2:
-                                            subnet_prefixes.add('.'.join(parts[:2]))
-                                except (ValueError, IndexError):
-                                    continue
-                            
-                            # Controlla solo gli IP con prefissi compatibili con questa VLAN
-                            ip_to_check = []
-                            for prefix in subnet_prefixes:
-                                if prefix in ip_prefix_map:
-                                    ip_to_check.extend(ip_prefix_map[prefix])
-                            
-                            # Ora controlla solo questi IP contro questa VLAN
-                            for ip in ip_to_check:
-                                if ip not in vlan_map and vlan.contains_ip(ip):
-                                    vlan_map[ip] = vlan
+                        # Risoluzione in blocco con l'indice VLAN in memoria
+                        vlan_map = get_indice_vlan().resolve_many(batch_ip_addresses)  # IP -> numero VLAN
                         
                         # Aggiorna gli IP in blocco in base alla mappa costruita
                         vlan_associations = 0
                         for ip, vlan in vlan_map.items():
                             try:
                                 # Aggiorna l'indirizzo IP con la VLAN trovata
-                                IndirizzoIP.objects.filter(ip=ip).update(vlan=vlan)
+                                IndirizzoIP.objects.filter(ip=ip).update(vlan_id=vlan)
                                 vlan_associations += 1
                             except Exception as e:
                                 self.message_user(
@@ -543,8 +533,10 @@ class IndirizzoIPAdmin(admin.ModelAdmin):
 
 @admin.register(Vlan)
 class VlanAdmin(admin.ModelAdmin):
-    list_display = ('numero', 'nome', 'get_all_subnets', 'num_indirizzi')
+    list_display = ('numero', 'nome', 'get_all_subnets', 'num_indirizzi', 'num_attivi', 'num_anomali')
     search_fields = ('numero', 'nome', 'descrizione', 'subnets')
+    readonly_fields = ('num_indirizzi', 'num_attivi', 'num_usati', 'num_liberi', 'num_riservati', 'num_anomali')
+    inlines = [SubnetInline]
     change_list_template = 'admin/change_list_import_csv.html'
     actions = ['export_selected_vlans']
     
@@ -696,6 +688,11 @@ class VlanAdmin(admin.ModelAdmin):
                             if description_index is not None and len(line) > description_index:
                                 vlan_descrizione = line[description_index].strip()
                             
+                            # Rifiuta la riga se contiene subnet non interpretabili
+                            _reti, subnet_errate = Vlan(subnets=vlan_subnets).analizza_subnets()
+                            if subnet_errate:
+                                raise ValueError(f"subnet non valide: {', '.join(subnet_errate)}")
+                            
                             # Crea o aggiorna la VLAN
                             obj, created = Vlan.objects.update_or_create(
                                 numero=vlan_numero,
@@ -779,6 +776,36 @@ class StoricoResponsabileAdmin(admin.ModelAdmin):
         """Ottimizza le query includendo le relazioni"""
         return super().get_queryset(request).select_related('indirizzo_ip', 'vlan') 
 
+
+@admin.register(StoricoResponsabileArchivio)
+class StoricoResponsabileArchivioAdmin(admin.ModelAdmin):
+    list_display = ('indirizzo_ip', 'responsabile', 'data_inizio', 'data_fine', 'motivo_cambio', 'archiviato_il')
+    list_filter = ('motivo_cambio', 'data_fine', 'archiviato_il')
+    search_fields = ('=indirizzo_ip__ip', 'responsabile', 'utente_finale')
+    date_hierarchy = 'data_inizio'
+    readonly_fields = ('id', 'indirizzo_ip', 'responsabile', 'utente_finale', 'data_inizio', 'data_fine',
+                       'motivo_cambio', 'note', 'stato_rete', 'disponibilita', 'vlan',
+                       'created_at', 'created_by', 'archiviato_il')
+
+    def has_add_permission(self, request):
+        # I record arrivano solo dal comando archivia_storico
+        return False
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).select_related('indirizzo_ip', 'vlan')
+
+@admin.register(AvvistamentoIP)
+class AvvistamentoIPAdmin(admin.ModelAdmin):
+    list_display = ('ip', 'mac_address', 'sorgente', 'primo_avvistamento', 'ultimo_avvistamento', 'num_avvistamenti')
+    list_filter = ('sorgente',)
+    search_fields = ('=ip', '=mac_address')
+    date_hierarchy = 'ultimo_avvistamento'
+    readonly_fields = ('ip', 'mac_address', 'sorgente', 'primo_avvistamento', 'ultimo_avvistamento', 'num_avvistamenti')
+
+    def has_add_permission(self, request):
+        # Gli avvistamenti sono scritti solo dalla raccolta dati
+        return False
+
 # Inline per UserProfile
 class UserProfileInline(admin.StackedInline):
     model = UserProfile
@@ -0,0 +1,189 @@
+"""
+Valori calcolati tenuti nella cache di Django per pochi secondi
+
+ottieni_o_calcola() evita che richieste concorrenti ricalcolino lo stesso
+valore (single-flight): nel processo i thread si mettono in coda su uno dei
+lock di un insieme fisso, scelto in base alla chiave, tra processi diversi un segnaposto creato con cache.add() fa sì
+che un solo worker esegua il calcolo mentre gli altri attendono il risultato.
+
+risposta_in_cache() tiene le risposte degli endpoint più letti (getbyip,
+check-ip, VLAN) per CACHE_RISPOSTE_SECONDI. Le chiavi contengono la versione
+del gruppo (es. 'ip', 'vlan') e, se indicata, della singola risorsa: le
+modifiche salvate incrementano queste versioni dopo il commit (invalida()), e
+le voci precedenti non vengono più lette. Letture e scritture concorrenti non
+possono quindi lasciare in cache un valore vecchio sotto la versione nuova.
+Hit e miss sono contati per endpoint nella cache stessa (statistiche_risposte()).
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+_ASSENTE = object()
+
+# Attesa massima (secondi) del risultato calcolato da un altro processo;
+# superata questa soglia il valore viene calcolato comunque
+ATTESA_MAX_SECONDI = 10
+INTERVALLO_ATTESA_SECONDI = 0.05
+
+# Le chiavi delle risposte cambiano a ogni versione: un lock per chiave crescerebbe
+# senza limite, chiavi diverse possono invece condividere uno di questi lock
+NUMERO_LOCK = 64
+_lock = [threading.Lock() for _ in range(NUMERO_LOCK)]
+
+
+def _lock_di(chiave):
+    return _lock[hash(chiave) % NUMERO_LOCK]
+
+
+def _attendi_altro_processo(chiave):
+    scadenza = time.monotonic() + ATTESA_MAX_SECONDI
+    while time.monotonic() < scadenza:
+        time.sleep(INTERVALLO_ATTESA_SECONDI)
+        valore = cache.get(chiave, _ASSENTE)
+        if valore is not _ASSENTE:
+            return valore
+        if cache.get(f'{chiave}:calcolo') is None:
+            # Il calcolo dell'altro processo è fallito o il segnaposto è scaduto
+            break
+    return _ASSENTE
+
+
+def ottieni_o_calcola(chiave, calcola, timeout):
+    """
+    Restituisce il valore in cache o lo calcola una sola volta per tutti i richiedenti
+
+    Args:
+        chiave: Chiave della cache
+        calcola: Funzione senza argomenti che produce il valore
+        timeout: Durata in secondi del valore in cache
+
+    Returns:
+        Il valore in cache o appena calcolato
+    """
+    valore = cache.get(chiave, _ASSENTE)
+    if valore is not _ASSENTE:
+        return valore
+
+    with _lock_di(chiave):
+        # Un altro thread del processo potrebbe averlo appena calcolato
+        valore = cache.get(chiave, _ASSENTE)
+        if valore is not _ASSENTE:
+            return valore
+
+        segnaposto = f'{chiave}:calcolo'
+        proprietario = cache.add(segnaposto, 1, timeout=ATTESA_MAX_SECONDI)
+        if not proprietario:
+            valore = _attendi_altro_processo(chiave)
+            if valore is not _ASSENTE:
+                return valore
+        try:
+            valore = calcola()
+            cache.set(chiave, valore, timeout)
+        finally:
+            if proprietario:
+                cache.delete(segnaposto)
+        return valore
+
+
+def _incrementa(chiave, iniziale=1):
+    """Incrementa un contatore senza scadenza, creandolo con il valore iniziale se manca"""
+    try:
+        return cache.incr(chiave)
+    except ValueError:
+        if cache.add(chiave, iniziale, timeout=None):
+            return iniziale
+        return cache.incr(chiave)
+
+
+def _chiave_versione(gruppo, risorsa=None):
+    return f'versione:{gruppo}' if risorsa is None else f'versione:{gruppo}:{risorsa}'
+
+
+def _versioni(chiavi):
+    versioni = cache.get_many(chiavi)
+    for chiave in chiavi:
+        if chiave not in versioni:
+            # Mai creata o espulsa dalla cache: si riparte da un valore mai usato prima
+            iniziale = time.time_ns()
+            cache.add(chiave, iniziale, timeout=None)
+            versioni[chiave] = cache.get(chiave, iniziale)
+    return versioni
+
+
+def invalida(gruppo, risorsa=None, using=None):
+    """
+    Invalida le risposte in cache di un gruppo o di una sola risorsa
+
+    L'incremento della versione avviene dopo il commit della transazione in
+    corso (subito se non ce n'è una), così che nessuna lettura concorrente
+    rimetta in cache i dati non ancora confermati.
+
+    Args:
+        gruppo: Gruppo di risposte (es. 'ip', 'vlan')
+        risorsa: Singola risorsa del gruppo (es. un indirizzo IP); None per tutto il gruppo
+        using: Alias del database della transazione
+    """
+    chiave = _chiave_versione(gruppo, risorsa)
+    transaction.on_commit(lambda: _incrementa(chiave, time.time_ns()), using=using)
+
+
+def risposta_in_cache(nome, calcola, gruppo, risorsa=None, variante=''):
+    """
+    Restituisce una risposta dalla cache o la calcola, contando hit e miss
+
+    Args:
+        nome: Nome dell'endpoint per le statistiche (es. 'getbyip')
+        calcola: Funzione senza argomenti che produce la risposta
+        gruppo: Gruppo invalidato dalle modifiche (vedi invalida())
+        risorsa: Risorsa con versione propria (es. l'IP richiesto), opzionale
+        variante: Ulteriore parte della chiave (es. URL con i parametri)
+
+    Returns:
+        Il valore in cache o appena calcolato
+    """
+    timeout = settings.CACHE_RISPOSTE_SECONDI
+    if timeout <= 0:
+        return calcola()
+
+    chiavi = [_chiave_versione(gruppo)]
+    if risorsa is not None:
+        chiavi.append(_chiave_versione(gruppo, risorsa))
+    versioni = _versioni(chiavi)
+    impronta = hashlib.sha1(str(variante).encode()).hexdigest()
+    chiave = ':'.join(['risposta', gruppo, str(risorsa), *(str(versioni[c]) for c in chiavi), impronta])
+
+    valore = cache.get(chiave, _ASSENTE)
+    if valore is not _ASSENTE:
+        _incrementa(f'statistiche:{nome}:hit')
+        return valore
+    _incrementa(f'statistiche:{nome}:miss')
+    return ottieni_o_calcola(chiave, calcola, timeout)
+
+
+def statistiche_risposte(nomi):
+    """
+    Hit, miss e hit rate delle risposte in cache, condivisi da tutti i processi
+
+    Returns:
+        dict: {nome: {'hit': int, 'miss': int, 'hit_rate': float o None}}
+    """
+    valori = cache.get_many([f'statistiche:{nome}:{tipo}' for nome in nomi for tipo in ('hit', 'miss')])
+    risultato = {}
+    for nome in nomi:
+        hit = valori.get(f'statistiche:{nome}:hit', 0)
+        miss = valori.get(f'statistiche:{nome}:miss', 0)
+        risultato[nome] = {
+            'hit': hit,
+            'miss': miss,
+            'hit_rate': round(hit / (hit + miss), 4) if hit + miss else None,
+        }
+    return risultato
+
+
+def azzera_statistiche_risposte(nomi):
+    """Riporta a zero i contatori di hit e miss"""
+    cache.delete_many([f'statistiche:{nome}:{tipo}' for nome in nomi for tipo in ('hit', 'miss')])
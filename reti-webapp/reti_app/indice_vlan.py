@@ -0,0 +1,131 @@
+"""
+Indice in memoria per risolvere la VLAN di un indirizzo IP
+
+Le subnet della tabella Subnet vengono appiattite in intervalli interi
+disgiunti e ordinati (a ogni intervallo è associata la subnet più specifica
+che lo copre), così che una risoluzione costi una ricerca binaria con bisect.
+
+L'indice è condiviso da tutto il processo e viene ricostruito solo quando
+cambia il contatore di versione 'vlan' in database, incrementato a ogni
+salvataggio o eliminazione di una VLAN: in questo modo tutti i worker
+gunicorn restano coerenti senza comunicare tra loro.
+"""
+import threading
+from bisect import bisect_right
+
+from .models import Subnet, VersioneDati, ip_a_intero
+
+VERSIONE_VLAN = 'vlan'
+
+
+class IndiceVlan:
+    """Intervalli interi disgiunti e ordinati -> numero VLAN"""
+
+    def __init__(self, subnet):
+        """
+        Args:
+            subnet: Iterabile di tuple (rete_inizio, rete_fine, prefisso, numero_vlan)
+        """
+        self.inizi = []
+        self.fini = []
+        self.vlan = []
+        self._appiattisci(subnet)
+
+    def _aggiungi(self, inizio, fine, numero):
+        if inizio > fine:
+            return
+        # Unisce intervalli contigui della stessa VLAN per ridurre la dimensione
+        if self.vlan and self.vlan[-1] == numero and self.fini[-1] + 1 == inizio:
+            self.fini[-1] = fine
+            return
+        self.inizi.append(inizio)
+        self.fini.append(fine)
+        self.vlan.append(numero)
+
+    def _appiattisci(self, subnet):
+        # Le subnet CIDR sono annidate o disgiunte: con l'ordinamento per inizio e
+        # prefisso crescente una pila contiene sempre la catena di subnet aperte,
+        # con in cima la più specifica. A parità di subnet vince la VLAN più bassa.
+        ordinate = sorted(subnet, key=lambda riga: (riga[0], riga[2], -riga[3]))
+        pila = []
+        cursore = None
+        for inizio, fine, _prefisso, numero in ordinate:
+            while pila and pila[-1][1] < inizio:
+                self._aggiungi(cursore, pila[-1][1], pila[-1][2])
+                cursore = pila[-1][1] + 1
+                pila.pop()
+            if pila:
+                self._aggiungi(cursore, inizio - 1, pila[-1][2])
+            pila.append((inizio, fine, numero))
+            cursore = inizio
+        while pila:
+            self._aggiungi(cursore, pila[-1][1], pila[-1][2])
+            cursore = pila[-1][1] + 1
+            pila.pop()
+
+    def __len__(self):
+        return len(self.inizi)
+
+    def resolve(self, ip_address):
+        """Restituisce il numero della VLAN che contiene l'IP, o None"""
+        valore = ip_address if isinstance(ip_address, int) else ip_a_intero(ip_address)
+        if valore is None:
+            return None
+        i = bisect_right(self.inizi, valore) - 1
+        if i >= 0 and valore <= self.fini[i]:
+            return self.vlan[i]
+        return None
+
+    def resolve_many(self, ip_addresses):
+        """
+        Risolve molti IP in una sola passata sugli intervalli
+
+        Args:
+            ip_addresses: Iterabile di indirizzi IP (stringhe)
+
+        Returns:
+            dict: {ip: numero_vlan} per i soli IP che appartengono a una VLAN
+        """
+        valori = []
+        for ip in ip_addresses:
+            valore = ip_a_intero(ip)
+            if valore is not None:
+                valori.append((valore, ip))
+        valori.sort()
+
+        risultato = {}
+        i = 0
+        n = len(self.inizi)
+        for valore, ip in valori:
+            # Gli IP sono ordinati: l'indice dell'intervallo avanza soltanto
+            while i < n and self.fini[i] < valore:
+                i += 1
+            if i == n:
+                break
+            if self.inizi[i] <= valore:
+                risultato[ip] = self.vlan[i]
+        return risultato
+
+
+_lock = threading.Lock()
+_indice = None
+_versione = None
+
+
+def get_indice_vlan():
+    """Restituisce l'indice del processo, ricostruendolo se la versione in database è cambiata"""
+    global _indice, _versione
+    versione = VersioneDati.corrente(VERSIONE_VLAN)
+    if _indice is not None and versione == _versione:
+        return _indice
+    with _lock:
+        if _indice is None or versione != _versione:
+            righe = Subnet.objects.values_list('rete_inizio', 'rete_fine', 'prefisso', 'vlan_id')
+            _indice = IndiceVlan(righe)
+            _versione = versione
+    return _indice
+
+
+def invalida_indice_vlan():
+    """Segnala a tutti i processi che le VLAN sono cambiate"""
+    VersioneDati.incrementa(VERSIONE_VLAN)
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand
+from reti_app.models import StoricoResponsabile
+
+class Command(BaseCommand):
+    help = "Sposta nell'archivio i record dello storico responsabili chiusi da più di X giorni"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=180,
+            help='Età minima della data di fine in giorni (default: 180)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Numero massimo di record spostati per transazione (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostra cosa verrebbe fatto senza applicare modifiche',
+        )
+
+    def handle(self, *args, **options):
+        days = options['days']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODALITÀ DRY-RUN: nessuna modifica verrà applicata'))
+
+        risultato = StoricoResponsabile.archivia_chiusi(
+            days,
+            dry_run=dry_run,
+            chunk_size=options['chunk_size']
+        )
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f"[DRY-RUN] Verrebbero archiviati {risultato['archiviati']} record chiusi da più di {days} giorni"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Archiviati {risultato['archiviati']} record chiusi da più di {days} giorni"
+            ))
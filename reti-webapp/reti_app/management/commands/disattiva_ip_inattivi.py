@@ -0,0 +1,49 @@
+from django.core.management.base import BaseCommand
+from reti_app.models import IndirizzoIP
+
+class Command(BaseCommand):
+    help = 'Disattiva gli indirizzi IP attivi non visti da più di X ore'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--hours',
+            type=int,
+            default=2,
+            help='Soglia di inattività in ore (default: 2)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Numero massimo di righe aggiornate per singolo UPDATE (default: 1000)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Mostra cosa verrebbe fatto senza applicare modifiche',
+        )
+
+    def handle(self, *args, **options):
+        hours = options['hours']
+        dry_run = options['dry_run']
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING('MODALITÀ DRY-RUN: nessuna modifica verrà applicata'))
+
+        risultato = IndirizzoIP.disattiva_ip_inattivi(
+            hours,
+            dry_run=dry_run,
+            chunk_size=options['chunk_size']
+        )
+
+        for riga in risultato['campione']:
+            self.stdout.write(f"- {riga['ip']} (ultimo controllo: {riga['ultimo_controllo'] or 'mai'}, responsabile: {riga['responsabile'] or 'N/A'})")
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f"[DRY-RUN] Verrebbero disattivati {risultato['disattivati']} IP inattivi da più di {hours} ore"
+            ))
+        else:
+            self.stdout.write(self.style.SUCCESS(
+                f"Disattivati {risultato['disattivati']} IP inattivi da più di {hours} ore"
+            ))
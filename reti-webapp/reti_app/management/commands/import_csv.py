@@ -5,6 +5,7 @@ import re
 from django.core.management.base import BaseCommand
 from django.utils import timezone
 from reti_app.models import IndirizzoIP, Vlan
+from reti_app.indice_vlan import get_indice_vlan
 from django.contrib.auth.models import User
 
 
@@ -187,56 +188,18 @@ class Command(BaseCommand):
                     if batch_ip_addresses:
                         self.stdout.write(f"Associando VLAN per {len(batch_ip_addresses)} indirizzi IP nel batch corrente...")
                         
-                        # Ottimizzazione: Ottieni un dizionario di prefissi IP per filtrare rapidamente
-                        # la maggior parte degli IP che non possono appartenere a una VLAN
-                        ip_prefix_map = {}
-                        for ip in batch_ip_addresses:
-                            # Estrai il prefisso dell'IP (es. da 192.168.1.1 ottieni 192.168)
-                            parts = ip.split('.')
-                            if len(parts) >= 2:
-                                prefix = '.'.join(parts[:2])  # Primi due ottetti (es. 192.168)
-                                if prefix not in ip_prefix_map:
-                                    ip_prefix_map[prefix] = []
-                                ip_prefix_map[prefix].append(ip)
-                        
-                        # Ottieni tutte le VLAN con subnet
-                        vlans = Vlan.objects.exclude(subnets__isnull=True).exclude(subnets='')
-                        vlan_map = {}  # Dizionario per memorizzare la mappatura IP -> VLAN
-                        
-                        # Per ogni VLAN, controlla solo gli IP con prefissi compatibili
-                        for vlan in vlans:
-                            subnet_prefixes = set()
-                            for subnet in vlan.get_subnets_list():
-                                try:
-                                    # Estrai il prefisso dalla subnet (es. da 192.168.1.0/24 ottieni 192.168)
-                                    subnet_parts = subnet.split('/')
-                                    if len(subnet_parts) > 0:
-                                        ip_part = subnet_parts[0]
-                                        parts = ip_part.split('.')
-                                        if len(parts) >= 2:
-                                            subnet_prefixes.add('.'.join(parts[:2]))
-                                except (ValueError, IndexError):
-                                    continue
-                            
-                            # Controlla solo gli IP con prefissi compatibili con questa VLAN
-                            ip_to_check = []
-                            for prefix in subnet_prefixes:
-                                if prefix in ip_prefix_map:
-                                    ip_to_check.extend(ip_prefix_map[prefix])
-                            
-                            # Ora controlla solo questi IP contro questa VLAN
-                            for ip in ip_to_check:
-                                if ip not in vlan_map and vlan.contains_ip(ip):
-                                    vlan_map[ip] = vlan
+                        # Risoluzione in blocco con l'indice VLAN in memoria
+                        vlan_map = get_indice_vlan().resolve_many(batch_ip_addresses)  # IP -> numero VLAN
+                        vlan_nomi = dict(Vlan.objects.filter(numero__in=set(vlan_map.values())).values_list('numero', 'nome'))
                         
                         # Aggiorna gli IP in blocco in base alla mappa costruita
                         vlan_associations = 0
                         for ip, vlan in vlan_map.items():
                             try:
                                 # Aggiorna l'indirizzo IP con la VLAN trovata
-                                IndirizzoIP.objects.filter(ip=ip).update(vlan=vlan)
+                                IndirizzoIP.objects.filter(ip=ip).update(vlan_id=vlan)
                                 vlan_associations += 1
-                                self.stdout.write(f"IP {ip} associato a VLAN {vlan.numero} ({vlan.nome})")
+                                self.stdout.write(f"IP {ip} associato a VLAN {vlan} ({vlan_nomi.get(vlan, '')})")
                             except Exception as e:
                                 self.stderr.write(f"Errore nell'associazione VLAN per IP {ip}: {str(e)}")
                 
@@ -0,0 +1,28 @@
+from django.core.management.base import BaseCommand
+from reti_app.models import IndirizzoIP
+from reti_app.ricerca import aggiorna_token_ricerca, usa_fulltext
+
+class Command(BaseCommand):
+    help = "Ricostruisce la tabella dei token di ricerca (database senza indice FULLTEXT)"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Numero massimo di indirizzi IP elaborati per transazione (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        if usa_fulltext():
+            self.stdout.write(self.style.SUCCESS(
+                "Il database usa l'indice FULLTEXT: nessuna tabella dei token da ricostruire"
+            ))
+            return
+
+        chunk_size = options['chunk_size']
+        chiavi = list(IndirizzoIP.objects.values_list('ip', flat=True))
+        for inizio in range(0, len(chiavi), chunk_size):
+            aggiorna_token_ricerca(chiavi[inizio:inizio + chunk_size])
+
+        self.stdout.write(self.style.SUCCESS(f"Token di ricerca ricostruiti per {len(chiavi)} indirizzi IP"))
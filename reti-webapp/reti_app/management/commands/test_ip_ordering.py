@@ -8,23 +8,17 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         # Test 1: Ordinamento base
         self.stdout.write("Test 1: Ordinamento base")
-        ips = IndirizzoIP.objects.all()[:10]  # Prendi i primi 10 IP
+        ips = IndirizzoIP.objects.order_by('ip')[:10]  # Prendi i primi 10 IP
         self.stdout.write("IP ordinati alfabeticamente:")
         for ip in ips:
             self.stdout.write(f"- {ip.ip}")
             
         # Test 2: Ordinamento numerico
         self.stdout.write("\nTest 2: Ordinamento numerico")
-        if 'mysql' in connection.vendor:
-            ips = IndirizzoIP.objects.extra(
-                select={'ip_as_int': 'INET_ATON(ip)'}, 
-                order_by=['ip_as_int']
-            )[:10]
-            self.stdout.write("IP ordinati numericamente (MySQL INET_ATON):")
-            for ip in ips:
-                self.stdout.write(f"- {ip.ip}")
-        else:
-            self.stdout.write("Database non MySQL - usando ordinamento alfabetico")
+        ips = IndirizzoIP.objects.order_by('ip_numerico')[:10]
+        self.stdout.write(f"IP ordinati numericamente (colonna ip_numerico, database {connection.vendor}):")
+        for ip in ips:
+            self.stdout.write(f"- {ip.ip} ({ip.ip_numerico})")
             
         # Test 3: Ordinamento con metodo della classe
         self.stdout.write("\nTest 3: Ordinamento con metodo della classe")
@@ -0,0 +1,43 @@
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+from reti_app.models import OsservazioneIP
+
+class Command(BaseCommand):
+    help = "Riversa le osservazioni dei collector accodate nella tabella di appoggio su IP, controlli e avvistamenti"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--loop',
+            action='store_true',
+            help="Ripete l'unione ogni --intervallo secondi invece di eseguirla una volta",
+        )
+        parser.add_argument(
+            '--intervallo',
+            type=int,
+            default=getattr(settings, 'OSSERVAZIONI_INTERVALLO_UNIONE_SECONDI', 30),
+            help='Secondi tra due unioni con --loop (default: OSSERVAZIONI_INTERVALLO_UNIONE_SECONDI)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=1000,
+            help='Numero massimo di IP per blocco nella registrazione degli avvistamenti (default: 1000)',
+        )
+
+    def handle(self, *args, **options):
+        while True:
+            # Processo di lunga durata: evita connessioni scadute tra un passaggio e l'altro
+            close_old_connections()
+            risultato = OsservazioneIP.unisci(chunk_size=options['chunk_size'])
+            if risultato['osservazioni'] or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(
+                    f"Unite {risultato['osservazioni']} osservazioni su {risultato['ip']} IP: "
+                    f"{risultato['nuovi']} nuovi, {risultato['riattivati']} riattivati, "
+                    f"{risultato['mac_cambiati']} con MAC cambiato"
+                ))
+            if not options['loop']:
+                break
+            time.sleep(options['intervallo'])
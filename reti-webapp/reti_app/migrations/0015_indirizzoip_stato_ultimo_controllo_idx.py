@@ -0,0 +1,17 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:08
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0014_add_riservato_to_disponibilita'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='indirizzoip',
+            index=models.Index(fields=['stato', 'ultimo_controllo'], name='reti_app_in_stato_81ac3b_idx'),
+        ),
+    ]
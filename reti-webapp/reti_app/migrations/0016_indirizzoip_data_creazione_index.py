@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0015_indirizzoip_stato_ultimo_controllo_idx'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='indirizzoip',
+            name='data_creazione',
+            field=models.DateTimeField(auto_now_add=True, db_index=True, verbose_name='Data Creazione'),
+        ),
+    ]
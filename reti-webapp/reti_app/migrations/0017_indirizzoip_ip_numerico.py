@@ -0,0 +1,42 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:17
+
+import ipaddress
+
+from django.db import migrations, models
+
+
+def popola_ip_numerico(apps, schema_editor):
+    """Valorizza ip_numerico per gli indirizzi esistenti, a blocchi"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    blocco = []
+    for ip in IndirizzoIP.objects.filter(ip_numerico__isnull=True).values_list('ip', flat=True).iterator(chunk_size=2000):
+        try:
+            valore = int(ipaddress.IPv4Address(ip))
+        except ValueError:
+            continue
+        blocco.append(IndirizzoIP(ip=ip, ip_numerico=valore))
+        if len(blocco) >= 2000:
+            IndirizzoIP.objects.bulk_update(blocco, ['ip_numerico'])
+            blocco = []
+    if blocco:
+        IndirizzoIP.objects.bulk_update(blocco, ['ip_numerico'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0016_indirizzoip_data_creazione_index'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='indirizzoip',
+            options={'ordering': ['ip_numerico', 'ip'], 'verbose_name': 'Indirizzo IP', 'verbose_name_plural': 'Indirizzi IP'},
+        ),
+        migrations.AddField(
+            model_name='indirizzoip',
+            name='ip_numerico',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, editable=False, help_text="Valore intero dell'IP, usato per ordinamento e ricerche per intervallo", null=True, verbose_name='IP numerico'),
+        ),
+        migrations.RunPython(popola_ip_numerico, migrations.RunPython.noop),
+    ]
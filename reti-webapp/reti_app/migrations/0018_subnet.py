@@ -0,0 +1,76 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:19
+
+import ipaddress
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def popola_subnet(apps, schema_editor):
+    """Crea le righe Subnet a partire dal campo testuale Vlan.subnets"""
+    Vlan = apps.get_model('reti_app', 'Vlan')
+    Subnet = apps.get_model('reti_app', 'Subnet')
+    nuove = []
+    for vlan in Vlan.objects.exclude(subnets__isnull=True).exclude(subnets=''):
+        try:
+            gateway = int(ipaddress.IPv4Address(vlan.gateway)) if vlan.gateway else None
+        except ValueError:
+            gateway = None
+        viste = set()
+        for voce in vlan.subnets.replace('\n', ',').split(','):
+            voce = voce.strip()
+            if not voce:
+                continue
+            ip_part, separatore, prefisso = voce.partition('/')
+            if ip_part.endswith('.'):
+                ip_part += '0'
+            ip_part = '.'.join(o.lstrip('0') or '0' if o.isdigit() else o for o in ip_part.split('.'))
+            try:
+                network = ipaddress.IPv4Network(f"{ip_part}{separatore}{prefisso}", strict=False)
+            except ValueError:
+                # Voci non interpretabili: restano solo nel campo testuale
+                continue
+            if str(network) in viste:
+                continue
+            viste.add(str(network))
+            inizio = int(network.network_address)
+            fine = int(network.broadcast_address)
+            nuove.append(Subnet(
+                vlan=vlan,
+                cidr=str(network),
+                rete_inizio=inizio,
+                rete_fine=fine,
+                prefisso=network.prefixlen,
+                gateway=vlan.gateway if gateway is not None and inizio <= gateway <= fine else None,
+            ))
+    Subnet.objects.bulk_create(nuove, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0017_indirizzoip_ip_numerico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Subnet',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('cidr', models.CharField(max_length=18, verbose_name='Subnet')),
+                ('rete_inizio', models.PositiveBigIntegerField(verbose_name='Indirizzo di rete')),
+                ('rete_fine', models.PositiveBigIntegerField(verbose_name='Indirizzo di broadcast')),
+                ('prefisso', models.PositiveSmallIntegerField(verbose_name='Lunghezza prefisso')),
+                ('gateway', models.GenericIPAddressField(blank=True, null=True, protocol='IPv4', verbose_name='Gateway')),
+                ('vlan', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='reti', to='reti_app.vlan', verbose_name='VLAN')),
+            ],
+            options={
+                'verbose_name': 'Subnet',
+                'verbose_name_plural': 'Subnet',
+                'ordering': ['rete_inizio', 'prefisso'],
+                'indexes': [models.Index(fields=['rete_inizio', 'rete_fine'], name='reti_app_su_rete_in_f15c8f_idx')],
+                'unique_together': {('vlan', 'cidr')},
+            },
+        ),
+        migrations.RunPython(popola_subnet, migrations.RunPython.noop),
+    ]
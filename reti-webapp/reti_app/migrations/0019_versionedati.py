@@ -0,0 +1,24 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0018_subnet'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='VersioneDati',
+            fields=[
+                ('nome', models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name='Nome')),
+                ('versione', models.PositiveBigIntegerField(default=0, verbose_name='Versione')),
+            ],
+            options={
+                'verbose_name': 'Versione dati',
+                'verbose_name_plural': 'Versioni dati',
+            },
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:25
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def popola_contatori(apps, schema_editor):
+    """Calcola i contatori iniziali di tutte le VLAN con un'unica aggregazione"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    Vlan = apps.get_model('reti_app', 'Vlan')
+    anomalo = Q(stato='attivo') & (Q(disponibilita='libero') | Q(responsabile__isnull=True) | Q(responsabile=''))
+    righe = IndirizzoIP.objects.filter(vlan__isnull=False).values('vlan').annotate(
+        num_indirizzi=Count('ip'),
+        num_attivi=Count('ip', filter=Q(stato='attivo')),
+        num_usati=Count('ip', filter=Q(disponibilita='usato')),
+        num_liberi=Count('ip', filter=Q(disponibilita='libero')),
+        num_riservati=Count('ip', filter=Q(disponibilita='riservato')),
+        num_anomali=Count('ip', filter=anomalo),
+    ).order_by()
+    for riga in righe:
+        Vlan.objects.filter(numero=riga.pop('vlan')).update(**riga)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0019_versionedati'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='vlan',
+            name='num_anomali',
+            field=models.IntegerField(default=0, editable=False, verbose_name='IP anomali'),
+        ),
+        migrations.AddField(
+            model_name='vlan',
+            name='num_attivi',
+            field=models.IntegerField(default=0, editable=False, verbose_name='IP attivi'),
+        ),
+        migrations.AddField(
+            model_name='vlan',
+            name='num_liberi',
+            field=models.IntegerField(default=0, editable=False, verbose_name='IP liberi'),
+        ),
+        migrations.AddField(
+            model_name='vlan',
+            name='num_riservati',
+            field=models.IntegerField(default=0, editable=False, verbose_name='IP riservati'),
+        ),
+        migrations.AddField(
+            model_name='vlan',
+            name='num_usati',
+            field=models.IntegerField(default=0, editable=False, verbose_name='IP usati'),
+        ),
+        migrations.AlterField(
+            model_name='vlan',
+            name='num_indirizzi',
+            field=models.IntegerField(default=0, editable=False, help_text='Contatore aggiornato a ogni modifica degli IP della VLAN', verbose_name='Numero di indirizzi IP'),
+        ),
+        migrations.RunPython(popola_contatori, migrations.RunPython.noop),
+    ]
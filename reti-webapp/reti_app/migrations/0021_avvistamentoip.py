@@ -0,0 +1,31 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0020_vlan_contatori'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AvvistamentoIP',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('ip', models.GenericIPAddressField(protocol='IPv4', verbose_name='Indirizzo IP')),
+                ('mac_address', models.CharField(blank=True, default='', max_length=17, verbose_name='MAC Address')),
+                ('sorgente', models.CharField(help_text="Router, firewall o altro dispositivo che ha rilevato l'IP", max_length=100, verbose_name='Sorgente')),
+                ('primo_avvistamento', models.DateTimeField(verbose_name='Primo avvistamento')),
+                ('ultimo_avvistamento', models.DateTimeField(verbose_name='Ultimo avvistamento')),
+                ('num_avvistamenti', models.PositiveIntegerField(default=1, verbose_name='Numero avvistamenti')),
+            ],
+            options={
+                'verbose_name': 'Avvistamento IP',
+                'verbose_name_plural': 'Avvistamenti IP',
+                'ordering': ['-ultimo_avvistamento'],
+                'indexes': [models.Index(fields=['ip', 'ultimo_avvistamento'], name='reti_app_av_ip_c6d58e_idx'), models.Index(fields=['mac_address', 'ultimo_avvistamento'], name='reti_app_av_mac_add_4e2ffd_idx'), models.Index(fields=['sorgente', 'ip', 'ultimo_avvistamento'], name='reti_app_av_sorgent_df5d24_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:29
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0021_avvistamentoip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StoricoResponsabileArchivio',
+            fields=[
+                ('responsabile', models.EmailField(blank=True, db_index=True, max_length=255, null=True, verbose_name='Mail Responsabile')),
+                ('utente_finale', models.CharField(blank=True, max_length=255, null=True, verbose_name='Utente Finale')),
+                ('data_inizio', models.DateTimeField(db_index=True, verbose_name='Data Inizio Assegnazione')),
+                ('data_fine', models.DateTimeField(blank=True, db_index=True, null=True, verbose_name='Data Fine Assegnazione')),
+                ('motivo_cambio', models.CharField(blank=True, choices=[('assegnazione', 'Assegnazione Iniziale'), ('rilascio', 'Rilascio Volontario'), ('inattivita', 'Liberazione per Inattività'), ('scadenza', 'Liberazione per Scadenza'), ('cambio', 'Cambio Responsabile'), ('pulizia_automatica', 'Pulizia Automatica'), ('admin', 'Modifica Amministratore')], max_length=30, null=True, verbose_name='Motivo Cambio')),
+                ('note', models.TextField(blank=True, null=True, verbose_name='Note')),
+                ('stato_rete', models.CharField(blank=True, max_length=20, null=True, verbose_name='Stato Rete al momento')),
+                ('disponibilita', models.CharField(blank=True, max_length=20, null=True, verbose_name='Disponibilità al momento')),
+                ('created_by', models.CharField(blank=True, help_text='Sistema o utente che ha creato il record', max_length=100, null=True, verbose_name='Creato da')),
+                ('id', models.BigIntegerField(primary_key=True, serialize=False, verbose_name='ID')),
+                ('created_at', models.DateTimeField(verbose_name='Creato il')),
+                ('archiviato_il', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Archiviato il')),
+                ('indirizzo_ip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='storico_archiviato', to='reti_app.indirizzoip', verbose_name='Indirizzo IP')),
+                ('vlan', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='reti_app.vlan', verbose_name='VLAN al momento')),
+            ],
+            options={
+                'verbose_name': 'Storico Responsabile archiviato',
+                'verbose_name_plural': 'Storico Responsabili archiviati',
+                'ordering': ['-data_inizio'],
+                'indexes': [models.Index(fields=['indirizzo_ip', '-data_inizio'], name='reti_app_st_indiriz_5cf192_idx'), models.Index(fields=['responsabile', '-data_inizio'], name='reti_app_st_respons_7a56ba_idx')],
+            },
+        ),
+    ]
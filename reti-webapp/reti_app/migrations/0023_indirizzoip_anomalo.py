@@ -0,0 +1,32 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:30
+
+from django.db import migrations, models
+from django.db.models import Q
+
+
+def popola_anomalo(apps, schema_editor):
+    """Valorizza il flag anomalo per gli indirizzi esistenti con un solo UPDATE"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    IndirizzoIP.objects.filter(
+        Q(stato='attivo') & (Q(disponibilita='libero') | Q(responsabile__isnull=True) | Q(responsabile=''))
+    ).update(anomalo=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0022_storicoresponsabilearchivio'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indirizzoip',
+            name='anomalo',
+            field=models.BooleanField(default=False, editable=False, help_text='Attivo ma libero o senza responsabile (vedi is_anomalo)', verbose_name='Anomalo'),
+        ),
+        migrations.RunPython(popola_anomalo, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='indirizzoip',
+            index=models.Index(fields=['anomalo', 'vlan'], name='reti_app_in_anomalo_dab143_idx'),
+        ),
+    ]
@@ -0,0 +1,68 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:31
+
+from django.db import migrations, models
+
+
+def _mac_a_intero(mac_address):
+    cifre = (mac_address or '').strip().lower()
+    for separatore in (':', '-', '.', ' '):
+        cifre = cifre.replace(separatore, '')
+    if len(cifre) != 12:
+        return None
+    try:
+        return int(cifre, 16)
+    except ValueError:
+        return None
+
+
+def _formato_canonico(valore):
+    cifre = f"{valore:012x}"
+    return ':'.join(cifre[i:i + 2] for i in range(0, 12, 2))
+
+
+def normalizza_mac_esistenti(apps, schema_editor):
+    """Porta i MAC in formato canonico e valorizza mac_numerico, a blocchi"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    AvvistamentoIP = apps.get_model('reti_app', 'AvvistamentoIP')
+
+    blocco = []
+    righe = IndirizzoIP.objects.exclude(mac_address__isnull=True).exclude(mac_address='')
+    for ip, mac_address in righe.values_list('ip', 'mac_address').iterator(chunk_size=2000):
+        valore = _mac_a_intero(mac_address)
+        if valore is None:
+            continue
+        blocco.append(IndirizzoIP(ip=ip, mac_address=_formato_canonico(valore), mac_numerico=valore))
+        if len(blocco) >= 2000:
+            IndirizzoIP.objects.bulk_update(blocco, ['mac_address', 'mac_numerico'])
+            blocco = []
+    if blocco:
+        IndirizzoIP.objects.bulk_update(blocco, ['mac_address', 'mac_numerico'])
+
+    # Gli avvistamenti vengono cercati per MAC esatto: stesso formato canonico
+    blocco = []
+    for pk, mac_address in AvvistamentoIP.objects.exclude(mac_address='').values_list('pk', 'mac_address').iterator(chunk_size=2000):
+        valore = _mac_a_intero(mac_address)
+        if valore is None or _formato_canonico(valore) == mac_address:
+            continue
+        blocco.append(AvvistamentoIP(pk=pk, mac_address=_formato_canonico(valore)))
+        if len(blocco) >= 2000:
+            AvvistamentoIP.objects.bulk_update(blocco, ['mac_address'])
+            blocco = []
+    if blocco:
+        AvvistamentoIP.objects.bulk_update(blocco, ['mac_address'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0023_indirizzoip_anomalo'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='indirizzoip',
+            name='mac_numerico',
+            field=models.PositiveBigIntegerField(blank=True, db_index=True, editable=False, help_text='Valore intero a 48 bit del MAC, usato per le ricerche esatte', null=True, verbose_name='MAC numerico'),
+        ),
+        migrations.RunPython(normalizza_mac_esistenti, migrations.RunPython.noop),
+    ]
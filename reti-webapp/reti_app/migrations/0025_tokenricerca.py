@@ -0,0 +1,65 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:36
+
+from django.db import migrations, models
+import django.db.models.deletion
+import re
+
+INDICE_FULLTEXT = 'reti_app_ip_ricerca_ft'
+
+
+def crea_indice_ricerca(apps, schema_editor):
+    """FULLTEXT su MariaDB/MySQL, altrimenti popola la tabella dei token"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    TokenRicerca = apps.get_model('reti_app', 'TokenRicerca')
+    qn = schema_editor.quote_name
+
+    if schema_editor.connection.vendor == 'mysql':
+        schema_editor.execute(
+            f"CREATE FULLTEXT INDEX {qn(INDICE_FULLTEXT)} ON {qn(IndirizzoIP._meta.db_table)} "
+            f"({qn('responsabile')}, {qn('utente_finale')}, {qn('note')})"
+        )
+        return
+
+    blocco = []
+    righe = IndirizzoIP.objects.values_list('ip', 'responsabile', 'utente_finale', 'note')
+    for ip, *valori in righe.iterator(chunk_size=2000):
+        testo = ' '.join(filter(None, valori)).lower()
+        for token in {token[:64] for token in re.findall(r'\w+', testo)}:
+            blocco.append(TokenRicerca(indirizzo_ip_id=ip, token=token))
+        if len(blocco) >= 2000:
+            TokenRicerca.objects.bulk_create(blocco)
+            blocco = []
+    if blocco:
+        TokenRicerca.objects.bulk_create(blocco)
+
+
+def rimuovi_indice_ricerca(apps, schema_editor):
+    if schema_editor.connection.vendor == 'mysql':
+        IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+        qn = schema_editor.quote_name
+        schema_editor.execute(f"DROP INDEX {qn(INDICE_FULLTEXT)} ON {qn(IndirizzoIP._meta.db_table)}")
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0024_indirizzoip_mac_numerico'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TokenRicerca',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('token', models.CharField(max_length=64, verbose_name='Token')),
+                ('indirizzo_ip', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='token_ricerca', to='reti_app.indirizzoip', verbose_name='Indirizzo IP')),
+            ],
+            options={
+                'verbose_name': 'Token di ricerca',
+                'verbose_name_plural': 'Token di ricerca',
+                'indexes': [models.Index(fields=['token', 'indirizzo_ip'], name='reti_app_to_token_f6c452_idx')],
+                'unique_together': {('indirizzo_ip', 'token')},
+            },
+        ),
+        migrations.RunPython(crea_indice_ricerca, rimuovi_indice_ricerca),
+    ]
@@ -0,0 +1,64 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:40
+
+from django.db import migrations, models
+import django.db.models.deletion
+import django.utils.timezone
+
+
+def copia_controlli(apps, schema_editor):
+    """Sposta ultimo_controllo (e il MAC attuale come ultimo MAC) nella tabella stretta"""
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    ControlloIP = apps.get_model('reti_app', 'ControlloIP')
+    qn = schema_editor.quote_name
+    # Un solo INSERT ... SELECT: nessun dato passa dall'applicazione
+    schema_editor.execute(
+        f"INSERT INTO {qn(ControlloIP._meta.db_table)} "
+        f"({qn('indirizzo_ip_id')}, {qn('ultimo_controllo')}, {qn('ultimo_mac')}, {qn('ultima_sorgente')}) "
+        f"SELECT {qn('ip')}, {qn('ultimo_controllo')}, {qn('mac_address')}, '' "
+        f"FROM {qn(IndirizzoIP._meta.db_table)}"
+    )
+
+
+def ripristina_controlli(apps, schema_editor):
+    IndirizzoIP = apps.get_model('reti_app', 'IndirizzoIP')
+    ControlloIP = apps.get_model('reti_app', 'ControlloIP')
+    blocco = []
+    for ip, ultimo_controllo in ControlloIP.objects.values_list('indirizzo_ip_id', 'ultimo_controllo').iterator(chunk_size=2000):
+        blocco.append(IndirizzoIP(ip=ip, ultimo_controllo=ultimo_controllo))
+        if len(blocco) >= 2000:
+            IndirizzoIP.objects.bulk_update(blocco, ['ultimo_controllo'])
+            blocco = []
+    if blocco:
+        IndirizzoIP.objects.bulk_update(blocco, ['ultimo_controllo'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0025_tokenricerca'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ControlloIP',
+            fields=[
+                ('indirizzo_ip', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='controllo', serialize=False, to='reti_app.indirizzoip', verbose_name='Indirizzo IP')),
+                ('ultimo_controllo', models.DateTimeField(db_index=True, default=django.utils.timezone.now, verbose_name='Ultimo Controllo')),
+                ('ultimo_mac', models.CharField(blank=True, max_length=17, null=True, verbose_name='Ultimo MAC rilevato')),
+                ('ultima_sorgente', models.CharField(blank=True, default='', help_text="Collector che ha rilevato l'IP per ultimo (es. nome del router)", max_length=100, verbose_name='Ultima sorgente')),
+            ],
+            options={
+                'verbose_name': 'Controllo IP',
+                'verbose_name_plural': 'Controlli IP',
+            },
+        ),
+        migrations.RunPython(copia_controlli, ripristina_controlli),
+        migrations.RemoveIndex(
+            model_name='indirizzoip',
+            name='reti_app_in_stato_81ac3b_idx',
+        ),
+        migrations.RemoveField(
+            model_name='indirizzoip',
+            name='ultimo_controllo',
+        ),
+    ]
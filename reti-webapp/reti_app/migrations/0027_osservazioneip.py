@@ -0,0 +1,30 @@
+# Generated by Django 4.2.7 on 2026-10-18 22:44
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reti_app', '0026_controlloip'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OsservazioneIP',
+            fields=[
+                ('id', models.BigAutoField(primary_key=True, serialize=False)),
+                ('ip', models.GenericIPAddressField(protocol='IPv4', verbose_name='Indirizzo IP')),
+                ('mac_address', models.CharField(blank=True, default='', max_length=17, verbose_name='MAC Address')),
+                ('mac_numerico', models.PositiveBigIntegerField(blank=True, null=True, verbose_name='MAC numerico')),
+                ('sorgente', models.CharField(max_length=100, verbose_name='Sorgente')),
+                ('visto_il', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Visto il')),
+            ],
+            options={
+                'verbose_name': 'Osservazione IP',
+                'verbose_name_plural': 'Osservazioni IP',
+                'indexes': [models.Index(fields=['ip', 'visto_il'], name='reti_app_os_ip_b1a459_idx')],
+            },
+        ),
+    ]
@@ -1,11 +1,16 @@
-from django.db import models
+from django.db import models, transaction
+from django.db.models import BooleanField, Case, Count, F, Max, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Concat
 from django.utils import timezone
 from django.contrib.auth.models import User
-from django.db.models.signals import post_save
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.utils.translation import gettext_lazy as _
+from django.core.exceptions import ValidationError
 import ipaddress
 
+from .cache_dati import invalida
+
 class UserProfile(models.Model):
     """
     Estensione del modello User per aggiungere campi personalizzati
@@ -45,6 +50,97 @@ def save_user_profile(sender, instance, **kwargs):
         login_enabled = instance.is_staff or instance.is_superuser or instance.username == 'root'
         UserProfile.objects.create(user=instance, login_enabled=login_enabled)
 
+class VersioneDati(models.Model):
+    """
+    Contatore di versione condiviso tra i processi
+
+    Permette ai worker di accorgersi che dati tenuti in cache nel processo
+    (es. l'indice delle VLAN) sono cambiati, con una sola lettura per chiave.
+    """
+    nome = models.CharField(max_length=50, primary_key=True, verbose_name=_("Nome"))
+    versione = models.PositiveBigIntegerField(default=0, verbose_name=_("Versione"))
+
+    class Meta:
+        verbose_name = _("Versione dati")
+        verbose_name_plural = _("Versioni dati")
+
+    def __str__(self):
+        return f"{self.nome}: {self.versione}"
+
+    @classmethod
+    def corrente(cls, nome):
+        """Restituisce la versione attuale (0 se mai incrementata)"""
+        return cls.objects.filter(nome=nome).values_list('versione', flat=True).first() or 0
+
+    @classmethod
+    def incrementa(cls, nome):
+        """Incrementa atomicamente la versione"""
+        if not cls.objects.filter(nome=nome).update(versione=F('versione') + 1):
+            _obj, created = cls.objects.get_or_create(nome=nome, defaults={'versione': 1})
+            if not created:
+                cls.objects.filter(nome=nome).update(versione=F('versione') + 1)
+
+
+def normalizza_subnet(subnet):
+    """
+    Interpreta una subnet scritta a mano e la restituisce come IPv4Network
+
+    Corregge i formati incompleti già tollerati in passato (es. 192.168.254./24)
+    e gli zeri iniziali negli ottetti (es. 172.016.112.0/24).
+
+    Raises:
+        ValueError: se la subnet non è interpretabile
+    """
+    subnet = (subnet or '').strip()
+    if not subnet:
+        raise ValueError("subnet vuota")
+
+    ip_part, separatore, prefisso = subnet.partition('/')
+    if ip_part.endswith('.'):
+        ip_part += '0'
+    ottetti = [o.lstrip('0') or '0' if o.isdigit() else o for o in ip_part.split('.')]
+    ip_part = '.'.join(ottetti)
+
+    return ipaddress.IPv4Network(f"{ip_part}{separatore}{prefisso}", strict=False)
+
+
+# Contatori per VLAN mantenuti a ogni modifica degli IP (vedi IndirizzoIPQuerySet)
+CONTATORI_VLAN = ('num_indirizzi', 'num_attivi', 'num_usati', 'num_liberi', 'num_riservati', 'num_anomali')
+
+# Campi di IndirizzoIP da cui dipendono i contatori
+CAMPI_CONTATORI_IP = frozenset(['vlan', 'vlan_id', 'stato', 'disponibilita', 'responsabile'])
+
+# Campi di IndirizzoIP da cui dipende il flag anomalo
+CAMPI_ANOMALO_IP = frozenset(['stato', 'disponibilita', 'responsabile'])
+
+# Campi di IndirizzoIP coperti dalla ricerca testuale (vedi ricerca.py)
+CAMPI_RICERCA_IP = frozenset(['responsabile', 'utente_finale', 'note'])
+
+# Campi dei controlli di rete, salvati nella tabella stretta ControlloIP
+CAMPI_CONTROLLO_IP = frozenset(['ultimo_controllo', 'ultimo_mac', 'ultima_sorgente'])
+
+# Stessa condizione di IndirizzoIP.is_anomalo(), espressa in SQL
+Q_ANOMALO = Q(stato='attivo') & (Q(disponibilita='libero') | Q(responsabile__isnull=True) | Q(responsabile=''))
+
+
+def conteggi_contatori_vlan(queryset):
+    """
+    Calcola i contatori per VLAN degli IP del queryset con un'unica aggregazione
+
+    Returns:
+        dict: {numero_vlan: {contatore: valore}} (gli IP senza VLAN sono esclusi)
+    """
+    righe = queryset.filter(vlan__isnull=False).values('vlan').annotate(
+        num_indirizzi=Count('ip'),
+        num_attivi=Count('ip', filter=Q(stato='attivo')),
+        num_usati=Count('ip', filter=Q(disponibilita='usato')),
+        num_liberi=Count('ip', filter=Q(disponibilita='libero')),
+        num_riservati=Count('ip', filter=Q(disponibilita='riservato')),
+        num_anomali=Count('ip', filter=Q_ANOMALO),
+    ).order_by()
+    return {riga.pop('vlan'): riga for riga in righe}
+
+
 class Vlan(models.Model):
     """
     Modello per rappresentare le VLAN
@@ -55,8 +151,14 @@ class Vlan(models.Model):
     subnets = models.TextField(blank=True, null=True, verbose_name=_("Subnets"), 
                               help_text=_("Lista di subnet separate da virgola o nuova linea"))
     gateway = models.GenericIPAddressField(protocol='IPv4', blank=True, null=True, verbose_name=_("Gateway"))
-    num_indirizzi = models.IntegerField(default=0, verbose_name=_("Numero di indirizzi IP"), help_text=_("Campo aggiornato periodicamente tramite cron job"))
-    
+    num_indirizzi = models.IntegerField(default=0, editable=False, verbose_name=_("Numero di indirizzi IP"),
+                                        help_text=_("Contatore aggiornato a ogni modifica degli IP della VLAN"))
+    num_attivi = models.IntegerField(default=0, editable=False, verbose_name=_("IP attivi"))
+    num_usati = models.IntegerField(default=0, editable=False, verbose_name=_("IP usati"))
+    num_liberi = models.IntegerField(default=0, editable=False, verbose_name=_("IP liberi"))
+    num_riservati = models.IntegerField(default=0, editable=False, verbose_name=_("IP riservati"))
+    num_anomali = models.IntegerField(default=0, editable=False, verbose_name=_("IP anomali"))
+
     class Meta:
         verbose_name = _("VLAN")
         verbose_name_plural = _("VLAN")
@@ -101,6 +203,94 @@ class Vlan(models.Model):
             
         return normalized_subnets
     
+    def analizza_subnets(self):
+        """
+        Interpreta il campo testuale subnets
+
+        Returns:
+            tuple: (lista di IPv4Network valide, lista delle voci non valide)
+        """
+        reti = []
+        errori = []
+        if not self.subnets:
+            return reti, errori
+        for voce in self.subnets.replace('\n', ',').split(','):
+            voce = voce.strip()
+            if not voce:
+                continue
+            try:
+                network = normalizza_subnet(voce)
+            except ValueError:
+                errori.append(voce)
+                continue
+            if network not in reti:
+                reti.append(network)
+        return reti, errori
+
+    def clean(self):
+        super().clean()
+        _reti, errori = self.analizza_subnets()
+        if errori:
+            raise ValidationError({'subnets': _("Subnet non valide: %(subnet)s") % {'subnet': ', '.join(errori)}})
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if (update_fields is None and not self._state.adding and not kwargs.get('force_insert')
+                and type(self).objects.filter(pk=self.pk).exists()):
+            # I contatori sono mantenuti con UPDATE F() dalle modifiche degli IP:
+            # il salvataggio di una VLAN già esistente non deve sovrascriverli
+            kwargs['update_fields'] = [
+                f.attname for f in self._meta.concrete_fields
+                if not f.primary_key and f.attname not in CONTATORI_VLAN
+            ]
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            # La tabella Subnet viene riallineata solo quando il testo delle subnet può essere cambiato
+            if update_fields is None or 'subnets' in update_fields:
+                self.sincronizza_subnet()
+                # Gli indici VLAN in memoria degli altri processi vanno ricostruiti
+                from .indice_vlan import invalida_indice_vlan
+                invalida_indice_vlan()
+
+    def sincronizza_subnet(self):
+        """
+        Riallinea le righe Subnet normalizzate con il campo testuale subnets
+
+        Le voci non interpretabili vengono ignorate: la validazione in scrittura
+        avviene in clean() e nei serializer.
+        """
+        reti, _errori = self.analizza_subnets()
+        gateway = ip_a_intero(self.gateway)
+        nuove = {
+            str(network): Subnet(
+                vlan=self,
+                cidr=str(network),
+                rete_inizio=int(network.network_address),
+                rete_fine=int(network.broadcast_address),
+                prefisso=network.prefixlen,
+                gateway=self.gateway if gateway is not None and int(network.network_address) <= gateway <= int(network.broadcast_address) else None,
+            )
+            for network in reti
+        }
+        esistenti = {subnet.cidr: subnet for subnet in self.reti.all()}
+
+        da_eliminare = [subnet.pk for cidr, subnet in esistenti.items() if cidr not in nuove]
+        if da_eliminare:
+            Subnet.objects.filter(pk__in=da_eliminare).delete()
+
+        da_creare = [subnet for cidr, subnet in nuove.items() if cidr not in esistenti]
+        if da_creare:
+            Subnet.objects.bulk_create(da_creare)
+
+        da_aggiornare = []
+        for cidr, subnet in nuove.items():
+            esistente = esistenti.get(cidr)
+            if esistente is not None and esistente.gateway != subnet.gateway:
+                esistente.gateway = subnet.gateway
+                da_aggiornare.append(esistente)
+        if da_aggiornare:
+            Subnet.objects.bulk_update(da_aggiornare, ['gateway'])
+
     def contains_ip(self, ip_address):
         """
         Verifica se l'indirizzo IP specificato appartiene a una delle subnet della VLAN
@@ -111,61 +301,446 @@ class Vlan(models.Model):
         Returns:
             bool: True se l'IP appartiene a una delle subnet, False altrimenti
         """
-        if not self.subnets or not ip_address:
-            # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: nessuna subnet o IP non valido")
-            return False
-            
-        try:
-            # Converti l'indirizzo IP in un oggetto ipaddress.IPv4Address
-            ip = ipaddress.IPv4Address(ip_address)
-            # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: verificando IP {ip_address}")
-            
-            # Controlla ogni subnet
-            for subnet_cidr in self.get_subnets_list():
-                try:
-                    # Crea un oggetto network dalla subnet CIDR
-                    network = ipaddress.IPv4Network(subnet_cidr, strict=False)
-                    # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: confrontando con subnet {subnet_cidr}")
-                    
-                    # Verifica se l'IP è nella subnet
-                    if ip in network:
-                        # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: trovata corrispondenza per {ip_address} in {subnet_cidr}")
-                        return True
-                except ValueError as e:
-                    # Ignora subnet non valide
-                    # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: errore subnet non valida {subnet_cidr}: {str(e)}")
-                    continue
-                    
-            # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: nessuna corrispondenza trovata per {ip_address}")
-            return False
-        except ValueError as e:
-            # Indirizzo IP non valido
-            # Disabilitato per performance: print(f"DEBUG - VLAN {self.numero}: IP non valido {ip_address}: {str(e)}")
+        valore = ip_a_intero(ip_address)
+        if valore is None:
             return False
+        return self.reti.filter(rete_inizio__lte=valore, rete_fine__gte=valore).exists()
             
     @classmethod
     def find_vlan_for_ip(cls, ip_address):
         """
         Trova la VLAN a cui appartiene l'indirizzo IP specificato
         
+        Usa l'indice in memoria del processo (vedi indice_vlan); in caso di
+        subnet sovrapposte vince la più specifica.
+        
         Args:
             ip_address: Indirizzo IP da cercare (stringa)
             
         Returns:
             Vlan o None: Oggetto VLAN se trovato, altrimenti None
         """
-        if not ip_address:
+        from .indice_vlan import get_indice_vlan
+        numero = get_indice_vlan().resolve(ip_address)
+        if numero is None:
             return None
-            
-        # Ottimizzazione: filtra prima le VLAN con subnet
-        vlans_with_subnets = cls.objects.exclude(subnets__isnull=True).exclude(subnets='')
-        
-        # Verifica con priorità le VLAN più comuni
-        for vlan in vlans_with_subnets:
-            if vlan.contains_ip(ip_address):
-                return vlan
-                
+        return cls.objects.filter(numero=numero).first()
+
+    @classmethod
+    def ricalcola_num_indirizzi(cls, associa_ip_senza_vlan=True, chunk_size=1000):
+        """
+        Associa gli IP senza VLAN e ricalcola i contatori di tutte le VLAN
+
+        I contatori sono già mantenuti a ogni modifica degli IP: questo
+        ricalcolo serve da riconciliazione e corregge eventuali derive (ad
+        esempio dopo modifiche fatte direttamente in database). L'associazione
+        avviene in una sola passata sugli IP senza VLAN (con un UPDATE per VLAN
+        e blocco), il conteggio con un'unica aggregazione GROUP BY vlan e il
+        salvataggio con un bulk_update delle sole VLAN con contatori cambiati.
+
+        Args:
+            associa_ip_senza_vlan: Se True associa prima gli IP senza VLAN in base alle subnet
+            chunk_size: Numero massimo di IP per UPDATE
+
+        Returns:
+            dict: {'ip_associati': int, 'vlan_aggiornate': int, 'variazioni': list}
+        """
+        ip_associati = 0
+        if associa_ip_senza_vlan:
+            from .indice_vlan import get_indice_vlan
+            indice = get_indice_vlan()
+            ip_per_vlan = {}
+            if len(indice):
+                senza_vlan = IndirizzoIP.objects.filter(vlan__isnull=True).values_list('ip', flat=True)
+                for ip_address, numero in indice.resolve_many(senza_vlan.iterator()).items():
+                    ip_per_vlan.setdefault(numero, []).append(ip_address)
+
+            for numero, indirizzi in ip_per_vlan.items():
+                for i in range(0, len(indirizzi), chunk_size):
+                    ip_associati += IndirizzoIP.objects.filter(
+                        ip__in=indirizzi[i:i + chunk_size],
+                        vlan__isnull=True
+                    ).update(vlan_id=numero)
+
+        conteggi = conteggi_contatori_vlan(IndirizzoIP.objects.filter(vlan__isnull=False))
+        vuoti = dict.fromkeys(CONTATORI_VLAN, 0)
+
+        da_aggiornare = []
+        variazioni = []
+        for vlan in cls.objects.only('numero', 'nome', *CONTATORI_VLAN):
+            nuovi = conteggi.get(vlan.numero, vuoti)
+            if any(getattr(vlan, campo) != nuovi[campo] for campo in CONTATORI_VLAN):
+                variazioni.append({
+                    'numero': vlan.numero,
+                    'nome': vlan.nome,
+                    'precedente': vlan.num_indirizzi,
+                    'attuale': nuovi['num_indirizzi'],
+                    'contatori': {
+                        campo: {'precedente': getattr(vlan, campo), 'attuale': nuovi[campo]}
+                        for campo in CONTATORI_VLAN if getattr(vlan, campo) != nuovi[campo]
+                    },
+                })
+                for campo in CONTATORI_VLAN:
+                    setattr(vlan, campo, nuovi[campo])
+                da_aggiornare.append(vlan)
+
+        if da_aggiornare:
+            cls.objects.bulk_update(da_aggiornare, list(CONTATORI_VLAN), batch_size=chunk_size)
+            invalida('vlan')
+
+        return {
+            'ip_associati': ip_associati,
+            'vlan_aggiornate': len(da_aggiornare),
+            'variazioni': variazioni,
+        }
+
+    @classmethod
+    def applica_variazioni_contatori(cls, prima, dopo):
+        """
+        Applica ai contatori la differenza tra due conteggi per VLAN
+
+        Un UPDATE con espressioni F() per ogni VLAN effettivamente cambiata,
+        così che modifiche concorrenti non si sovrascrivano a vicenda; dopo il
+        commit le risposte in cache delle VLAN vengono invalidate.
+
+        Args:
+            prima: {numero_vlan: {contatore: valore}} prima della modifica
+            dopo: {numero_vlan: {contatore: valore}} dopo la modifica
+        """
+        cambiate = False
+        for numero in set(prima) | set(dopo):
+            if numero is None:
+                continue
+            valori_prima = prima.get(numero, {})
+            valori_dopo = dopo.get(numero, {})
+            variazioni = {}
+            for campo in CONTATORI_VLAN:
+                delta = valori_dopo.get(campo, 0) - valori_prima.get(campo, 0)
+                if delta:
+                    variazioni[campo] = F(campo) + delta
+            if variazioni:
+                cls.objects.filter(numero=numero).update(**variazioni)
+                cambiate = True
+        if cambiate:
+            invalida('vlan')
+
+
+class Subnet(models.Model):
+    """
+    Subnet normalizzata di una VLAN, con estremi interi per ricerche per intervallo
+
+    Le righe sono derivate dal campo testuale Vlan.subnets e riallineate a ogni
+    salvataggio della VLAN (admin, API, import CSV).
+    """
+    vlan = models.ForeignKey(Vlan, on_delete=models.CASCADE, related_name='reti', verbose_name=_("VLAN"))
+    cidr = models.CharField(max_length=18, verbose_name=_("Subnet"))
+    rete_inizio = models.PositiveBigIntegerField(verbose_name=_("Indirizzo di rete"))
+    rete_fine = models.PositiveBigIntegerField(verbose_name=_("Indirizzo di broadcast"))
+    prefisso = models.PositiveSmallIntegerField(verbose_name=_("Lunghezza prefisso"))
+    gateway = models.GenericIPAddressField(protocol='IPv4', blank=True, null=True, verbose_name=_("Gateway"))
+
+    class Meta:
+        verbose_name = _("Subnet")
+        verbose_name_plural = _("Subnet")
+        ordering = ['rete_inizio', 'prefisso']
+        unique_together = [('vlan', 'cidr')]
+        indexes = [
+            models.Index(fields=['rete_inizio', 'rete_fine']),
+        ]
+
+    def __str__(self):
+        return self.cidr
+
+    @property
+    def network(self):
+        return ipaddress.IPv4Network(self.cidr)
+
+    def indirizzi(self):
+        """Indirizzi IP compresi nella subnet (BETWEEN sull'indice ip_numerico)"""
+        return IndirizzoIP.objects.nel_range(self.rete_inizio, self.rete_fine)
+
+
+@receiver(post_delete, sender=Vlan)
+def invalida_indice_vlan_eliminazione(sender, instance, **kwargs):
+    """Le VLAN eliminate (anche in blocco dall'admin) invalidano l'indice VLAN dei processi"""
+    from .indice_vlan import invalida_indice_vlan
+    invalida_indice_vlan()
+
+
+@receiver(post_save, sender=Vlan)
+@receiver(post_delete, sender=Vlan)
+def invalida_cache_vlan(sender, instance, using, **kwargs):
+    """Elenco e dettaglio delle VLAN in cache non sono più validi"""
+    invalida('vlan', using=using)
+
+
+def ip_a_intero(ip_address):
+    """Converte un indirizzo IPv4 nel corrispondente intero senza segno (None se non valido)"""
+    if not ip_address:
+        return None
+    try:
+        return int(ipaddress.IPv4Address(str(ip_address).strip()))
+    except ValueError:
+        return None
+
+
+def mac_a_intero(mac_address):
+    """
+    Converte un MAC address nel corrispondente intero a 48 bit (None se non valido)
+
+    Accetta i formati usati dalle varie sorgenti: aa:bb:cc:dd:ee:ff,
+    AA-BB-CC-DD-EE-FF, aabb.ccdd.eeff e aabbccddeeff.
+    """
+    if not mac_address:
+        return None
+    cifre = str(mac_address).strip().lower()
+    for separatore in (':', '-', '.', ' '):
+        cifre = cifre.replace(separatore, '')
+    if len(cifre) != 12:
         return None
+    try:
+        return int(cifre, 16)
+    except ValueError:
+        return None
+
+
+def intero_a_mac(valore):
+    """Formato canonico (aa:bb:cc:dd:ee:ff) di un MAC a 48 bit"""
+    cifre = f"{valore:012x}"
+    return ':'.join(cifre[i:i + 2] for i in range(0, 12, 2))
+
+
+def normalizza_mac(mac_address):
+    """
+    Restituisce il MAC nel formato canonico, o il valore ripulito se non interpretabile
+
+    I valori vuoti diventano None, come per i MAC mai rilevati.
+    """
+    if mac_address is None:
+        return None
+    mac_address = str(mac_address).strip()
+    if not mac_address:
+        return None
+    valore = mac_a_intero(mac_address)
+    return intero_a_mac(valore) if valore is not None else mac_address
+
+
+class IndirizzoIPQuerySet(models.QuerySet):
+    """
+    QuerySet degli indirizzi IP con ordinamento e filtri per intervallo
+    basati sulla colonna indicizzata ip_numerico
+
+    Le operazioni in blocco (update, delete, bulk_create e bulk_update, che
+    passa da update) che toccano VLAN, stato, disponibilità o responsabile
+    aggiornano anche i contatori delle VLAN coinvolte, come IndirizzoIP.save()
+    e delete(). I campi dei controlli di rete (CAMPI_CONTROLLO_IP) vengono
+    scritti nella tabella ControlloIP. Tutte invalidano le risposte in cache
+    degli IP (vedi cache_dati.invalida).
+    """
+
+    def _con_contatori(self, elementi, operazione, chiave=None, chunk_size=1000):
+        """
+        Esegue operazione(blocco) mantenendo allineati i contatori delle VLAN
+
+        Per ogni blocco conta gli IP coinvolti per VLAN prima e dopo l'operazione
+        (due aggregazioni) e applica la differenza con UPDATE F(), nella stessa
+        transazione della modifica.
+        """
+        risultato = 0
+        with transaction.atomic(using=self.db):
+            for i in range(0, len(elementi), chunk_size):
+                blocco = elementi[i:i + chunk_size]
+                chiavi = [chiave(e) for e in blocco] if chiave else blocco
+                # _base_manager restituisce un QuerySet semplice: nessuna ricorsione
+                coinvolti = self.model._base_manager.using(self.db).filter(pk__in=chiavi)
+                prima = conteggi_contatori_vlan(coinvolti)
+                risultato += operazione(blocco) or 0
+                Vlan.applica_variazioni_contatori(prima, conteggi_contatori_vlan(coinvolti))
+        return risultato
+
+    def update(self, **kwargs):
+        with transaction.atomic(using=self.db):
+            # Eseguita dopo il commit, quando le nuove righe sono visibili
+            invalida('ip', using=self.db)
+            return self._aggiorna_campi(**kwargs)
+
+    update.alters_data = True
+
+    def _aggiorna_campi(self, **kwargs):
+        controllo = {campo: kwargs.pop(campo) for campo in list(kwargs) if campo in CAMPI_CONTROLLO_IP}
+        if controllo:
+            with transaction.atomic(using=self.db):
+                # Chiavi lette prima: l'UPDATE principale potrebbe far uscire le righe dal filtro,
+                # e MySQL non ammette una sottoquery sulla tabella che si sta aggiornando
+                chiavi = list(self.order_by().values_list('pk', flat=True))
+                for i in range(0, len(chiavi), 1000):
+                    blocco = chiavi[i:i + 1000]
+                    if 'ultimo_controllo' in controllo:
+                        # IP mai controllati: la riga viene creata qui e allineata dall'UPDATE
+                        ControlloIP.objects.using(self.db).bulk_create(
+                            [ControlloIP(indirizzo_ip_id=ip) for ip in blocco], ignore_conflicts=True
+                        )
+                    ControlloIP.objects.using(self.db).filter(indirizzo_ip__in=blocco).update(**controllo)
+                    if kwargs:
+                        self.model.objects.using(self.db).filter(pk__in=blocco).update(**kwargs)
+            return len(chiavi)
+        if 'mac_address' in kwargs and not hasattr(kwargs['mac_address'], 'resolve_expression'):
+            kwargs['mac_address'] = normalizza_mac(kwargs['mac_address'])
+            kwargs['mac_numerico'] = mac_a_intero(kwargs['mac_address'])
+        aggiorna_token = bool(CAMPI_RICERCA_IP.intersection(kwargs))
+        if not CAMPI_CONTATORI_IP.intersection(kwargs) and not aggiorna_token:
+            return super().update(**kwargs)
+        ricalcola_anomalo = bool(CAMPI_ANOMALO_IP.intersection(kwargs))
+
+        def _aggiorna(blocco):
+            righe = self.model._base_manager.using(self.db).filter(pk__in=blocco)
+            aggiornati = righe.update(**kwargs)
+            if ricalcola_anomalo:
+                # Il flag persistito segue i campi appena modificati, nello stesso blocco
+                righe.update(anomalo=Case(When(Q_ANOMALO, then=Value(True)), default=Value(False),
+                                          output_field=BooleanField()))
+            if aggiorna_token:
+                from .ricerca import aggiorna_token_ricerca
+                aggiorna_token_ricerca(blocco, using=self.db)
+            return aggiornati
+
+        with transaction.atomic(using=self.db):
+            # Le righe bloccate non possono uscire dal filtro prima dell'UPDATE
+            chiavi = list(self.select_for_update().order_by().values_list('pk', flat=True))
+            return self._con_contatori(chiavi, _aggiorna)
+
+    def delete(self):
+        with transaction.atomic(using=self.db):
+            invalida('ip', using=self.db)
+            prima = conteggi_contatori_vlan(self.order_by())
+            risultato = super().delete()
+            Vlan.applica_variazioni_contatori(prima, {})
+        return risultato
+
+    delete.alters_data = True
+    delete.queryset_only = True
+
+    def bulk_create(self, objs, *args, **kwargs):
+        # bulk_create non chiama save(): allinea qui le colonne derivate e i contatori
+        objs = list(objs)
+        for obj in objs:
+            obj.allinea_campi_derivati()
+        # Raccolti prima della creazione, finché le istanze risultano ancora nuove
+        controlli = [obj._get_controllo() for obj in objs]
+        creati = []
+
+        def _crea(blocco):
+            from .ricerca import aggiorna_token_ricerca
+            creati.extend(super(IndirizzoIPQuerySet, self).bulk_create(blocco, *args, **kwargs))
+            aggiorna_token_ricerca([obj.ip for obj in blocco], using=self.db)
+
+        with transaction.atomic(using=self.db):
+            invalida('ip', using=self.db)
+            self._con_contatori(objs, _crea, chiave=lambda obj: obj.ip)
+            ControlloIP.objects.using(self.db).bulk_create(controlli, batch_size=1000, ignore_conflicts=True)
+        return creati
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        # Le colonne derivate seguono i campi aggiornati; l'UPDATE passa poi da update()
+        objs = list(objs)
+        fields = list(fields)
+        campi_controllo = [campo for campo in fields if campo in CAMPI_CONTROLLO_IP]
+        if campi_controllo:
+            fields = [campo for campo in fields if campo not in CAMPI_CONTROLLO_IP]
+            with transaction.atomic(using=self.db):
+                invalida('ip', using=self.db)
+                aggiornati = ControlloIP.objects.using(self.db).bulk_update(
+                    [obj._get_controllo() for obj in objs], campi_controllo, *args, **kwargs
+                )
+            if not fields:
+                return aggiornati
+        if 'mac_address' in fields:
+            for obj in objs:
+                obj.allinea_campi_derivati()
+            if 'mac_numerico' not in fields:
+                fields.append('mac_numerico')
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def ordinati_per_ip(self, decrescente=False):
+        """Ordina numericamente per IP usando l'indice su ip_numerico"""
+        if decrescente:
+            return self.order_by('-ip_numerico', '-ip')
+        return self.order_by('ip_numerico', 'ip')
+
+    def nel_range(self, inizio=None, fine=None):
+        """
+        Filtra gli IP compresi tra inizio e fine (estremi inclusi)
+
+        Args:
+            inizio: Primo IP dell'intervallo (stringa o intero), opzionale
+            fine: Ultimo IP dell'intervallo (stringa o intero), opzionale
+        """
+        queryset = self
+        if inizio is not None:
+            inizio = inizio if isinstance(inizio, int) else ip_a_intero(inizio)
+            if inizio is None:
+                return self.none()
+            queryset = queryset.filter(ip_numerico__gte=inizio)
+        if fine is not None:
+            fine = fine if isinstance(fine, int) else ip_a_intero(fine)
+            if fine is None:
+                return self.none()
+            queryset = queryset.filter(ip_numerico__lte=fine)
+        return queryset
+
+    def nella_subnet(self, subnet):
+        """Filtra gli IP appartenenti alla subnet CIDR indicata (BETWEEN sull'indice)"""
+        try:
+            network = ipaddress.IPv4Network(str(subnet).strip(), strict=False)
+        except ValueError:
+            return self.none()
+        return self.nel_range(int(network.network_address), int(network.broadcast_address))
+
+    def scaduti(self, scaduto=True, adesso=None):
+        """
+        Filtra gli IP scaduti (data_scadenza passata) o, con scaduto=False, quelli non scaduti
+
+        Stesso criterio di IndirizzoIP.is_scaduto() tradotto in SQL sull'indice di
+        data_scadenza: gli IP senza scadenza non sono mai scaduti.
+        """
+        adesso = adesso or timezone.now()
+        if scaduto:
+            return self.filter(data_scadenza__lt=adesso)
+        return self.filter(Q(data_scadenza__isnull=True) | Q(data_scadenza__gte=adesso))
+
+    def statistiche(self, giorni_scadenza=30):
+        """
+        Conteggi riassuntivi degli IP con una sola query di aggregazione condizionale
+
+        Returns:
+            dict: totale, per_stato, per_disponibilita, anomali, scaduti (IP usati
+            con scadenza passata) e in_scadenza (scadenza nei prossimi giorni_scadenza giorni)
+        """
+        adesso = timezone.now()
+        conteggi = {'totale': Count('pk')}
+        for valore, _etichetta in self.model.STATO_CHOICES:
+            conteggi[f'stato_{valore}'] = Count('pk', filter=Q(stato=valore))
+        for valore, _etichetta in self.model.DISPONIBILITA_CHOICES:
+            conteggi[f'disponibilita_{valore}'] = Count('pk', filter=Q(disponibilita=valore))
+        conteggi['anomali'] = Count('pk', filter=Q(anomalo=True))
+        conteggi['scaduti'] = Count('pk', filter=Q(disponibilita='usato', data_scadenza__lt=adesso))
+        conteggi['in_scadenza'] = Count('pk', filter=Q(
+            data_scadenza__range=[adesso, adesso + timezone.timedelta(days=giorni_scadenza)]
+        ))
+        risultato = self.aggregate(**conteggi)
+        return {
+            'totale': risultato['totale'],
+            'per_stato': {
+                valore: risultato[f'stato_{valore}'] for valore, _etichetta in self.model.STATO_CHOICES
+            },
+            'per_disponibilita': {
+                valore: risultato[f'disponibilita_{valore}']
+                for valore, _etichetta in self.model.DISPONIBILITA_CHOICES
+            },
+            'anomali': risultato['anomali'],
+            'scaduti': risultato['scaduti'],
+            'in_scadenza': risultato['in_scadenza'],
+        }
 
 
 class IndirizzoIP(models.Model):
@@ -185,35 +760,210 @@ class IndirizzoIP(models.Model):
     ]
     
     ip = models.GenericIPAddressField(primary_key=True, protocol='IPv4', verbose_name=_("Indirizzo IP"))
+    ip_numerico = models.PositiveBigIntegerField(blank=True, null=True, editable=False, db_index=True,
+                                                 verbose_name=_("IP numerico"),
+                                                 help_text=_("Valore intero dell'IP, usato per ordinamento e ricerche per intervallo"))
     mac_address = models.CharField(max_length=17, blank=True, null=True, verbose_name=_("MAC Address"), db_index=True)
+    mac_numerico = models.PositiveBigIntegerField(blank=True, null=True, editable=False, db_index=True,
+                                                  verbose_name=_("MAC numerico"),
+                                                  help_text=_("Valore intero a 48 bit del MAC, usato per le ricerche esatte"))
     stato = models.CharField(max_length=20, choices=STATO_CHOICES, default='disattivo', verbose_name=_("Stato Rete"), db_index=True, help_text=_("Indica se l'IP sta navigando in rete"))
     disponibilita = models.CharField(max_length=20, choices=DISPONIBILITA_CHOICES, default='libero', verbose_name=_("Disponibilità"), db_index=True, help_text=_("Libero: disponibile per richieste | Usato: assegnato a un utente | Riservato: non assegnabile temporaneamente"))
     responsabile = models.EmailField(max_length=255, blank=True, null=True, verbose_name=_("Mail Responsabile"), db_index=True)
     utente_finale = models.CharField(max_length=255, blank=True, null=True, verbose_name=_("Utente Finale"))
     note = models.TextField(blank=True, null=True, verbose_name=_("Note"))
-    ultimo_controllo = models.DateTimeField(default=timezone.now, verbose_name=_("Ultimo Controllo"))
-    data_creazione = models.DateTimeField(auto_now_add=True, verbose_name=_("Data Creazione"))
+    data_creazione = models.DateTimeField(auto_now_add=True, verbose_name=_("Data Creazione"), db_index=True)
     data_modifica = models.DateTimeField(auto_now=True, verbose_name=_("Data Modifica"), db_index=True)
     data_scadenza = models.DateTimeField(blank=True, null=True, verbose_name=_("Data Scadenza"), db_index=True)
     assegnato_a_utente = models.ForeignKey(User, on_delete=models.SET_NULL, blank=True, null=True, 
                                           verbose_name=_("Assegnato a"), related_name='indirizzi_assegnati', db_index=True)
     vlan = models.ForeignKey(Vlan, on_delete=models.SET_NULL, blank=True, null=True, 
                             verbose_name=_("VLAN"), related_name='indirizzi', db_index=True)
+    anomalo = models.BooleanField(default=False, editable=False, verbose_name=_("Anomalo"),
+                                  help_text=_("Attivo ma libero o senza responsabile (vedi is_anomalo)"))
+    
+    objects = IndirizzoIPQuerySet.as_manager()
     
     class Meta:
         verbose_name = _("Indirizzo IP")
         verbose_name_plural = _("Indirizzi IP")
-        ordering = ['ip']
+        ordering = ['ip_numerico', 'ip']
         indexes = [
             models.Index(fields=['stato', 'vlan']),
             models.Index(fields=['stato', 'assegnato_a_utente']),
             models.Index(fields=['data_scadenza', 'stato']),
             models.Index(fields=['disponibilita', 'stato']),
+            models.Index(fields=['anomalo', 'vlan']),
         ]
-    
+
     def __str__(self):
         return self.ip
     
+    def save(self, *args, **kwargs):
+        self.allinea_campi_derivati()
+        # Letto prima di super().save(), che segna l'istanza come già salvata
+        nuovo = self._state.adding
+        update_fields = kwargs.get('update_fields')
+        salva_controllo = update_fields is None
+        if update_fields is not None:
+            salva_controllo = bool(CAMPI_CONTROLLO_IP.intersection(update_fields))
+            update_fields = [campo for campo in update_fields if campo not in CAMPI_CONTROLLO_IP]
+            if not update_fields:
+                # Heartbeat: solo la riga stretta, la riga principale (e data_modifica) non cambia
+                if salva_controllo:
+                    self._salva_controllo(using=kwargs.get('using'), nuovo=nuovo)
+                return
+            derivati = ['ip_numerico']
+            if CAMPI_ANOMALO_IP.intersection(update_fields):
+                derivati.append('anomalo')
+            if 'mac_address' in update_fields:
+                derivati.append('mac_numerico')
+            kwargs['update_fields'] = list(update_fields) + [c for c in derivati if c not in update_fields]
+        if update_fields is not None and not CAMPI_CONTATORI_IP.intersection(update_fields):
+            super().save(*args, **kwargs)
+        else:
+            # I contatori della VLAN vecchia e nuova vengono aggiornati nella stessa transazione
+            with transaction.atomic():
+                prima = self._contatori_in_db(blocca=True)
+                super().save(*args, **kwargs)
+                dopo = self._contatori_in_db() if update_fields is not None else self._contatori()
+                Vlan.applica_variazioni_contatori(prima, dopo)
+        if salva_controllo:
+            self._salva_controllo(using=kwargs.get('using'), nuovo=nuovo)
+        if update_fields is None or CAMPI_RICERCA_IP.intersection(update_fields):
+            from .ricerca import aggiorna_token_ricerca
+            aggiorna_token_ricerca([self.pk])
+
+    def _get_controllo(self):
+        """
+        Riga dei controlli di rete dell'IP, creata in memoria se non esiste ancora
+
+        Per un IP nuovo il primo controllo è la creazione; un IP già salvato senza
+        riga non è mai stato controllato e ha ultimo_controllo None.
+        """
+        if not self._state.adding or type(self).controllo.is_cached(self):
+            try:
+                return self.controllo
+            except ControlloIP.DoesNotExist:
+                pass
+        # L'assegnazione della relazione 1:1 la mette anche nella cache dell'IP
+        if self._state.adding:
+            return ControlloIP(indirizzo_ip=self)
+        return ControlloIP(indirizzo_ip=self, ultimo_controllo=None)
+
+    def _salva_controllo(self, using=None, nuovo=False):
+        controllo = self._get_controllo()
+        if nuovo and controllo.ultimo_controllo is None:
+            # La creazione dell'IP vale come primo controllo
+            controllo.ultimo_controllo = timezone.now()
+        # Senza un controllo registrato non c'è nulla da salvare (la colonna è obbligatoria)
+        if controllo.ultimo_controllo is not None:
+            controllo.save(using=using)
+
+    @property
+    def ultimo_controllo(self):
+        return self._get_controllo().ultimo_controllo
+
+    @ultimo_controllo.setter
+    def ultimo_controllo(self, valore):
+        self._get_controllo().ultimo_controllo = valore
+
+    @property
+    def ultimo_mac(self):
+        return self._get_controllo().ultimo_mac
+
+    @property
+    def ultima_sorgente(self):
+        return self._get_controllo().ultima_sorgente
+
+    def registra_controllo(self, stato='attivo', mac_address=None, sorgente=None, quando=None):
+        """
+        Registra un heartbeat di un collector
+
+        Scrive ultimo controllo, ultimo MAC e sorgente nella tabella stretta
+        ControlloIP; stato e MAC della riga principale vengono salvati solo se
+        cambiano, senza aggiornare data_modifica.
+
+        Args:
+            stato: Stato rilevato (default: attivo)
+            mac_address: MAC rilevato, opzionale
+            sorgente: Collector che ha rilevato l'IP (es. nome del router), opzionale
+            quando: Istante del controllo (default: adesso)
+        """
+        self.save(update_fields=self.applica_controllo(stato, mac_address, sorgente, quando))
+
+    def applica_controllo(self, stato='attivo', mac_address=None, sorgente=None, quando=None):
+        """
+        Applica in memoria un heartbeat (vedi registra_controllo) senza salvarlo
+
+        Returns:
+            list: Campi da salvare (update_fields o bulk_update)
+        """
+        controllo = self._get_controllo()
+        controllo.ultimo_controllo = quando or timezone.now()
+        mac_address = normalizza_mac(mac_address)
+        if mac_address:
+            controllo.ultimo_mac = mac_address
+        if sorgente:
+            controllo.ultima_sorgente = sorgente
+
+        campi = ['ultimo_controllo']
+        if mac_address:
+            campi.append('ultimo_mac')
+        if sorgente:
+            campi.append('ultima_sorgente')
+        if stato and stato != self.stato:
+            self.stato = stato
+            campi.append('stato')
+        if mac_address and mac_address != self.mac_address:
+            self.mac_address = mac_address
+            campi.append('mac_address')
+        return campi
+
+    def allinea_campi_derivati(self):
+        """
+        Allinea le colonne derivate: IP numerico (ordinamento e intervalli),
+        MAC canonico e numerico (ricerche esatte) e flag anomalo
+        """
+        self.ip_numerico = ip_a_intero(self.ip)
+        self.mac_address = normalizza_mac(self.mac_address)
+        self.mac_numerico = mac_a_intero(self.mac_address)
+        self.anomalo = self.is_anomalo()
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            prima = self._contatori_in_db(blocca=True)
+            risultato = super().delete(*args, **kwargs)
+            Vlan.applica_variazioni_contatori(prima, {})
+        return risultato
+
+    def _contatori(self, vlan_id=None, stato=None, disponibilita=None, responsabile=None, da_istanza=True):
+        """Contributo dell'IP ai contatori della sua VLAN: {numero_vlan: {contatore: 0/1}}"""
+        if da_istanza:
+            vlan_id, stato, disponibilita, responsabile = (
+                self.vlan_id, self.stato, self.disponibilita, self.responsabile
+            )
+        if vlan_id is None:
+            return {}
+        return {vlan_id: {
+            'num_indirizzi': 1,
+            'num_attivi': int(stato == 'attivo'),
+            'num_usati': int(disponibilita == 'usato'),
+            'num_liberi': int(disponibilita == 'libero'),
+            'num_riservati': int(disponibilita == 'riservato'),
+            'num_anomali': int(stato == 'attivo' and (disponibilita == 'libero' or not responsabile)),
+        }}
+
+    def _contatori_in_db(self, blocca=False):
+        """Contributo ai contatori della riga salvata in database ({} se non esiste)"""
+        righe = type(self)._base_manager.filter(pk=self.pk)
+        if blocca:
+            righe = righe.select_for_update()
+        riga = righe.values_list('vlan_id', 'stato', 'disponibilita', 'responsabile').first()
+        if riga is None:
+            return {}
+        return self._contatori(*riga, da_istanza=False)
+    
     def is_scaduto(self):
         """Verifica se l'indirizzo IP è scaduto"""
         if self.data_scadenza:
@@ -417,26 +1167,245 @@ class IndirizzoIP(models.Model):
     @classmethod
     def objects_ordered_by_ip(cls):
         """
-        Restituisce un queryset ordinato numericamente per IP usando INET_ATON di MySQL
+        Restituisce un queryset ordinato numericamente per IP tramite la colonna indicizzata ip_numerico
         
         Returns:
             QuerySet: QuerySet ordinato per IP numerico
         """
-        from django.db import connection
-        if 'mysql' in connection.vendor:
-            # MySQL: usa INET_ATON per ordinamento numerico
-            return cls.objects.extra(
-                select={'ip_as_int': 'INET_ATON(ip)'}, 
-                order_by=['ip_as_int']
-            )
-        else:
-            # Fallback per altri database: ordinamento alfabetico
-            return cls.objects.order_by('ip')
+        return cls.objects.ordinati_per_ip()
+
+    @classmethod
+    def disattiva_ip_inattivi(cls, ore, dry_run=False, chunk_size=1000, sample_size=20):
+        """
+        Disattiva tutti gli IP attivi non visti da più di X ore
+
+        Usa l'indice su ControlloIP.ultimo_controllo e aggiorna a blocchi di
+        chunk_size righe con un singolo UPDATE per blocco, senza caricare i
+        modelli. Gli IP senza riga di controllo (mai visti da un collector)
+        sono inattivi. La disattivazione non è una modifica amministrativa e
+        lascia invariata data_modifica.
+
+        Args:
+            ore: Soglia di inattività in ore
+            dry_run: Se True conta i candidati senza modificarli
+            chunk_size: Numero massimo di righe aggiornate per UPDATE
+            sample_size: Numero massimo di IP restituiti come campione
+
+        Returns:
+            dict: {'soglia': datetime, 'disattivati': int, 'campione': list}
+        """
+        now = timezone.now()
+        soglia = now - timezone.timedelta(hours=ore)
+        inattivi = Q(controllo__isnull=True) | Q(controllo__ultimo_controllo__lt=soglia)
+        candidati = cls.objects.filter(inattivi, stato='attivo')
+        campo_campione = {'ultimo_controllo': F('controllo__ultimo_controllo')}
+
+        if dry_run:
+            return {
+                'soglia': soglia,
+                'disattivati': candidati.count(),
+                'campione': list(candidati.order_by('controllo__ultimo_controllo').values(
+                    'ip', 'responsabile', **campo_campione)[:sample_size]),
+            }
 
+        disattivati = 0
+        campione = []
+        while True:
+            # Gli IP aggiornati escono dal filtro: basta rileggere il primo blocco
+            blocco = list(candidati.order_by('controllo__ultimo_controllo').values(
+                'ip', 'responsabile', **campo_campione)[:chunk_size])
+            if not blocco:
+                break
 
-class StoricoResponsabile(models.Model):
+            aggiornati = cls.objects.filter(
+                inattivi,
+                ip__in=[riga['ip'] for riga in blocco],
+                stato='attivo'
+            ).update(stato='disattivo')
+
+            disattivati += aggiornati
+            if len(campione) < sample_size:
+                campione.extend(blocco[:sample_size - len(campione)])
+            if aggiornati == 0:
+                # Righe modificate in parallelo da un altro processo
+                break
+
+        return {'soglia': soglia, 'disattivati': disattivati, 'campione': campione}
+
+    @classmethod
+    def rilascia_ip_inattivi(cls, giorni, motivo='inattivita', note=None, created_by=None,
+                             dry_run=False, chunk_size=1000, sample_size=20):
+        """
+        Rilascia in blocco gli IP usati ma disattivi da più di X giorni
+
+        Gli IP senza riga di controllo (mai visti da un collector) sono
+        candidati come quelli non visti da più di X giorni.
+
+        Produce lo stesso storico di rilascia_ip() per ogni IP, ma con poche
+        query per blocco: un UPDATE che chiude i record aperti dello storico,
+        un bulk_create dei record di rilascio e un UPDATE che libera gli IP,
+        tutti nella stessa transazione.
+
+        Args:
+            giorni: Soglia di inattività in giorni
+            motivo: Motivo del cambio (da StoricoResponsabile.MOTIVO_CHOICES)
+            note: Note aggiuntive per lo storico
+            created_by: Chi ha effettuato il rilascio
+            dry_run: Se True conta i candidati senza modificarli
+            chunk_size: Numero massimo di IP rilasciati per transazione
+            sample_size: Numero massimo di IP restituiti come campione
+
+        Returns:
+            dict: {'soglia': datetime, 'rilasciati': int, 'campione': list}
+        """
+        soglia = timezone.now() - timezone.timedelta(days=giorni)
+        candidati = cls.objects.filter(
+            Q(controllo__isnull=True) | Q(controllo__ultimo_controllo__lte=soglia),
+            disponibilita='usato',
+            stato='disattivo'
+        ).exclude(
+            Q(responsabile__isnull=True) | Q(responsabile='')
+        ).order_by('controllo__ultimo_controllo')
+        campi = ('ip', 'responsabile', 'utente_finale', 'stato', 'vlan_id')
+        ultimo_controllo = F('controllo__ultimo_controllo')
+
+        def _campione(righe):
+            return [
+                {'ip': r['ip'], 'era_assegnato_a': r['responsabile'], 'ultimo_controllo': r['ultimo_controllo']}
+                for r in righe
+            ]
+
+        if dry_run:
+            return {
+                'soglia': soglia,
+                'rilasciati': candidati.count(),
+                'campione': _campione(candidati.values(*campi, ultimo_controllo=ultimo_controllo)[:sample_size]),
+            }
+
+        note = note or f"IP rilasciato - {motivo}"
+        created_by = created_by or 'sistema'
+        rilasciati = 0
+        campione = []
+        while True:
+            with transaction.atomic():
+                blocco = list(candidati.select_for_update().values(
+                    *campi, ultimo_controllo=ultimo_controllo)[:chunk_size])
+                if not blocco:
+                    break
+                now = timezone.now()
+                ips = [r['ip'] for r in blocco]
+
+                # Chiude il record aperto più recente di ogni IP (come get_responsabile_attuale_da_storico)
+                record_aperti = {}
+                for record_id, ip in StoricoResponsabile.objects.filter(
+                    indirizzo_ip_id__in=ips, data_fine__isnull=True
+                ).order_by('indirizzo_ip_id', '-data_inizio').values_list('id', 'indirizzo_ip_id'):
+                    record_aperti.setdefault(ip, record_id)
+                StoricoResponsabile.objects.filter(id__in=record_aperti.values()).update(
+                    data_fine=now,
+                    note=Concat(
+                        Coalesce(F('note'), Value('')),
+                        Value(f"\n[{now.strftime('%d/%m/%Y %H:%M')}] {note}"),
+                        output_field=models.TextField()
+                    )
+                )
+
+                StoricoResponsabile.objects.bulk_create([
+                    StoricoResponsabile(
+                        indirizzo_ip_id=r['ip'],
+                        responsabile=None,
+                        utente_finale=None,
+                        data_inizio=now,
+                        motivo_cambio=motivo,
+                        note=f"Rilasciato da {r['responsabile'] or 'N/A'} ({r['utente_finale'] or 'N/A'}). {note}",
+                        stato_rete=r['stato'],
+                        disponibilita='libero',
+                        vlan_id=r['vlan_id'],
+                        created_by=created_by
+                    )
+                    for r in blocco
+                ])
+
+                cls.objects.filter(ip__in=ips).update(
+                    responsabile=None,
+                    utente_finale=None,
+                    assegnato_a_utente=None,
+                    disponibilita='libero',
+                    note=None,
+                    data_modifica=now
+                )
+
+            rilasciati += len(blocco)
+            if len(campione) < sample_size:
+                campione.extend(_campione(blocco[:sample_size - len(campione)]))
+
+        return {'soglia': soglia, 'rilasciati': rilasciati, 'campione': campione}
+
+
+class ControlloIP(models.Model):
     """
-    Modello per tracciare lo storico dei responsabili di un indirizzo IP
+    Dati ad alta frequenza dei controlli di rete di un IP (tabella stretta 1:1)
+
+    Gli heartbeat dei collector aggiornano solo questa riga, senza riscrivere
+    la riga di IndirizzoIP (note comprese) né la sua data_modifica, che resta
+    riservata alle modifiche amministrative. Sull'IP i campi sono esposti come
+    proprietà (ultimo_controllo, ultimo_mac, ultima_sorgente).
+    """
+    indirizzo_ip = models.OneToOneField(IndirizzoIP, on_delete=models.CASCADE, primary_key=True,
+                                        related_name='controllo', verbose_name=_("Indirizzo IP"))
+    ultimo_controllo = models.DateTimeField(default=timezone.now, db_index=True, verbose_name=_("Ultimo Controllo"))
+    ultimo_mac = models.CharField(max_length=17, blank=True, null=True, verbose_name=_("Ultimo MAC rilevato"))
+    ultima_sorgente = models.CharField(max_length=100, blank=True, default='', verbose_name=_("Ultima sorgente"),
+                                       help_text=_("Collector che ha rilevato l'IP per ultimo (es. nome del router)"))
+
+    class Meta:
+        verbose_name = _("Controllo IP")
+        verbose_name_plural = _("Controlli IP")
+
+    def __str__(self):
+        return f"{self.indirizzo_ip_id} - {self.ultimo_controllo}"
+
+
+@receiver(post_save, sender=IndirizzoIP)
+@receiver(post_delete, sender=IndirizzoIP)
+def invalida_cache_ip(sender, instance, using, **kwargs):
+    """Le risposte in cache dell'IP salvato o eliminato non sono più valide"""
+    invalida('ip', instance.pk, using=using)
+
+
+@receiver(post_save, sender=ControlloIP)
+def invalida_cache_controllo_ip(sender, instance, using, **kwargs):
+    """Gli heartbeat salvano solo ControlloIP: invalidano comunque le risposte dell'IP"""
+    invalida('ip', instance.indirizzo_ip_id, using=using)
+
+
+class TokenRicerca(models.Model):
+    """
+    Token dei campi testuali di un IP, per la ricerca su database senza FULLTEXT
+
+    Su MariaDB/MySQL la ricerca usa l'indice FULLTEXT e la tabella resta vuota;
+    sugli altri database (es. SQLite in sviluppo) viene mantenuta a ogni
+    modifica di responsabile, utente finale e note (vedi ricerca.py).
+    """
+    indirizzo_ip = models.ForeignKey(IndirizzoIP, on_delete=models.CASCADE, related_name='token_ricerca',
+                                     verbose_name=_("Indirizzo IP"))
+    token = models.CharField(max_length=64, verbose_name=_("Token"))
+
+    class Meta:
+        verbose_name = _("Token di ricerca")
+        verbose_name_plural = _("Token di ricerca")
+        unique_together = [('indirizzo_ip', 'token')]
+        indexes = [
+            models.Index(fields=['token', 'indirizzo_ip']),
+        ]
+
+    def __str__(self):
+        return f"{self.indirizzo_ip_id}: {self.token}"
+
+
+class StoricoResponsabileBase(models.Model):
+    """
+    Campi e metodi comuni allo storico dei responsabili e al suo archivio
     """
     MOTIVO_CHOICES = [
         ('assegnazione', _('Assegnazione Iniziale')),
@@ -448,9 +1417,6 @@ class StoricoResponsabile(models.Model):
         ('admin', _('Modifica Amministratore')),
     ]
     
-    indirizzo_ip = models.ForeignKey(IndirizzoIP, on_delete=models.CASCADE, 
-                                   related_name='storico_responsabili', 
-                                   verbose_name=_("Indirizzo IP"), db_index=True)
     responsabile = models.EmailField(max_length=255, blank=True, null=True, 
                                    verbose_name=_("Mail Responsabile"), db_index=True)
     utente_finale = models.CharField(max_length=255, blank=True, null=True, 
@@ -477,14 +1443,7 @@ class StoricoResponsabile(models.Model):
                                 help_text=_("Sistema o utente che ha creato il record"))
     
     class Meta:
-        verbose_name = _("Storico Responsabile")
-        verbose_name_plural = _("Storico Responsabili")
-        ordering = ['-data_inizio']
-        indexes = [
-            models.Index(fields=['indirizzo_ip', '-data_inizio']),
-            models.Index(fields=['responsabile', '-data_inizio']),
-            models.Index(fields=['data_inizio', 'data_fine']),
-        ]
+        abstract = True
     
     def __str__(self):
         if self.responsabile:
@@ -513,18 +1472,422 @@ class StoricoResponsabile(models.Model):
         return self.data_fine is None
 
     @classmethod
-    def order_by_inet_aton(cls, ip_field):
+    def order_by_inet_aton(cls, ip_field='indirizzo_ip'):
         """
-        Ordina i queryset di IP numericamente usando INET_ATON di MySQL
+        Ordina i record dello storico numericamente per IP tramite la colonna ip_numerico
         
         Args:
-            ip_field: Campo del modello che contiene l'indirizzo IP
+            ip_field: Nome della relazione verso IndirizzoIP
             
         Returns:
             QuerySet: QuerySet ordinato
         """
-        return cls.objects.extra(select={'ip_aton': 'INET_ATON(%s)' % ip_field}, order_by='ip_aton')
+        return cls.objects.order_by(f'{ip_field}__ip_numerico')
     
     def get_ip_aton(self):
         """Restituisce il valore INET_ATON dell'indirizzo IP"""
-        return ipaddress.IPv4Address(self.indirizzo_ip.ip).packed.hex() 
\ No newline at end of file
+        return ipaddress.IPv4Address(self.indirizzo_ip.ip).packed.hex()
+
+
+class StoricoResponsabile(StoricoResponsabileBase):
+    """
+    Modello per tracciare lo storico dei responsabili di un indirizzo IP
+
+    Contiene i record aperti e quelli chiusi di recente: i record chiusi da più
+    di N giorni vengono spostati in StoricoResponsabileArchivio dal comando
+    archivia_storico, così che la tabella e i suoi indici restino piccoli.
+    """
+    indirizzo_ip = models.ForeignKey(IndirizzoIP, on_delete=models.CASCADE, 
+                                   related_name='storico_responsabili', 
+                                   verbose_name=_("Indirizzo IP"), db_index=True)
+
+    class Meta:
+        verbose_name = _("Storico Responsabile")
+        verbose_name_plural = _("Storico Responsabili")
+        ordering = ['-data_inizio']
+        indexes = [
+            models.Index(fields=['indirizzo_ip', '-data_inizio']),
+            models.Index(fields=['responsabile', '-data_inizio']),
+            models.Index(fields=['data_inizio', 'data_fine']),
+        ]
+
+    @classmethod
+    def archivia_chiusi(cls, giorni, dry_run=False, chunk_size=1000):
+        """
+        Sposta nell'archivio i record chiusi da più di X giorni
+
+        Ogni blocco è una transazione: SELECT FOR UPDATE dei record, bulk_create
+        nell'archivio (con lo stesso id) e DELETE per chiave primaria.
+
+        Args:
+            giorni: Età minima di data_fine in giorni
+            dry_run: Se True conta i record senza spostarli
+            chunk_size: Numero massimo di record spostati per transazione
+
+        Returns:
+            dict: {'soglia': datetime, 'archiviati': int}
+        """
+        soglia = timezone.now() - timezone.timedelta(days=giorni)
+        candidati = cls.objects.filter(data_fine__isnull=False, data_fine__lt=soglia).order_by('pk')
+        if dry_run:
+            return {'soglia': soglia, 'archiviati': candidati.count()}
+
+        campi = [f.attname for f in cls._meta.concrete_fields]
+        archiviati = 0
+        while True:
+            with transaction.atomic():
+                blocco = list(candidati.select_for_update().values(*campi)[:chunk_size])
+                if not blocco:
+                    break
+                adesso = timezone.now()
+                StoricoResponsabileArchivio.objects.bulk_create(
+                    [StoricoResponsabileArchivio(archiviato_il=adesso, **riga) for riga in blocco],
+                    ignore_conflicts=True
+                )
+                cls.objects.filter(pk__in=[riga['id'] for riga in blocco]).delete()
+            archiviati += len(blocco)
+
+        return {'soglia': soglia, 'archiviati': archiviati}
+
+
+class StoricoResponsabileArchivio(StoricoResponsabileBase):
+    """
+    Record chiusi dello storico dei responsabili, spostati fuori dalla tabella principale
+
+    Mantiene l'id originale del record; non è incluso nelle risposte di
+    /api/ips/ ed è consultabile dall'admin e da /api/history-archive/.
+    """
+    id = models.BigIntegerField(primary_key=True, verbose_name=_("ID"))
+    indirizzo_ip = models.ForeignKey(IndirizzoIP, on_delete=models.CASCADE,
+                                     related_name='storico_archiviato',
+                                     verbose_name=_("Indirizzo IP"))
+    vlan = models.ForeignKey(Vlan, on_delete=models.SET_NULL, blank=True, null=True,
+                             related_name='+', verbose_name=_("VLAN al momento"))
+    # Conserva la data di creazione originale invece di valorizzarla all'archiviazione
+    created_at = models.DateTimeField(verbose_name=_("Creato il"))
+    archiviato_il = models.DateTimeField(default=timezone.now, verbose_name=_("Archiviato il"))
+
+    class Meta:
+        verbose_name = _("Storico Responsabile archiviato")
+        verbose_name_plural = _("Storico Responsabili archiviati")
+        ordering = ['-data_inizio']
+        indexes = [
+            models.Index(fields=['indirizzo_ip', '-data_inizio']),
+            models.Index(fields=['responsabile', '-data_inizio']),
+        ] 
+
+def normalizza_mac_avvistamento(mac_address):
+    """Forma canonica dei MAC negli avvistamenti (stringa vuota se assente)"""
+    return normalizza_mac(mac_address) or ''
+
+
+class AvvistamentoIPQuerySet(models.QuerySet):
+    """Ricerche sugli avvistamenti per IP, MAC e periodo (coperte dagli indici del modello)"""
+
+    def per_ip(self, ip_address):
+        return self.filter(ip=ip_address)
+
+    def per_mac(self, mac_address):
+        return self.filter(mac_address=normalizza_mac_avvistamento(mac_address))
+
+    def nel_periodo(self, inizio=None, fine=None):
+        """Intervalli che si sovrappongono al periodo [inizio, fine] (estremi opzionali)"""
+        queryset = self
+        if inizio is not None:
+            queryset = queryset.filter(ultimo_avvistamento__gte=inizio)
+        if fine is not None:
+            queryset = queryset.filter(primo_avvistamento__lte=fine)
+        return queryset
+
+
+class AvvistamentoIP(models.Model):
+    """
+    Intervallo in cui un IP è stato visto con un certo MAC da una sorgente
+
+    Gli avvistamenti consecutivi della stessa coppia IP/MAC dalla stessa
+    sorgente estendono l'intervallo aperto (un UPDATE di ultimo_avvistamento)
+    invece di aggiungere righe; un'assenza più lunga della soglia configurata
+    (AVVISTAMENTI_INTERVALLO_MAX_MINUTI) apre un nuovo intervallo.
+    """
+    ip = models.GenericIPAddressField(protocol='IPv4', verbose_name=_("Indirizzo IP"))
+    mac_address = models.CharField(max_length=17, blank=True, default='', verbose_name=_("MAC Address"))
+    sorgente = models.CharField(max_length=100, verbose_name=_("Sorgente"),
+                                help_text=_("Router, firewall o altro dispositivo che ha rilevato l'IP"))
+    primo_avvistamento = models.DateTimeField(verbose_name=_("Primo avvistamento"))
+    ultimo_avvistamento = models.DateTimeField(verbose_name=_("Ultimo avvistamento"))
+    num_avvistamenti = models.PositiveIntegerField(default=1, verbose_name=_("Numero avvistamenti"))
+
+    objects = AvvistamentoIPQuerySet.as_manager()
+
+    class Meta:
+        verbose_name = _("Avvistamento IP")
+        verbose_name_plural = _("Avvistamenti IP")
+        ordering = ['-ultimo_avvistamento']
+        indexes = [
+            # "Chi ha usato l'IP X / il MAC Y tra T1 e T2"
+            models.Index(fields=['ip', 'ultimo_avvistamento']),
+            models.Index(fields=['mac_address', 'ultimo_avvistamento']),
+            # Ricerca degli intervalli aperti durante la registrazione
+            models.Index(fields=['sorgente', 'ip', 'ultimo_avvistamento']),
+        ]
+
+    def __str__(self):
+        return (f"{self.ip} - {self.mac_address or 'N/A'} via {self.sorgente} "
+                f"({self.primo_avvistamento.strftime('%d/%m/%Y %H:%M')} - "
+                f"{self.ultimo_avvistamento.strftime('%d/%m/%Y %H:%M')})")
+
+    @property
+    def durata(self):
+        return self.ultimo_avvistamento - self.primo_avvistamento
+
+    @classmethod
+    def soglia_intervallo(cls):
+        """Assenza massima oltre la quale un nuovo avvistamento apre un nuovo intervallo"""
+        from django.conf import settings
+        return timezone.timedelta(minutes=getattr(settings, 'AVVISTAMENTI_INTERVALLO_MAX_MINUTI', 120))
+
+    @classmethod
+    def registra(cls, avvistamenti, sorgente, quando=None, chunk_size=1000):
+        """
+        Registra in blocco gli avvistamenti di un passaggio di raccolta
+
+        Per ogni blocco: una SELECT degli intervalli aperti della sorgente, un
+        solo UPDATE che li estende e un bulk_create per le coppie IP/MAC nuove
+        o riapparse dopo un'assenza più lunga della soglia.
+
+        Args:
+            avvistamenti: Iterabile di coppie (ip, mac) o dict {ip: mac}
+            sorgente: Nome del dispositivo che ha rilevato gli IP
+            quando: Momento dell'avvistamento (default: adesso)
+            chunk_size: Numero massimo di IP per blocco
+
+        Returns:
+            dict: {'estesi': int, 'nuovi': int, 'scartati': int}
+        """
+        quando = quando or timezone.now()
+        inizio_finestra = quando - cls.soglia_intervallo()
+        if isinstance(avvistamenti, dict):
+            avvistamenti = avvistamenti.items()
+
+        coppie = {}
+        scartati = 0
+        for ip_address, mac_address in avvistamenti:
+            if ip_a_intero(ip_address) is None:
+                scartati += 1
+                continue
+            coppie[(str(ip_address).strip(), normalizza_mac_avvistamento(mac_address))] = True
+        coppie = list(coppie)
+
+        estesi = 0
+        nuovi = 0
+        for i in range(0, len(coppie), chunk_size):
+            blocco = coppie[i:i + chunk_size]
+            with transaction.atomic():
+                aperti = {}
+                for pk, ip_address, mac_address in cls.objects.filter(
+                    sorgente=sorgente,
+                    ip__in={ip_address for ip_address, _mac in blocco},
+                    ultimo_avvistamento__gte=inizio_finestra,
+                    primo_avvistamento__lte=quando,
+                ).order_by('ultimo_avvistamento').values_list('pk', 'ip', 'mac_address'):
+                    # Vince l'intervallo più recente
+                    aperti[(ip_address, mac_address)] = pk
+
+                da_estendere = [aperti[coppia] for coppia in blocco if coppia in aperti]
+                if da_estendere:
+                    estesi += cls.objects.filter(
+                        pk__in=da_estendere, ultimo_avvistamento__lt=quando
+                    ).update(
+                        ultimo_avvistamento=quando,
+                        num_avvistamenti=F('num_avvistamenti') + 1
+                    )
+
+                da_creare = [
+                    cls(ip=ip_address, mac_address=mac_address, sorgente=sorgente,
+                        primo_avvistamento=quando, ultimo_avvistamento=quando)
+                    for ip_address, mac_address in blocco if (ip_address, mac_address) not in aperti
+                ]
+                cls.objects.bulk_create(da_creare)
+                nuovi += len(da_creare)
+
+        return {'estesi': estesi, 'nuovi': nuovi, 'scartati': scartati}
+
+
+class OsservazioneIP(models.Model):
+    """
+    Osservazione grezza di un IP da parte di un collector (tabella di appoggio)
+
+    Tabella in sola aggiunta, senza vincoli verso IndirizzoIP: l'API di
+    ingestione vi scrive con una validazione minima e senza toccare le tabelle
+    principali. unisci() la riversa periodicamente su IP, controlli di rete e
+    avvistamenti con poche istruzioni sull'intero intervallo, poi lo elimina.
+    """
+    id = models.BigAutoField(primary_key=True)
+    ip = models.GenericIPAddressField(protocol='IPv4', verbose_name=_("Indirizzo IP"))
+    mac_address = models.CharField(max_length=17, blank=True, default='', verbose_name=_("MAC Address"))
+    mac_numerico = models.PositiveBigIntegerField(blank=True, null=True, verbose_name=_("MAC numerico"))
+    sorgente = models.CharField(max_length=100, verbose_name=_("Sorgente"))
+    visto_il = models.DateTimeField(default=timezone.now, verbose_name=_("Visto il"))
+
+    class Meta:
+        verbose_name = _("Osservazione IP")
+        verbose_name_plural = _("Osservazioni IP")
+        indexes = [
+            # Ultima osservazione di ogni IP durante l'unione
+            models.Index(fields=['ip', 'visto_il']),
+        ]
+
+    def __str__(self):
+        return f"{self.ip} - {self.mac_address or 'N/A'} via {self.sorgente}"
+
+    @classmethod
+    def accoda(cls, osservazioni, sorgente, quando=None, chunk_size=1000):
+        """
+        Aggiunge le osservazioni di un passaggio di raccolta alla tabella di appoggio
+
+        Args:
+            osservazioni: Iterabile di coppie (ip, mac) o dict {ip: mac}
+            sorgente: Nome del dispositivo che ha rilevato gli IP
+            quando: Momento dell'osservazione (default: adesso)
+            chunk_size: Numero massimo di righe per INSERT
+
+        Returns:
+            dict: {'accodate': int, 'scartate': int}
+        """
+        quando = quando or timezone.now()
+        if isinstance(osservazioni, dict):
+            osservazioni = osservazioni.items()
+
+        righe = []
+        scartate = 0
+        for ip_address, mac_address in osservazioni:
+            if ip_a_intero(ip_address) is None:
+                scartate += 1
+                continue
+            mac_address = normalizza_mac_avvistamento(mac_address)
+            righe.append(cls(ip=str(ip_address).strip(), mac_address=mac_address,
+                             mac_numerico=mac_a_intero(mac_address), sorgente=sorgente, visto_il=quando))
+        cls.objects.bulk_create(righe, batch_size=chunk_size)
+        return {'accodate': len(righe), 'scartate': scartate}
+
+    @classmethod
+    def unisci(cls, chunk_size=1000):
+        """
+        Riversa le osservazioni accodate fino ad ora e le elimina
+
+        L'intervallo è fissato dall'id massimo letto all'inizio: le osservazioni
+        che arrivano durante l'unione restano per il passaggio successivo.
+        Per ogni IP conta l'osservazione più recente:
+
+        - IP nuovi: creati come attivi e liberi, con la VLAN dall'indice in memoria
+        - IP esistenti senza riga di controllo: riga creata dall'osservazione più recente
+        - ControlloIP: un solo UPDATE con sottoquery correlate (ultimo
+          controllo, ultimo MAC, ultima sorgente)
+        - IndirizzoIP: un UPDATE per gli IP che tornano attivi e uno per quelli
+          con MAC cambiato, senza toccare data_modifica
+        - avvistamenti: AvvistamentoIP.registra() per ogni sorgente
+
+        Returns:
+            dict: {'osservazioni', 'ip', 'nuovi', 'riattivati', 'mac_cambiati'}
+        """
+        from .indice_vlan import get_indice_vlan
+
+        risultato = {'osservazioni': 0, 'ip': 0, 'nuovi': 0, 'riattivati': 0, 'mac_cambiati': 0}
+        limite = cls.objects.aggregate(limite=Max('id'))['limite']
+        if limite is None:
+            return risultato
+
+        intervallo = cls.objects.filter(id__lte=limite)
+        ips_intervallo = intervallo.values('ip')
+
+        def _ultima(campo_ip, con_mac=False):
+            righe = intervallo.filter(ip=OuterRef(campo_ip))
+            if con_mac:
+                righe = righe.filter(mac_numerico__isnull=False)
+            return righe.order_by('-visto_il', '-id')
+
+        def _completa_controlli(ips):
+            # Righe appena create: MAC e sorgente dalle osservazioni più recenti
+            ControlloIP.objects.filter(indirizzo_ip__in=ips).update(
+                ultimo_mac=Subquery(_ultima('indirizzo_ip', con_mac=True).values('mac_address')[:1]),
+                ultima_sorgente=Subquery(_ultima('indirizzo_ip').values('sorgente')[:1]),
+            )
+
+        with transaction.atomic():
+            risultato['osservazioni'] = intervallo.count()
+            risultato['ip'] = intervallo.values('ip').distinct().count()
+
+            # IP mai visti: pochi per passaggio, creati con l'ORM per contatori, flag e token
+            nuovi = list(intervallo.exclude(
+                ip__in=IndirizzoIP._base_manager.values('pk')
+            ).values('ip').annotate(ultimo_id=Max('id')).values_list('ultimo_id', flat=True))
+            if nuovi:
+                righe = list(cls.objects.filter(id__in=nuovi).values_list('ip', 'mac_address', 'sorgente', 'visto_il'))
+                vlan = get_indice_vlan().resolve_many([riga[0] for riga in righe])
+                IndirizzoIP.objects.bulk_create([
+                    IndirizzoIP(
+                        ip=ip_address,
+                        mac_address=mac_address or None,
+                        stato='attivo',
+                        disponibilita='libero',
+                        vlan_id=vlan.get(ip_address),
+                        note=f"Rilevato da {sorgente}: {timezone.localtime(visto_il).strftime('%Y-%m-%d %H:%M')}",
+                        ultimo_controllo=visto_il,
+                    )
+                    for ip_address, mac_address, sorgente, visto_il in righe
+                ], ignore_conflicts=True)
+                _completa_controlli([riga[0] for riga in righe])
+                risultato['nuovi'] = len(righe)
+
+            # IP esistenti senza riga di controllo (creati da API, admin o import): l'UPDATE
+            # dei heartbeat tocca solo righe esistenti, la riga parte dall'ultima osservazione
+            senza_controllo = list(intervallo.filter(
+                ip__in=IndirizzoIP._base_manager.filter(controllo__isnull=True).values('pk')
+            ).values('ip').annotate(ultimo_id=Max('id')).values_list('ultimo_id', flat=True))
+            if senza_controllo:
+                righe = list(cls.objects.filter(id__in=senza_controllo).values_list('ip', 'visto_il'))
+                ControlloIP.objects.bulk_create(
+                    [ControlloIP(indirizzo_ip_id=ip_address, ultimo_controllo=visto_il) for ip_address, visto_il in righe],
+                    batch_size=chunk_size, ignore_conflicts=True
+                )
+                _completa_controlli([riga[0] for riga in righe])
+
+            # Heartbeat: solo la tabella stretta, e solo se l'osservazione è più recente
+            invalida('ip')
+            ultima = _ultima('indirizzo_ip')
+            ControlloIP.objects.filter(
+                indirizzo_ip__in=ips_intervallo,
+                ultimo_controllo__lt=Subquery(ultima.values('visto_il')[:1])
+            ).update(
+                ultimo_controllo=Subquery(ultima.values('visto_il')[:1]),
+                ultima_sorgente=Subquery(ultima.values('sorgente')[:1]),
+                ultimo_mac=Coalesce(
+                    Subquery(_ultima('indirizzo_ip', con_mac=True).values('mac_address')[:1]), F('ultimo_mac')
+                ),
+            )
+
+            # Transizioni di stato: passano da update() per contatori e flag anomalo
+            risultato['riattivati'] = IndirizzoIP.objects.filter(
+                pk__in=ips_intervallo, stato='disattivo'
+            ).update(stato='attivo')
+
+            ultimo_mac = _ultima('pk', con_mac=True)
+            risultato['mac_cambiati'] = IndirizzoIP.objects.filter(
+                pk__in=intervallo.filter(mac_numerico__isnull=False).values('ip')
+            ).filter(
+                Q(mac_numerico__isnull=True) | ~Q(mac_numerico=Subquery(ultimo_mac.values('mac_numerico')[:1]))
+            ).update(
+                mac_address=Subquery(ultimo_mac.values('mac_address')[:1]),
+                mac_numerico=Subquery(ultimo_mac.values('mac_numerico')[:1]),
+            )
+
+            # Storico degli avvistamenti: un passaggio per sorgente, all'istante più recente
+            for sorgente, quando in intervallo.values('sorgente').annotate(
+                quando=Max('visto_il')
+            ).values_list('sorgente', 'quando'):
+                coppie = intervallo.filter(sorgente=sorgente).values_list('ip', 'mac_address').distinct()
+                AvvistamentoIP.registra(coppie, sorgente, quando=quando, chunk_size=chunk_size)
+
+            intervallo.delete()
+
+        return risultato
@@ -0,0 +1,151 @@
+"""
+Ricerca testuale sugli indirizzi IP
+
+Un'unica funzione, cerca_indirizzi(), usata dall'elenco web, dalla pagina di
+ricerca, dal SearchFilter dell'API e dalla ricerca dell'admin:
+
+- MAC completo (qualsiasi formato): confronto esatto su mac_numerico
+- IP parziale (es. 192.168.1. o solo 192): prefisso sulla chiave primaria;
+  un frammento interno (es. 1.100) non trova 192.168.1.100
+- MAC parziale (es. aa:bb:cc): prefisso sul MAC canonico
+- altrimenti testo libero su responsabile, utente finale e note, con ogni
+  parola richiesta come prefisso e risultati ordinati per rilevanza
+
+Per il testo libero su MariaDB/MySQL si usa l'indice FULLTEXT creato dalla
+migrazione 0025; sugli altri database (SQLite in sviluppo) si usa la tabella
+TokenRicerca, mantenuta da IndirizzoIP.save() e dal QuerySet.
+"""
+import re
+from functools import reduce
+from operator import and_
+
+from django.db import connections, router, transaction
+from django.db.models import Count, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import IndirizzoIP, TokenRicerca, mac_a_intero
+
+RE_TOKEN = re.compile(r'\w+')
+RE_IP_PARZIALE = re.compile(r'^\d{1,3}(\.\d{0,3}){0,3}$')
+RE_MAC_PARZIALE = re.compile(r'^[0-9a-f]{2}([:-][0-9a-f]{0,2}){1,5}$', re.IGNORECASE)
+
+# Stessi campi di CAMPI_RICERCA_IP, nell'ordine dell'indice FULLTEXT
+COLONNE_RICERCA = ('responsabile', 'utente_finale', 'note')
+
+# Parole più corte di innodb_ft_min_token_size (default 3) non sono nell'indice FULLTEXT
+LUNGHEZZA_MINIMA_FULLTEXT = 3
+LUNGHEZZA_MASSIMA_TOKEN = 64
+
+
+def tokenizza(testo):
+    """Restituisce l'insieme delle parole (minuscole) contenute nel testo"""
+    if not testo:
+        return set()
+    return {token[:LUNGHEZZA_MASSIMA_TOKEN] for token in RE_TOKEN.findall(str(testo).lower())}
+
+
+def usa_fulltext(using=None):
+    """True se il database usa l'indice FULLTEXT invece della tabella dei token"""
+    alias = using or router.db_for_read(IndirizzoIP)
+    return connections[alias].vendor == 'mysql'
+
+
+def aggiorna_token_ricerca(chiavi, using=None):
+    """
+    Ricostruisce i token di ricerca degli IP indicati (nessuna operazione con FULLTEXT)
+
+    Args:
+        chiavi: Iterabile di indirizzi IP (chiavi primarie)
+        using: Alias del database (default: quello di scrittura di IndirizzoIP)
+    """
+    alias = using or router.db_for_write(IndirizzoIP)
+    chiavi = list(chiavi)
+    if not chiavi or usa_fulltext(alias):
+        return
+    righe = IndirizzoIP._base_manager.using(alias).filter(pk__in=chiavi).values_list('ip', *COLONNE_RICERCA)
+    nuovi = [
+        TokenRicerca(indirizzo_ip_id=ip, token=token)
+        for ip, *valori in righe
+        for token in tokenizza(' '.join(filter(None, valori)))
+    ]
+    with transaction.atomic(using=alias):
+        TokenRicerca.objects.using(alias).filter(indirizzo_ip__in=chiavi).delete()
+        TokenRicerca.objects.using(alias).bulk_create(nuovi, batch_size=1000)
+
+
+def _q_contiene(termine):
+    return reduce(lambda a, b: a | b, (Q(**{f'{campo}__icontains': termine}) for campo in COLONNE_RICERCA))
+
+
+def _cerca_testo(queryset, testo, ordina_per_rilevanza):
+    termini = sorted(tokenizza(testo))
+    if not termini:
+        # Solo simboli: confronto letterale come in passato
+        return queryset.filter(_q_contiene(testo))
+
+    if usa_fulltext(queryset.db):
+        lunghi = [termine for termine in termini if len(termine) >= LUNGHEZZA_MINIMA_FULLTEXT]
+        corti = [termine for termine in termini if len(termine) < LUNGHEZZA_MINIMA_FULLTEXT]
+        if corti:
+            queryset = queryset.filter(reduce(and_, (_q_contiene(termine) for termine in corti)))
+        if not lunghi:
+            return queryset
+        qn = connections[queryset.db].ops.quote_name
+        tabella = qn(queryset.model._meta.db_table)
+        colonne = ', '.join(f'{tabella}.{qn(colonna)}' for colonna in COLONNE_RICERCA)
+        # I termini sono solo caratteri di parola: nessun operatore booleano arriva dall'utente
+        rilevanza = RawSQL(
+            f'MATCH ({colonne}) AGAINST (%s IN BOOLEAN MODE)',
+            [' '.join(f'+{termine}*' for termine in lunghi)],
+            output_field=FloatField()
+        )
+        queryset = queryset.annotate(rilevanza=rilevanza).filter(rilevanza__gt=0)
+    else:
+        for termine in termini:
+            queryset = queryset.filter(
+                pk__in=TokenRicerca.objects.filter(token__startswith=termine).values('indirizzo_ip')
+            )
+        if not ordina_per_rilevanza:
+            return queryset
+        # Le parole trovate per intero pesano più dei semplici prefissi
+        queryset = queryset.annotate(
+            rilevanza=Count('token_ricerca', filter=Q(token_ricerca__token__in=termini))
+        )
+
+    if ordina_per_rilevanza:
+        queryset = queryset.order_by('-rilevanza', 'ip_numerico')
+    return queryset
+
+
+def cerca_indirizzi(testo, queryset=None, ordina_per_rilevanza=True, limite=None):
+    """
+    Cerca gli indirizzi IP che corrispondono al testo inserito dall'utente
+
+    Args:
+        testo: Testo della ricerca (IP, MAC, nome, note...)
+        queryset: QuerySet di partenza già filtrato (default: tutti gli IP)
+        ordina_per_rilevanza: Se True i risultati del testo libero sono ordinati
+            per rilevanza; se False resta l'ordinamento del chiamante
+        limite: Numero massimo di risultati (il QuerySet restituito è tagliato
+            e non può più essere filtrato né riordinato)
+
+    Returns:
+        QuerySet: Indirizzi IP trovati
+    """
+    if queryset is None:
+        queryset = IndirizzoIP.objects.all()
+    testo = (testo or '').strip()
+    if not testo:
+        return queryset[:limite] if limite else queryset
+
+    valore_mac = mac_a_intero(testo)
+    if valore_mac is not None:
+        risultati = queryset.filter(mac_numerico=valore_mac)
+    elif RE_IP_PARZIALE.match(testo):
+        risultati = queryset.filter(ip__startswith=testo)
+    elif RE_MAC_PARZIALE.match(testo):
+        risultati = queryset.filter(mac_address__startswith=testo.lower().replace('-', ':'))
+    else:
+        risultati = _cerca_testo(queryset, testo, ordina_per_rilevanza)
+
+    return risultati[:limite] if limite else risultati
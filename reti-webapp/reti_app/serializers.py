@@ -1,11 +1,76 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import IndirizzoIP, Vlan, StoricoResponsabile
+from rest_framework.reverse import reverse
+from .models import IndirizzoIP, Vlan, StoricoResponsabile, StoricoResponsabileArchivio, AvvistamentoIP, normalizza_subnet
 
-class VlanSerializer(serializers.ModelSerializer):
+class CampiSelezionabiliMixin:
+    """
+    Campi della risposta scelti dal client con ?fields= e ?omit=
+
+    La vista passa nel contesto 'campi' (campi richiesti, o None per tutti) e
+    'campi_omessi'. colonne_campi indica le colonne del modello lette da ogni
+    campo che non è una colonna omonima, così che la vista possa limitare anche
+    la SELECT con .only() (vedi colonne_per_campi).
+    """
+    colonne_campi = {}
+    # Chiavi aggiunte da to_representation, selezionabili come i campi
+    campi_extra = ()
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for nome in list(self.fields):
+            if not self.campo_incluso(nome):
+                self.fields.pop(nome)
+
+    def campo_incluso(self, nome):
+        campi = self.context.get('campi')
+        if campi is not None and nome not in campi:
+            return False
+        return nome not in self.context.get('campi_omessi', ())
+
+    @classmethod
+    def campi_disponibili(cls):
+        return set(cls.Meta.fields) | set(cls.campi_extra)
+
+    @classmethod
+    def colonne_per_campi(cls, campi):
+        """Colonne (anche di relazioni, con __) necessarie per serializzare i campi indicati"""
+        nomi_colonne = {campo.name for campo in cls.Meta.model._meta.concrete_fields}
+        colonne = set()
+        for campo in campi:
+            if campo in cls.colonne_campi:
+                colonne.update(cls.colonne_campi[campo])
+            elif campo in nomi_colonne:
+                colonne.add(campo)
+        return colonne
+
+class VlanSerializer(CampiSelezionabiliMixin, serializers.ModelSerializer):
     """Serializer semplificato per le VLAN"""
+    colonne_campi = {'reti': ()}  # Prefetch, nessuna colonna della VLAN
+
+    reti = serializers.SlugRelatedField(many=True, read_only=True, slug_field='cidr')
+    
     class Meta:
         model = Vlan
-        fields = ['numero', 'nome', 'subnets', 'num_indirizzi']
+        fields = ['numero', 'nome', 'subnets', 'reti', 'num_indirizzi', 'num_attivi', 'num_usati',
+                  'num_liberi', 'num_riservati', 'num_anomali']
+    
+    def validate_subnets(self, value):
+        """Rifiuta le subnet non interpretabili invece di ignorarle silenziosamente"""
+        if not value:
+            return value
+        errori = []
+        for voce in value.replace('\n', ',').split(','):
+            voce = voce.strip()
+            if not voce:
+                continue
+            try:
+                normalizza_subnet(voce)
+            except ValueError:
+                errori.append(voce)
+        if errori:
+            raise serializers.ValidationError(f"Subnet non valide: {', '.join(errori)}")
+        return value
 
 class StoricoResponsabileSerializer(serializers.ModelSerializer):
     """
@@ -33,7 +98,34 @@ class StoricoResponsabileSerializer(serializers.ModelSerializer):
         """Verifica se è il record attuale"""
         return obj.is_attuale()
 
-class IndirizzoIPSerializer(serializers.ModelSerializer):
+class StoricoResponsabileArchivioSerializer(StoricoResponsabileSerializer):
+    """
+    Serializer per i record archiviati dello storico dei responsabili
+    """
+    ip = serializers.CharField(source='indirizzo_ip_id', read_only=True)
+
+    class Meta(StoricoResponsabileSerializer.Meta):
+        model = StoricoResponsabileArchivio
+        fields = ['ip'] + StoricoResponsabileSerializer.Meta.fields + ['archiviato_il']
+
+class AvvistamentoIPSerializer(serializers.ModelSerializer):
+    """
+    Serializer per gli intervalli di avvistamento di un IP
+    """
+    durata_minuti = serializers.SerializerMethodField()
+
+    class Meta:
+        model = AvvistamentoIP
+        fields = [
+            'id', 'ip', 'mac_address', 'sorgente',
+            'primo_avvistamento', 'ultimo_avvistamento', 'num_avvistamenti', 'durata_minuti'
+        ]
+
+    def get_durata_minuti(self, obj):
+        """Restituisce la durata dell'intervallo in minuti"""
+        return int(obj.durata.total_seconds() // 60)
+
+class IndirizzoIPSerializer(CampiSelezionabiliMixin, serializers.ModelSerializer):
     """
     Serializer completo per il modello IndirizzoIP.
     
@@ -45,27 +137,56 @@ class IndirizzoIPSerializer(serializers.ModelSerializer):
     - `responsabile`: Email del responsabile
     - `utente_finale`: Nome dell'utente finale
     - `note`: Note libere
-    - `ultimo_controllo`: Timestamp ultimo controllo attività
+    - `ultimo_controllo`: Timestamp ultimo controllo attività (tabella ControlloIP)
     - `data_scadenza`: Data di scadenza calcolata
     - `assegnato_a_utente`: ID utente Django assegnato
     - `vlan`: Oggetto VLAN associato
-    - `storico_responsabili`: Storico dei responsabili precedenti
+    - `storico_responsabili`: Ultimi API_STORICO_MAX_RECORD record dello storico dei
+      responsabili (nelle liste solo con `?expand=storico`)
+    - `storico_url`: Link allo storico completo (`/api/ips/{ip}/storico/`)
     
     ## Campi Calcolati (sola lettura):
+    - `ultimo_mac`: Ultimo MAC rilevato dai collector
+    - `ultima_sorgente`: Collector che ha rilevato l'IP per ultimo
     - `is_anomalo`: True se IP attivo ma libero
     - `is_scaduto`: True se IP ha data scadenza nel passato
     - `ore_inattivita`: Ore di inattività
     - `giorni_alla_scadenza`: Giorni rimanenti alla scadenza
+
+    Con `?fields=` / `?omit=` la risposta (e la query) si limita ai campi scelti.
     """
+    colonne_campi = {
+        'vlan': ('vlan',),
+        'assegnato_a_utente_email': ('assegnato_a_utente', 'assegnato_a_utente__email'),
+        'ultimo_controllo': ('controllo__ultimo_controllo',),
+        'ultimo_mac': ('controllo__ultimo_mac',),
+        'ultima_sorgente': ('controllo__ultima_sorgente',),
+        'ultimo_controllo_formattato': ('controllo__ultimo_controllo',),
+        'ore_fa': ('controllo__ultimo_controllo',),
+        'ore_inattivita': ('controllo__ultimo_controllo',),
+        'is_anomalo': ('anomalo',),
+        'is_scaduto': ('data_scadenza',),
+        'giorni_alla_scadenza': ('data_scadenza',),
+        'data_scadenza_formattata': ('data_scadenza',),
+        'storico_responsabili': (),
+        'storico_url': (),
+    }
+    campi_extra = ('ultimo_controllo_formattato', 'ore_fa', 'data_scadenza_formattata')
     
     # Campi di relazione
     vlan = VlanSerializer(read_only=True)
     vlan_id = serializers.IntegerField(write_only=True, required=False, allow_null=True)
     assegnato_a_utente_email = serializers.EmailField(source='assegnato_a_utente.email', read_only=True)
-    storico_responsabili = StoricoResponsabileSerializer(many=True, read_only=True)
+    storico_responsabili = serializers.SerializerMethodField()
+    storico_url = serializers.SerializerMethodField()
+
+    # Controlli di rete: proprietà del modello salvate nella tabella ControlloIP
+    ultimo_controllo = serializers.DateTimeField(required=False)
+    ultimo_mac = serializers.CharField(read_only=True)
+    ultima_sorgente = serializers.CharField(read_only=True)
     
     # Campi calcolati (sola lettura)
-    is_anomalo = serializers.SerializerMethodField()
+    is_anomalo = serializers.BooleanField(source='anomalo', read_only=True)
     is_scaduto = serializers.SerializerMethodField()
     ore_inattivita = serializers.SerializerMethodField()
     giorni_alla_scadenza = serializers.SerializerMethodField()
@@ -76,10 +197,11 @@ class IndirizzoIPSerializer(serializers.ModelSerializer):
             # Campi base
             'ip', 'mac_address', 'stato', 'disponibilita', 
             'responsabile', 'utente_finale', 'note',
-            'ultimo_controllo', 'data_creazione', 'data_modifica', 'data_scadenza',
+            'ultimo_controllo', 'ultimo_mac', 'ultima_sorgente',
+            'data_creazione', 'data_modifica', 'data_scadenza',
             # Relazioni
             'vlan', 'vlan_id', 'assegnato_a_utente', 'assegnato_a_utente_email',
-            'storico_responsabili',
+            'storico_responsabili', 'storico_url',
             # Campi calcolati
             'is_anomalo', 'is_scaduto',
             'ore_inattivita', 'giorni_alla_scadenza'
@@ -90,9 +212,22 @@ class IndirizzoIPSerializer(serializers.ModelSerializer):
             'ore_inattivita', 'giorni_alla_scadenza'
         ]
     
-    def get_is_anomalo(self, obj):
-        """IP anomalo: attivo ma libero o senza responsabile"""
-        return obj.is_anomalo()
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Le liste includono lo storico solo se richiesto (vedi IndirizzoIPViewSet)
+        if self.context.get('espandi_storico') is False:
+            self.fields.pop('storico_responsabili', None)
+
+    def get_storico_responsabili(self, obj):
+        """Ultimi record dello storico, già letti da IndirizzoIPViewSet con un prefetch"""
+        storico = getattr(obj, 'storico_recente', None)
+        if storico is None:
+            storico = obj.storico_responsabili.select_related('vlan')[:settings.API_STORICO_MAX_RECORD]
+        return StoricoResponsabileSerializer(storico, many=True, context=self.context).data
+
+    def get_storico_url(self, obj):
+        """Link allo storico completo dell'IP"""
+        return reverse('indirizzoip-storico', kwargs={'ip': obj.ip}, request=self.context.get('request'))
     
     def get_is_scaduto(self, obj):
         """IP scaduto: ha data scadenza nel passato"""
@@ -132,12 +267,16 @@ class IndirizzoIPSerializer(serializers.ModelSerializer):
                 "Un IP con responsabile dovrebbe essere marcato come 'usato'"
             )
         
-        # Gestione VLAN
+        # Gestione VLAN (le modifiche in blocco passano le VLAN già lette nel contesto)
         if 'vlan_id' in data:
+            vlan_note = self.context.get('vlan_per_numero')
             try:
-                vlan = Vlan.objects.get(numero=data['vlan_id'])
+                if vlan_note is not None:
+                    vlan = vlan_note[data['vlan_id']]
+                else:
+                    vlan = Vlan.objects.get(numero=data['vlan_id'])
                 data['vlan'] = vlan
-            except Vlan.DoesNotExist:
+            except (KeyError, Vlan.DoesNotExist):
                 raise serializers.ValidationError(f"VLAN {data['vlan_id']} non trovata")
             del data['vlan_id']
         
@@ -147,17 +286,21 @@ class IndirizzoIPSerializer(serializers.ModelSerializer):
         """Personalizza la rappresentazione dell'oggetto"""
         data = super().to_representation(instance)
         
-        # Formatta le date in modo più leggibile
-        if data.get('ultimo_controllo'):
+        # Formatta le date in modo più leggibile (se non escluse da ?fields= / ?omit=)
+        formattato = self.campo_incluso('ultimo_controllo_formattato')
+        ore_fa = self.campo_incluso('ore_fa')
+        if (formattato or ore_fa) and instance.ultimo_controllo:
             try:
                 from django.utils import timezone
                 ultimo_controllo = instance.ultimo_controllo
-                data['ultimo_controllo_formattato'] = ultimo_controllo.strftime('%d/%m/%Y %H:%M:%S')
-                data['ore_fa'] = round((timezone.now() - ultimo_controllo).total_seconds() / 3600, 1)
+                if formattato:
+                    data['ultimo_controllo_formattato'] = ultimo_controllo.strftime('%d/%m/%Y %H:%M:%S')
+                if ore_fa:
+                    data['ore_fa'] = round((timezone.now() - ultimo_controllo).total_seconds() / 3600, 1)
             except:
                 pass
         
-        if data.get('data_scadenza'):
+        if self.campo_incluso('data_scadenza_formattata') and instance.data_scadenza:
             try:
                 data['data_scadenza_formattata'] = instance.data_scadenza.strftime('%d/%m/%Y %H:%M:%S')
             except:
@@ -0,0 +1,167 @@
+from datetime import timedelta
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from .models import ControlloIP, IndirizzoIP, OsservazioneIP, Vlan
+from .ricerca import cerca_indirizzi
+from .serializers import IndirizzoIPSerializer
+
+
+class FiltriListaIPTest(TestCase):
+    """
+    Filtri anomalo/scaduto di /api/ips/: risolti in SQL, con un numero di query
+    che non cresce con il numero di IP e righe coerenti con i metodi del modello
+    """
+
+    FILTRI = ['anomalo=si', 'anomalo=no', 'scaduto=si', 'scaduto=no']
+    N = 20
+
+    def setUp(self):
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.create_user('staff', 'staff@example.com', 'pw', is_staff=True))
+        Vlan.objects.create(numero=10, nome='v10', subnets='10.0.0.0/16')
+        self.adesso = timezone.now()
+        self.creati = 0
+
+    def _crea_ip(self, quanti):
+        """Crea IP che coprono tutte le combinazioni di stato, disponibilità, responsabile e scadenza"""
+        scadenze = [self.adesso - timedelta(days=1), self.adesso + timedelta(days=5), None]
+        nuovi = []
+        for i in range(self.creati, self.creati + quanti):
+            nuovi.append(IndirizzoIP(
+                ip=f'10.0.{i // 250}.{i % 250 + 1}',
+                stato='attivo' if i % 2 else 'disattivo',
+                disponibilita='usato' if i % 4 < 2 else 'libero',
+                responsabile='resp@example.com' if i % 5 else None,
+                data_scadenza=scadenze[i % 3],
+            ))
+        IndirizzoIP.objects.bulk_create(nuovi)
+        self.creati += quanti
+
+    def _interroga(self, filtro):
+        with CaptureQueriesContext(connection) as query:
+            risposta = self.client.get(f'/api/ips/?{filtro}&page_size=1000')
+        self.assertEqual(risposta.status_code, 200, risposta.content)
+        return len(query), {riga['ip'] for riga in risposta.data['results']}
+
+    def _attesi(self, filtro):
+        campo, valore = filtro.split('=')
+        verifica = (lambda ip: ip.anomalo) if campo == 'anomalo' else (lambda ip: ip.is_scaduto())
+        return {ip.ip for ip in IndirizzoIP.objects.all() if verifica(ip) == (valore == 'si')}
+
+    def test_query_costanti_e_righe_coerenti(self):
+        self._crea_ip(self.N)
+        query_iniziali = {}
+        for filtro in self.FILTRI:
+            query_iniziali[filtro], righe = self._interroga(filtro)
+            self.assertEqual(righe, self._attesi(filtro), filtro)
+
+        self._crea_ip(9 * self.N)
+        self.assertEqual(IndirizzoIP.objects.count(), 10 * self.N)
+        for filtro in self.FILTRI:
+            with self.subTest(filtro=filtro):
+                self.assertNumQueries(query_iniziali[filtro], self._interroga, filtro)
+                self.assertEqual(self._interroga(filtro)[1], self._attesi(filtro))
+
+    def test_anomalo_allineato_al_modello(self):
+        self._crea_ip(self.N)
+        for ip in IndirizzoIP.objects.all():
+            self.assertEqual(ip.anomalo, ip.is_anomalo(), ip.ip)
+
+
+class ControlloIPTest(TestCase):
+    """Riga ControlloIP: creata con ogni nuovo IP, mai inventata per un IP già salvato"""
+
+    def test_create_crea_la_riga(self):
+        ip = IndirizzoIP.objects.create(ip='10.7.0.1')
+        self.assertTrue(ControlloIP.objects.filter(indirizzo_ip=ip).exists())
+        self.assertIsNotNone(IndirizzoIP.objects.get(pk='10.7.0.1').ultimo_controllo)
+
+    def test_serializer_crea_la_riga(self):
+        serializer = IndirizzoIPSerializer(data={'ip': '10.7.0.2'})
+        self.assertTrue(serializer.is_valid(), serializer.errors)
+        serializer.save()
+        self.assertTrue(ControlloIP.objects.filter(indirizzo_ip='10.7.0.2').exists())
+
+    def test_ip_senza_riga(self):
+        IndirizzoIP.objects.create(ip='10.7.0.3')
+        ControlloIP.objects.all().delete()
+        ip = IndirizzoIP.objects.get(pk='10.7.0.3')
+        self.assertIsNone(ip.ultimo_controllo)
+        ip.note = 'modificato'
+        ip.save()
+        self.assertFalse(ControlloIP.objects.exists())
+
+    def test_update_crea_le_righe_mancanti(self):
+        IndirizzoIP.objects.bulk_create([IndirizzoIP(ip=f'10.7.1.{i}') for i in range(1, 11)])
+        ControlloIP.objects.filter(indirizzo_ip__in=['10.7.1.1', '10.7.1.2']).delete()
+        quando = timezone.now() - timedelta(days=2)
+        self.assertEqual(IndirizzoIP.objects.filter(ip__startswith='10.7.1.').update(ultimo_controllo=quando), 10)
+        self.assertEqual(ControlloIP.objects.filter(ultimo_controllo=quando).count(), 10)
+
+
+class IPInattiviTest(TestCase):
+    """Disattivazione e rilascio in blocco: gli IP senza riga di controllo sono inattivi"""
+
+    def setUp(self):
+        IndirizzoIP.objects.create(ip='10.7.0.1', stato='attivo')
+        IndirizzoIP.objects.create(ip='10.7.0.2', stato='attivo')
+        IndirizzoIP.objects.create(ip='10.7.0.3', stato='attivo')
+        ControlloIP.objects.filter(indirizzo_ip='10.7.0.1').delete()
+        ControlloIP.objects.filter(indirizzo_ip='10.7.0.2').update(ultimo_controllo=timezone.now() - timedelta(days=40))
+
+    def test_disattiva_ip_senza_controllo(self):
+        self.assertEqual(IndirizzoIP.disattiva_ip_inattivi(2, dry_run=True)['disattivati'], 2)
+        risultato = IndirizzoIP.disattiva_ip_inattivi(2, chunk_size=1)
+        self.assertEqual(risultato['disattivati'], 2)
+        self.assertEqual(
+            set(IndirizzoIP.objects.filter(stato='disattivo').values_list('ip', flat=True)),
+            {'10.7.0.1', '10.7.0.2'}
+        )
+
+    def test_rilascia_ip_senza_controllo(self):
+        IndirizzoIP.objects.update(stato='disattivo', disponibilita='usato', responsabile='resp@example.com')
+        self.assertEqual(IndirizzoIP.rilascia_ip_inattivi(30, dry_run=True)['rilasciati'], 2)
+        risultato = IndirizzoIP.rilascia_ip_inattivi(30, chunk_size=1)
+        self.assertEqual(risultato['rilasciati'], 2)
+        self.assertEqual(
+            set(IndirizzoIP.objects.filter(disponibilita='libero').values_list('ip', flat=True)),
+            {'10.7.0.1', '10.7.0.2'}
+        )
+
+
+class UnioneOsservazioniTest(TestCase):
+
+    def test_ip_esistente_senza_riga_di_controllo(self):
+        IndirizzoIP.objects.create(ip='10.7.0.1')
+        IndirizzoIP.objects.create(ip='10.7.0.2')
+        ControlloIP.objects.filter(indirizzo_ip='10.7.0.1').delete()
+        quando = timezone.now() + timedelta(minutes=1)
+        OsservazioneIP.accoda({'10.7.0.1': 'aa:bb:cc:dd:ee:01', '10.7.0.2': 'aa:bb:cc:dd:ee:02'}, 'switch-1', quando=quando)
+        OsservazioneIP.unisci()
+        for ip in ('10.7.0.1', '10.7.0.2'):
+            indirizzo = IndirizzoIP.objects.get(pk=ip)
+            self.assertEqual(indirizzo.stato, 'attivo')
+            self.assertEqual(indirizzo.ultimo_controllo, quando)
+            self.assertEqual(indirizzo.ultima_sorgente, 'switch-1')
+            self.assertEqual(indirizzo.ultimo_mac, f'aa:bb:cc:dd:ee:0{ip[-1]}')
+
+
+class RicercaIPTest(TestCase):
+
+    def setUp(self):
+        IndirizzoIP.objects.create(ip='192.168.1.100')
+        IndirizzoIP.objects.create(ip='10.0.0.5', note='stanza 192')
+
+    def test_numero_senza_punti_cerca_il_prefisso_ip(self):
+        self.assertEqual(list(cerca_indirizzi('192').values_list('ip', flat=True)), ['192.168.1.100'])
+        self.assertEqual(list(cerca_indirizzi('10').values_list('ip', flat=True)), ['10.0.0.5'])
+
+    def test_ip_parziale(self):
+        self.assertEqual(list(cerca_indirizzi('192.168.1.').values_list('ip', flat=True)), ['192.168.1.100'])
+        self.assertFalse(cerca_indirizzi('1.100').exists())
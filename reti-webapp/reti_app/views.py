@@ -5,30 +5,295 @@ from django.contrib import messages
 from django.views.decorators.http import require_POST
 from django.http import JsonResponse, HttpResponse
 from django.utils import timezone
-from django.db.models import Q, Count
+from django.utils.dateparse import parse_datetime
+from django.db import transaction
+from django.db.models import Q, F, Count, Max, Min, Prefetch, Sum
 from rest_framework import viewsets, filters, status
-from rest_framework.decorators import action
+from rest_framework.decorators import action, api_view
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import BasePagination, PageNumberPagination
 from rest_framework.response import Response
-from rest_framework.permissions import IsAuthenticatedOrReadOnly
-from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework.permissions import IsAuthenticated, IsAuthenticatedOrReadOnly
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+from django_filters.rest_framework import DjangoFilterBackend, FilterSet, IsoDateTimeFilter
 from django.core.paginator import Paginator
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 from django.utils.translation import gettext as _
+from django.conf import settings
 import ipaddress
 import json
 import logging
+from collections import defaultdict
 from datetime import timedelta
+from functools import lru_cache
 
-from .models import IndirizzoIP, Vlan
-from .serializers import IndirizzoIPSerializer, VlanSerializer
+from .models import (
+    IndirizzoIP, Vlan, ControlloIP, StoricoResponsabile, StoricoResponsabileArchivio, AvvistamentoIP, OsservazioneIP,
+    ip_a_intero, mac_a_intero, intero_a_mac
+)
+from .cache_dati import (
+    azzera_statistiche_risposte, ottieni_o_calcola, risposta_in_cache, statistiche_risposte
+)
+from .ricerca import cerca_indirizzi
+from .serializers import (
+    IndirizzoIPSerializer, VlanSerializer, AvvistamentoIPSerializer, StoricoResponsabileSerializer,
+    StoricoResponsabileArchivioSerializer
+)
 from .forms import LoginForm, IndirizzoIPForm, FiltroIndirizziForm
 
 # Inizializza logger
 logger = logging.getLogger(__name__)
 
+# Campi di una PATCH dei collector trattata come heartbeat (vedi IndirizzoIP.registra_controllo)
+CAMPI_HEARTBEAT = frozenset(['stato', 'mac_address', 'ultimo_controllo'])
+
+
+def _e_heartbeat(dati):
+    """True se i dati validati di una PATCH sono un heartbeat dei collector"""
+    return 'ultimo_controllo' in dati and set(dati) <= CAMPI_HEARTBEAT
+
+
+# Endpoint con le risposte in cache (hit e miss in /api/cache/)
+RISPOSTE_IN_CACHE = ('getbyip', 'check_ip_availability', 'vlan_elenco', 'vlan_dettaglio', 'vlan_list')
+
+
+def _indirizzo_in_cache(nome, ip):
+    """
+    IndirizzoIP con i dati dei controlli letto dalla cache (None se non esiste)
+
+    La voce è una per IP, condivisa da getbyip e check-ip; i valori che
+    dipendono dall'ora (scadenza, ore di inattività) restano calcolati a ogni richiesta.
+    """
+    def leggi():
+        return IndirizzoIP.objects.select_related('controllo').filter(ip=ip).first()
+
+    try:
+        canonico = str(ipaddress.IPv4Address(ip)) == ip
+    except ValueError:
+        canonico = False
+    if not canonico:
+        # Solo la forma canonica dell'IP ha una versione invalidata dai salvataggi
+        return leggi()
+    return risposta_in_cache(nome, leggi, 'ip', risorsa=ip)
+
+
+def _to_bool(value):
+    """Interpreta un parametro booleano ricevuto come JSON o come stringa di query"""
+    if isinstance(value, str):
+        return value.strip().lower() in ('1', 'true', 'si', 'yes', 'on')
+    return bool(value)
+
+class IPOrderingFilter(filters.OrderingFilter):
+    """
+    OrderingFilter che ordina il campo 'ip' numericamente tramite la colonna indicizzata ip_numerico
+    e 'ultimo_controllo' tramite la tabella ControlloIP
+    """
+
+    def get_ordering(self, request, queryset, view):
+        if (request.query_params.get(api_settings.SEARCH_PARAM, '').strip()
+                and not request.query_params.get(self.ordering_param)):
+            # Senza ordinamento esplicito la ricerca resta ordinata per rilevanza
+            return None
+        ordering = super().get_ordering(request, queryset, view)
+        if not ordering:
+            return ordering
+        risultato = []
+        for campo in ordering:
+            if campo.lstrip('-') == 'ip':
+                prefisso = '-' if campo.startswith('-') else ''
+                risultato.extend([f'{prefisso}ip_numerico', campo])
+            elif campo.lstrip('-') == 'ultimo_controllo':
+                prefisso = '-' if campo.startswith('-') else ''
+                risultato.append(f'{prefisso}controllo__ultimo_controllo')
+            else:
+                risultato.append(campo)
+        return risultato
+
+class CampiSparsiMixin:
+    """
+    ?fields= e ?omit= (elenchi separati da virgole) per list e retrieve
+
+    I campi scelti arrivano al serializer (CampiSelezionabiliMixin) tramite il
+    contesto e, con limita_colonne(), alla SELECT tramite .only(): le relazioni
+    unite con select_related che nessun campo richiede vengono tolte dalla query.
+    """
+    azioni_campi_sparsi = ('list', 'retrieve')
+
+    def _campi_sparsi(self):
+        """(campi richiesti o None, campi omessi); ValidationError per nomi sconosciuti"""
+        if self.request is None or self.action not in self.azioni_campi_sparsi:
+            return None, set()
+        if not hasattr(self, '_cache_campi_sparsi'):
+            disponibili = self.get_serializer_class().campi_disponibili()
+            scelti = {}
+            for parametro in ('fields', 'omit'):
+                valore = self.request.query_params.get(parametro)
+                if valore is None:
+                    scelti[parametro] = None
+                    continue
+                nomi = {nome.strip() for nome in valore.split(',') if nome.strip()}
+                sconosciuti = nomi - disponibili
+                if sconosciuti:
+                    raise ValidationError({parametro: f"Campi sconosciuti: {', '.join(sorted(sconosciuti))}"})
+                scelti[parametro] = nomi
+            self._cache_campi_sparsi = (scelti['fields'], scelti['omit'] or set())
+        return self._cache_campi_sparsi
+
+    def campi_inclusi(self):
+        """Campi che la risposta conterrà, o None se non c'è selezione"""
+        campi, omessi = self._campi_sparsi()
+        if campi is None and not omessi:
+            return None
+        if campi is None:
+            campi = self.get_serializer_class().campi_disponibili()
+        return campi - omessi
+
+    def limita_colonne(self, queryset, relazioni=()):
+        """
+        Riduce la SELECT alle colonne dei campi scelti
+
+        Args:
+            queryset: QuerySet della vista
+            relazioni: Relazioni da unire con select_related se qualche campo le usa
+        """
+        campi = self.campi_inclusi()
+        if campi is None:
+            return queryset.select_related(*relazioni) if relazioni else queryset
+        colonne = self.get_serializer_class().colonne_per_campi(campi)
+        necessarie = [
+            relazione for relazione in relazioni
+            if any(colonna == relazione or colonna.startswith(f'{relazione}__') for colonna in colonne)
+        ]
+        queryset = queryset.select_related(None)
+        if necessarie:
+            queryset = queryset.select_related(*necessarie)
+        # La chiave primaria è sempre letta
+        return queryset.only(*(colonne or {queryset.model._meta.pk.name}))
+
+    def get_serializer_context(self):
+        contesto = super().get_serializer_context()
+        contesto['campi'], contesto['campi_omessi'] = self._campi_sparsi()
+        return contesto
+
+
+class PaginazioneNumerataIP(PageNumberPagination):
+    """Paginazione per numero di pagina (con conteggio totale) e page_size scelto dal client"""
+    page_size_query_param = 'page_size'
+
+    @property
+    def max_page_size(self):
+        return settings.API_IP_MAX_PAGE_SIZE
+
+
+class IPKeysetPagination(BasePagination):
+    """
+    Paginazione a chiave (keyset) di /api/ips/ sull'indice ip_numerico
+
+    Ogni pagina riparte dall'ultimo IP della precedente (`cursor`) con una
+    condizione sull'indice invece di un OFFSET, quindi scorrere tutto
+    l'inventario costa O(n) qualunque sia la profondità. Il conteggio totale
+    viene calcolato solo con `count=true`.
+
+    Le richieste con `page`, o ordinate per un campo diverso dall'IP (compresa
+    la ricerca per rilevanza), usano la paginazione numerata di sempre.
+    """
+    cursor_query_param = 'cursor'
+    page_query_param = 'page'
+    page_size_query_param = 'page_size'
+    count_query_param = 'count'
+    ordinamenti_ip = {('ip_numerico', 'ip'): False, ('-ip_numerico', '-ip'): True}
+
+    def __init__(self):
+        self.numerata = None
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        if page_size <= 0:
+            return api_settings.PAGE_SIZE
+        return min(page_size, settings.API_IP_MAX_PAGE_SIZE)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        decrescente = self.ordinamenti_ip.get(tuple(queryset.query.order_by))
+        if decrescente is None or request.query_params.get(self.page_query_param):
+            self.numerata = PaginazioneNumerataIP()
+            return self.numerata.paginate_queryset(queryset, request, view)
+
+        self.request = request
+        page_size = self.get_page_size(request)
+        # Gli IP validi hanno sempre ip_numerico (vedi IndirizzoIP.allinea_campi_derivati)
+        queryset = queryset.filter(ip_numerico__isnull=False)
+        self.count = queryset.count() if _to_bool(request.query_params.get(self.count_query_param, '')) else None
+
+        cursore = request.query_params.get(self.cursor_query_param)
+        if cursore:
+            valore = ip_a_intero(cursore)
+            if valore is None:
+                raise NotFound(_('Cursore non valido'))
+            if decrescente:
+                queryset = queryset.filter(ip_numerico__lt=valore)
+            else:
+                queryset = queryset.filter(ip_numerico__gt=valore)
+
+        # Una riga in più dice se esiste la pagina successiva senza contare
+        righe = list(queryset[:page_size + 1])
+        self.prossimo_cursore = righe[page_size - 1].ip if len(righe) > page_size else None
+        return righe[:page_size]
+
+    def get_next_link(self):
+        if self.prossimo_cursore is None:
+            return None
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, self.prossimo_cursore)
+
+    def get_paginated_response(self, data):
+        if self.numerata is not None:
+            return self.numerata.get_paginated_response(data)
+        risposta = {'next': self.get_next_link(), 'results': data}
+        if self.count is not None:
+            risposta = {'count': self.count, **risposta}
+        return Response(risposta)
+
+    def get_paginated_response_schema(self, schema):
+        return PaginazioneNumerataIP().get_paginated_response_schema(schema)
+
+class IndirizzoIPFilterSet(FilterSet):
+    """Filtri degli IP: ultimo_controllo vive nella tabella ControlloIP ma mantiene i nomi dei parametri"""
+    ultimo_controllo__lt = IsoDateTimeFilter(field_name='controllo__ultimo_controllo', lookup_expr='lt')
+    ultimo_controllo__lte = IsoDateTimeFilter(field_name='controllo__ultimo_controllo', lookup_expr='lte')
+    ultimo_controllo__gt = IsoDateTimeFilter(field_name='controllo__ultimo_controllo', lookup_expr='gt')
+    ultimo_controllo__gte = IsoDateTimeFilter(field_name='controllo__ultimo_controllo', lookup_expr='gte')
+
+    class Meta:
+        model = IndirizzoIP
+        fields = {
+            'ip': ['exact'],
+            'stato': ['exact'],
+            'disponibilita': ['exact'],
+            'responsabile': ['exact'],
+            'mac_address': ['exact'],
+            'vlan': ['exact', 'isnull'],
+            # Filtri di intervallo per gli script di manutenzione (es. data_modifica__gte)
+            'data_modifica': ['lt', 'lte', 'gt', 'gte'],
+            'data_scadenza': ['lt', 'lte', 'gt', 'gte', 'isnull'],
+            'data_creazione': ['lt', 'lte', 'gt', 'gte'],
+        }
+
+class IPSearchFilter(filters.SearchFilter):
+    """SearchFilter che usa la ricerca comune a web e admin (vedi ricerca.py)"""
+
+    def filter_queryset(self, request, queryset, view):
+        testo = ' '.join(self.get_search_terms(request))
+        if not testo:
+            return queryset
+        return cerca_indirizzi(testo, queryset)
+
 # Viste per API REST
-class IndirizzoIPViewSet(viewsets.ModelViewSet):
+class IndirizzoIPViewSet(CampiSparsiMixin, viewsets.ModelViewSet):
     """
     API REST per la gestione degli indirizzi IP e VLAN
 
@@ -51,6 +316,10 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
     - `POST /api/ips/{ip}/aggiorna_controllo/` - Aggiorna ultimo controllo
     - `POST /api/ips/{ip}/aggiorna_scadenza/` - Aggiorna data scadenza
     - `POST /api/ips/{ip}/libera/` - Libera IP se scaduto
+    - `GET /api/ips/{ip}/storico/` - Storico completo dei responsabili (paginato)
+    - `POST /api/ips/deactivate_stale/` - Disattiva in blocco gli IP inattivi
+    - `POST /api/ips/release_inactive/` - Rilascia in blocco gli IP inattivi da giorni
+    - `PATCH /api/ips/bulk/` - Aggiorna in blocco più IP con esito per elemento
     
     ## Filtri Disponibili:
     - `stato`: attivo, disattivo
@@ -58,80 +327,124 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
     - `responsabile`: email responsabile
     - `mac_address`: MAC address
     - `vlan`: numero VLAN
+    - `vlan__isnull`: true/false per IP senza/con VLAN
     - `anomalo`: si/no per IP anomali
     - `scaduto`: si/no per IP scaduti
+    - `ultimo_controllo__lt|lte|gt|gte`: intervallo sull'ultimo controllo (ISO 8601)
+    - `data_modifica__lt|lte|gt|gte`: intervallo sulla data di modifica
+    - `data_creazione__lt|lte|gt|gte`: intervallo sulla data di creazione
+    - `data_scadenza__lt|lte|gt|gte|isnull`: intervallo sulla data di scadenza
+    - `ip_da` / `ip_a`: intervallo di indirizzi IP (estremi inclusi)
+    - `subnet`: IP appartenenti alla subnet CIDR (es. 192.168.1.0/24)
     
     ## Ordinamento:
     - `ordering`: ip, ultimo_controllo, data_modifica, data_scadenza
     
     ## Ricerca:
-    - `search`: cerca in IP, utente_finale, note
+    - `search`: IP o MAC (anche parziali) oppure parole in responsabile, utente_finale
+      e note; senza `ordering` i risultati sono ordinati per rilevanza
+    
+    ## Storico:
+    - Il dettaglio include gli ultimi API_STORICO_MAX_RECORD record dello storico;
+      le liste solo con `expand=storico`. Lo storico completo è in `storico_url`
+    
+    ## Paginazione:
+    - Ordinando per IP (default) la lista è paginata a chiave: seguire il link `next`
+      (parametro `cursor`), senza conteggio totale salvo `count=true`
+    - `page_size`: righe per pagina (default 20, massimo API_IP_MAX_PAGE_SIZE)
+    - `page`: paginazione numerata con `count`, usata anche per gli altri ordinamenti
     """
     queryset = IndirizzoIP.objects.all()
     serializer_class = IndirizzoIPSerializer
-    filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
-    filterset_fields = ['ip', 'stato', 'disponibilita', 'responsabile', 'mac_address', 'vlan']
-    search_fields = ['ip', 'utente_finale', 'note']
+    pagination_class = IPKeysetPagination
+    filter_backends = [DjangoFilterBackend, IPSearchFilter, IPOrderingFilter]
+    filterset_class = IndirizzoIPFilterSet
+    search_fields = ['ip', 'mac_address', 'responsabile', 'utente_finale', 'note']  # Vedi IPSearchFilter
     ordering_fields = ['ip', 'ultimo_controllo', 'data_modifica', 'data_scadenza']
-    ordering = ['ip']  # Default ordering (sarà sostituito nel get_queryset)
+    ordering = ['ip']  # Ordinamento numerico tramite ip_numerico (vedi IPOrderingFilter)
     lookup_field = 'ip'
     lookup_value_regex = r'\d{1,3}\.\d{1,3}\.\d{1,3}\.\d{1,3}'
     permission_classes = [IsAuthenticatedOrReadOnly]  # Restored secure permissions
+    MAX_ELEMENTI_BULK = 5000  # Elementi accettati da PATCH /api/ips/bulk/
+    MAX_IP_LOOKUP = 5000  # IP accettati da POST /api/ips/lookup/
+    # Record compatto di POST /api/ips/lookup/: chiave nella risposta -> colonna
+    COLONNE_LOOKUP = {
+        'ip': 'ip',
+        'stato': 'stato',
+        'disponibilita': 'disponibilita',
+        'mac_address': 'mac_address',
+        'responsabile': 'responsabile',
+        'vlan': 'vlan_id',
+        'is_anomalo': 'anomalo',
+        'data_scadenza': 'data_scadenza',
+        'ultimo_controllo': 'controllo__ultimo_controllo',
+    }
     
     def get_queryset(self):
         """Applica filtri aggiuntivi al queryset"""
         queryset = super().get_queryset()
         
-        # Usa ordinamento numerico per IP se non è specificato un ordinamento personalizzato
-        ordering = self.request.query_params.get('ordering', None)
-        if not ordering or ordering == 'ip':
-            # Applica ordinamento numerico per IP
-            from django.db import connection
-            if 'mysql' in connection.vendor:
-                queryset = queryset.extra(
-                    select={'ip_as_int': 'INET_ATON(ip)'}, 
-                    order_by=['ip_as_int']
-                )
-            else:
-                queryset = queryset.order_by('ip')
+        # L'ordinamento numerico per IP è gestito da IPOrderingFilter tramite ip_numerico
+        
+        # Filtri per intervallo di IP o subnet (BETWEEN sull'indice ip_numerico)
+        ip_da = self.request.query_params.get('ip_da', None)
+        ip_a = self.request.query_params.get('ip_a', None)
+        if ip_da or ip_a:
+            queryset = queryset.nel_range(ip_da or None, ip_a or None)
+        subnet = self.request.query_params.get('subnet', None)
+        if subnet:
+            queryset = queryset.nella_subnet(subnet)
         
         # Filtro per IP anomali
         anomalo = self.request.query_params.get('anomalo', None)
         if anomalo == 'si':
-            queryset = queryset.filter(
-                stato='attivo'
-            ).filter(
-                Q(disponibilita='libero') | Q(responsabile__isnull=True) | Q(responsabile='')
-            )
+            queryset = queryset.filter(anomalo=True)
         elif anomalo == 'no':
-            # Escludi IP anomali
-            anomali_ids = []
-            for ip in queryset:
-                if ip.is_anomalo():
-                    anomali_ids.append(ip.pk)
-            queryset = queryset.exclude(pk__in=anomali_ids)
-        
-        # Filtro per IP scaduti
+            queryset = queryset.filter(anomalo=False)
+        
+        # Filtro per IP scaduti (data_scadenza passata, in SQL sull'indice)
         scaduto = self.request.query_params.get('scaduto', None)
         if scaduto == 'si':
-            scaduti_ids = []
-            for ip in queryset:
-                if ip.is_da_liberare_automaticamente():
-                    scaduti_ids.append(ip.pk)
-            queryset = queryset.filter(pk__in=scaduti_ids)
+            queryset = queryset.scaduti()
         elif scaduto == 'no':
-            scaduti_ids = []
-            for ip in queryset:
-                if ip.is_da_liberare_automaticamente():
-                    scaduti_ids.append(ip.pk)
-            queryset = queryset.exclude(pk__in=scaduti_ids)
-            
+            queryset = queryset.scaduti(scaduto=False)
+
         # Filtro per VLAN
         vlan = self.request.query_params.get('vlan', None)
         if vlan:
             queryset = queryset.filter(vlan__numero=vlan)
             
-        return queryset.select_related('vlan', 'assegnato_a_utente')
+        queryset = self.limita_colonne(queryset, relazioni=('vlan', 'assegnato_a_utente', 'controllo'))
+        campi = self.campi_inclusi()
+        if campi is None or 'vlan' in campi:
+            # Le subnet della VLAN annidata (campo 'reti') con una query per pagina
+            queryset = queryset.prefetch_related('vlan__reti')
+        if (self.action in ('list', 'retrieve') and self._espandi_storico()
+                and (campi is None or 'storico_responsabili' in campi)):
+            # Ultimi N record per IP con una sola query (ROW_NUMBER per IP), VLAN comprese
+            queryset = queryset.prefetch_related(Prefetch(
+                'storico_responsabili',
+                queryset=StoricoResponsabile.objects.select_related('vlan').order_by('-data_inizio')[
+                    :settings.API_STORICO_MAX_RECORD
+                ],
+                to_attr='storico_recente'
+            ))
+        return queryset
+
+    def _espandi_storico(self):
+        """Lo storico è incluso nel dettaglio e, nelle liste, solo con ?expand=storico"""
+        if self.action != 'list':
+            return True
+        campi, _omessi = self._campi_sparsi()
+        if campi and 'storico_responsabili' in campi:
+            return True
+        espandi = self.request.query_params.get('expand', '')
+        return 'storico' in [voce.strip() for voce in espandi.split(',')]
+
+    def get_serializer_context(self):
+        contesto = super().get_serializer_context()
+        contesto['espandi_storico'] = self._espandi_storico()
+        return contesto
     
     def perform_create(self, serializer):
         """Personalizza la creazione di un nuovo IP"""
@@ -155,9 +468,247 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
         # Aggiorna ultimo_controllo se lo stato diventa attivo
         if serializer.validated_data.get('stato') == 'attivo':
             serializer.validated_data['ultimo_controllo'] = timezone.now()
-            
+
+        # Heartbeat dei collector (solo stato, MAC e ultimo controllo): scrive la tabella
+        # stretta ControlloIP e tocca la riga dell'IP solo se stato o MAC cambiano
+        dati = serializer.validated_data
+        if _e_heartbeat(dati):
+            serializer.instance.registra_controllo(
+                stato=dati.get('stato'),
+                mac_address=dati.get('mac_address'),
+                sorgente=self.request.data.get('sorgente'),
+                quando=dati['ultimo_controllo']
+            )
+            return
+
         serializer.save()
-    
+
+    def _applica_in_memoria(self, istanza, dati, sorgente, adesso):
+        """
+        Applica all'istanza i dati validati di una PATCH con le regole di perform_update,
+        senza salvarla
+
+        Returns:
+            list: Campi da scrivere con bulk_update
+        """
+        if dati.get('stato') == 'attivo':
+            dati['ultimo_controllo'] = adesso
+        if _e_heartbeat(dati):
+            return istanza.applica_controllo(
+                stato=dati.get('stato'),
+                mac_address=dati.get('mac_address'),
+                sorgente=sorgente,
+                quando=dati['ultimo_controllo']
+            )
+        for campo, valore in dati.items():
+            setattr(istanza, campo, valore)
+        # bulk_update non applica auto_now
+        istanza.data_modifica = adesso
+        return list(dati) + ['data_modifica']
+
+    @action(detail=False, methods=['patch'], url_path='bulk')
+    def bulk(self, request):
+        """
+        **Aggiorna in blocco più IP con una sola richiesta.**
+
+        Ogni elemento è validato come una `PATCH /api/ips/{ip}/` e segue le stesse
+        regole (attivazione e heartbeat dei collector aggiornano `ultimo_controllo`),
+        ma gli IP sono letti con una query e scritti con `bulk_update`, raggruppati
+        per insieme di campi modificati, in un'unica transazione.
+
+        **Parametri:**
+        - Il corpo è una lista di oggetti `{ip, campi...}` oppure un oggetto con:
+        - `items` (list): Gli oggetti da aggiornare (max 5000)
+        - `atomic` (boolean): Se true (default) un solo elemento non valido annulla
+          tutta la richiesta; se false vengono applicati gli elementi validi
+
+        **Esempio:**
+        ```
+        PATCH /api/ips/bulk/
+        {
+            "atomic": false,
+            "items": [
+                {"ip": "192.168.1.100", "vlan_id": 10},
+                {"ip": "192.168.1.101", "stato": "disattivo", "note": "Dismesso"}
+            ]
+        }
+        ```
+
+        **Risposta:**
+        ```json
+        {
+            "atomic": false,
+            "aggiornati": 1,
+            "errori": 1,
+            "risultati": [
+                {"ip": "192.168.1.100", "status": 200, "campi": ["data_modifica", "vlan"]},
+                {"ip": "192.168.1.101", "status": 404, "errori": {"ip": ["IP non trovato"]}}
+            ]
+        }
+        ```
+        Stato HTTP: 200 se tutti gli elementi sono applicati, 400 se la richiesta
+        atomica è annullata, 207 se in modalità non atomica alcuni elementi falliscono.
+        """
+        elementi = request.data
+        atomico = True
+        if isinstance(elementi, dict):
+            atomico = _to_bool(elementi.get('atomic', True))
+            elementi = elementi.get('items')
+        if not isinstance(elementi, list) or not elementi:
+            return Response(
+                {'error': 'Il corpo deve essere una lista non vuota di oggetti {ip, campi...}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(elementi) > self.MAX_ELEMENTI_BULK:
+            return Response(
+                {'error': f'Massimo {self.MAX_ELEMENTI_BULK} elementi per richiesta'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        risultati = [None] * len(elementi)
+        posizioni = {}
+        numeri_vlan = set()
+        for i, elemento in enumerate(elementi):
+            ip = elemento.get('ip') if isinstance(elemento, dict) else None
+            if not isinstance(ip, str) or not ip:
+                risultati[i] = {'ip': ip, 'status': 400, 'errori': {'ip': ['Campo obbligatorio']}}
+            elif ip in posizioni:
+                risultati[i] = {'ip': ip, 'status': 400, 'errori': {'ip': ['IP ripetuto nella richiesta']}}
+            else:
+                posizioni[ip] = i
+                try:
+                    numeri_vlan.add(int(elemento['vlan_id']))
+                except (KeyError, TypeError, ValueError):
+                    pass
+
+        # Una query per gli IP (a blocchi) e una per le VLAN indicate
+        chiavi = list(posizioni)
+        istanze = {}
+        for j in range(0, len(chiavi), 1000):
+            istanze.update(
+                IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente', 'controllo').in_bulk(chiavi[j:j + 1000])
+            )
+        contesto = {**self.get_serializer_context(), 'vlan_per_numero': Vlan.objects.in_bulk(numeri_vlan)}
+
+        adesso = timezone.now()
+        modifiche = []
+        for ip, i in posizioni.items():
+            istanza = istanze.get(ip)
+            if istanza is None:
+                risultati[i] = {'ip': ip, 'status': 404, 'errori': {'ip': ['IP non trovato']}}
+                continue
+            dati = {campo: valore for campo, valore in elementi[i].items() if campo not in ('ip', 'sorgente')}
+            serializer = self.get_serializer(istanza, data=dati, partial=True, context=contesto)
+            if not serializer.is_valid():
+                risultati[i] = {'ip': ip, 'status': 400, 'errori': serializer.errors}
+                continue
+            campi = self._applica_in_memoria(istanza, dict(serializer.validated_data),
+                                             elementi[i].get('sorgente'), adesso)
+            modifiche.append((i, istanza, campi))
+
+        errori = len(elementi) - len(modifiche)
+        if errori and atomico:
+            for i, istanza, _campi in modifiche:
+                risultati[i] = {'ip': istanza.ip, 'status': 424,
+                                'errori': {'non_field_errors': ['Non applicato: la richiesta contiene elementi non validi']}}
+            return Response(
+                {'atomic': atomico, 'aggiornati': 0, 'errori': errori, 'risultati': risultati},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        gruppi = defaultdict(list)
+        controlli_nuovi = []
+        for i, istanza, campi in modifiche:
+            istanza.allinea_campi_derivati()
+            controllo = istanza._get_controllo()
+            if controllo._state.adding and controllo.ultimo_controllo is not None:
+                controlli_nuovi.append(controllo)
+            gruppi[tuple(sorted(set(campi)))].append(istanza)
+            risultati[i] = {'ip': istanza.ip, 'status': 200, 'campi': sorted(set(campi))}
+
+        with transaction.atomic():
+            ControlloIP.objects.bulk_create(controlli_nuovi, batch_size=1000, ignore_conflicts=True)
+            for campi, gruppo in gruppi.items():
+                IndirizzoIP.objects.bulk_update(gruppo, list(campi), batch_size=1000)
+
+        logger.info(f"Aggiornati in blocco {len(modifiche)} IP ({errori} elementi non validi)")
+        return Response(
+            {'atomic': atomico, 'aggiornati': len(modifiche), 'errori': errori, 'risultati': risultati},
+            status=status.HTTP_207_MULTI_STATUS if errori else status.HTTP_200_OK
+        )
+
+    @action(detail=False, methods=['post'])
+    def lookup(self, request):
+        """
+        **Cerca più IP con una sola richiesta.**
+
+        Restituisce per ogni IP richiesto il record compatto attuale, o `null`
+        se l'IP non esiste. Gli IP sono letti con una query `IN` per blocco di
+        1000, senza ordinamento, paginazione, conteggi né storico.
+
+        **Parametri:**
+        - Il corpo è una lista di IP oppure un oggetto con:
+        - `ips` (list): Gli IP da cercare (max 5000)
+
+        **Esempio:**
+        ```
+        POST /api/ips/lookup/
+        {
+            "ips": ["192.168.1.100", "192.168.1.200"]
+        }
+        ```
+
+        **Risposta:**
+        ```json
+        {
+            "trovati": 1,
+            "mancanti": 1,
+            "risultati": {
+                "192.168.1.100": {
+                    "ip": "192.168.1.100",
+                    "stato": "attivo",
+                    "disponibilita": "usato",
+                    "mac_address": "aa:bb:cc:dd:ee:ff",
+                    "responsabile": "user@uniroma1.it",
+                    "vlan": 100,
+                    "is_anomalo": false,
+                    "data_scadenza": null,
+                    "ultimo_controllo": "2025-05-30T14:30:00Z"
+                },
+                "192.168.1.200": null
+            }
+        }
+        ```
+        """
+        ips = request.data.get('ips') if isinstance(request.data, dict) else request.data
+        if not isinstance(ips, list) or not ips:
+            return Response(
+                {'error': 'Il corpo deve essere una lista non vuota di IP (o un oggetto con "ips")'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(ips) > self.MAX_IP_LOOKUP:
+            return Response(
+                {'error': f'Massimo {self.MAX_IP_LOOKUP} IP per richiesta'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        non_validi = [ip for ip in ips if not isinstance(ip, str) or ip_a_intero(ip) is None or ip != ip.strip()]
+        if non_validi:
+            return Response(
+                {'error': f"IP non validi: {', '.join(map(str, non_validi[:20]))}"},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        risultati = dict.fromkeys(ips)
+        chiavi = list(risultati)
+        nomi = list(self.COLONNE_LOOKUP)
+        colonne = list(self.COLONNE_LOOKUP.values())
+        for j in range(0, len(chiavi), 1000):
+            for riga in IndirizzoIP.objects.filter(pk__in=chiavi[j:j + 1000]).order_by().values_list(*colonne):
+                risultati[riga[0]] = dict(zip(nomi, riga))
+
+        trovati = sum(1 for record in risultati.values() if record is not None)
+        return Response({'trovati': trovati, 'mancanti': len(risultati) - trovati, 'risultati': risultati})
+
     @action(detail=False, methods=['get'])
     def getbyip(self, request):
         """
@@ -195,8 +746,8 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
         """
         ip = request.query_params.get('title', None)
         if ip:
-            try:
-                indirizzo = IndirizzoIP.objects.get(ip=ip)
+            indirizzo = _indirizzo_in_cache('getbyip', ip)
+            if indirizzo is not None:
                 data = {
                     'nid': str(indirizzo.ip),
                     'Stato': indirizzo.stato,
@@ -206,16 +757,15 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
                     'Mail responsabile': indirizzo.responsabile or '',
                     'Note': indirizzo.note or '',
                     'Utente finale': indirizzo.utente_finale or '',
-                    'ultimo controllo': indirizzo.ultimo_controllo.strftime('%Y-%m-%d %H:%M:%S'),
+                    'ultimo controllo': indirizzo.ultimo_controllo.strftime('%Y-%m-%d %H:%M:%S') if indirizzo.ultimo_controllo else None,
                     'data_scadenza': indirizzo.data_scadenza.strftime('%Y-%m-%d %H:%M:%S') if indirizzo.data_scadenza else None,
-                    'is_anomalo': indirizzo.is_anomalo(),
+                    'is_anomalo': indirizzo.anomalo,
                     'is_scaduto': indirizzo.is_scaduto(),
-                    'ore_inattivita': indirizzo.ore_inattivita(),
+                    'ore_inattivita': indirizzo.ore_inattivita() if indirizzo.ultimo_controllo else None,
                     'stato_scadenza': 'attivo' if indirizzo.stato == 'attivo' else 'disattivo'
                 }
                 return Response([data])
-            except IndirizzoIP.DoesNotExist:
-                return Response([])
+            return Response([])
         return Response({'error': 'IP non specificato nel parametro title'}, status=status.HTTP_400_BAD_REQUEST)
     
     @action(detail=False, methods=['get'])
@@ -275,9 +825,7 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
         nuovo_stato = request.data.get('stato', None)
         
         if nuovo_stato and nuovo_stato in dict(IndirizzoIP.STATO_CHOICES).keys():
-            indirizzo.stato = nuovo_stato
-            indirizzo.ultimo_controllo = timezone.now()
-            indirizzo.save()
+            indirizzo.registra_controllo(stato=nuovo_stato)
             return Response(self.get_serializer(indirizzo).data)
             
         return Response(
@@ -308,13 +856,8 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
         ```
         """
         indirizzo = self.get_object()
-        indirizzo.ultimo_controllo = timezone.now()
-        
         # Se l'IP era inattivo e ora è attivo, aggiorna anche lo stato
-        if indirizzo.stato == 'disattivo':
-            indirizzo.stato = 'attivo'
-            
-        indirizzo.save()
+        indirizzo.registra_controllo(stato='attivo', sorgente=request.data.get('sorgente'))
         
         return Response({
             'ip': indirizzo.ip,
@@ -458,10 +1001,35 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
                 status=status.HTTP_500_INTERNAL_SERVER_ERROR
             )
     
+    @action(detail=True, methods=['get'])
+    def storico(self, request, ip=None):
+        """
+        **Storico completo dei responsabili di un IP, paginato.**
+
+        Le risposte di `/api/ips/` includono solo gli ultimi record
+        (`API_STORICO_MAX_RECORD`) e il link `storico_url` a questo endpoint.
+        I record archiviati sono in `/api/history-archive/?ip={ip}`.
+
+        **Esempio:**
+        ```
+        GET /api/ips/192.168.1.100/storico/?page_size=50
+        ```
+        """
+        indirizzo = self.get_object()
+        storico = indirizzo.storico_responsabili.select_related('vlan').order_by('-data_inizio')
+        pagina = self.paginate_queryset(storico)
+        if pagina is not None:
+            return self.get_paginated_response(StoricoResponsabileSerializer(pagina, many=True).data)
+        return Response(StoricoResponsabileSerializer(storico, many=True).data)
+
     @action(detail=False, methods=['get'])
     def statistiche(self, request):
         """
         **Restituisce statistiche aggregate sugli IP.**
+
+        I valori sono calcolati con una sola query e tenuti in cache per
+        `STATISTICHE_CACHE_SECONDI` secondi (default: 30). `in_scadenza` conta gli
+        IP con scadenza nei prossimi 30 giorni.
         
         **Esempio:**
         ```
@@ -486,39 +1054,490 @@ class IndirizzoIPViewSet(viewsets.ModelViewSet):
         }
         ```
         """
-        from django.db.models import Count
-        
-        # Statistiche base con aggregazione
-        stats = {
-            'totale': IndirizzoIP.objects.count(),
-            'per_stato': dict(IndirizzoIP.objects.values('stato').annotate(count=Count('stato')).values_list('stato', 'count')),
-            'per_disponibilita': dict(IndirizzoIP.objects.values('disponibilita').annotate(count=Count('disponibilita')).values_list('disponibilita', 'count')),
+        # Una sola query di aggregazione, condivisa per qualche secondo tra le
+        # richieste: i refresh concorrenti delle dashboard ne calcolano una sola
+        stats = ottieni_o_calcola(
+            'statistiche_ip',
+            IndirizzoIP.objects.statistiche,
+            settings.STATISTICHE_CACHE_SECONDI
+        )
+        return Response(stats)
+
+    @action(detail=False, methods=['post'])
+    def deactivate_stale(self, request):
+        """
+        **Disattiva in blocco gli IP attivi non visti da più di X ore.**
+
+        Sostituisce il download completo degli IP attivi e le PATCH singole
+        dello script di pulizia: l'aggiornamento avviene lato database a blocchi.
+
+        **Parametri:**
+        - `hours` (int): Soglia di inattività in ore (default: 2)
+        - `dry_run` (boolean): Conta i candidati senza modificarli
+        - `sample_size` (int): Numero di IP restituiti come campione (default: 20, max: 1000)
+
+        **Esempio:**
+        ```
+        POST /api/ips/deactivate_stale/
+        {
+            "hours": 2,
+            "dry_run": false
         }
-        
-        # Statistiche che richiedono iterazione (ottimizzabile con query personalizzate)
-        ip_usati = IndirizzoIP.objects.filter(disponibilita='usato').iterator()
-        anomali = scaduti = in_scadenza = 0
-        
-        for ip in ip_usati:
-            if ip.is_anomalo():
-                anomali += 1
-            if ip.is_scaduto():
-                scaduti += 1
-        
-        stats.update({
-            'anomali': anomali,
-            'scaduti': scaduti,
-            'in_scadenza': 0  # Non più supportato
+        ```
+
+        **Risposta:**
+        ```json
+        {
+            "hours": 2,
+            "dry_run": false,
+            "soglia": "2025-05-30T12:30:00Z",
+            "disattivati": 42,
+            "campione": [
+                {"ip": "192.168.1.100", "ultimo_controllo": "2025-05-30T10:00:00Z", "responsabile": "user@uniroma1.it"}
+            ]
+        }
+        ```
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono disattivare gli IP in blocco'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            hours = int(request.data.get('hours', 2))
+            sample_size = min(int(request.data.get('sample_size', 20)), 1000)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'I parametri hours e sample_size devono essere numeri interi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if hours < 1 or sample_size < 0:
+            return Response(
+                {'error': 'hours deve essere almeno 1 e sample_size non negativo'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        dry_run = _to_bool(request.data.get('dry_run', False))
+
+        risultato = IndirizzoIP.disattiva_ip_inattivi(hours, dry_run=dry_run, sample_size=sample_size)
+        if not dry_run:
+            logger.info(f"Disattivati {risultato['disattivati']} IP inattivi da più di {hours} ore")
+
+        return Response({
+            'hours': hours,
+            'dry_run': dry_run,
+            **risultato
         })
-        
-        return Response(stats)
 
-class VlanViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=['post'])
+    def release_inactive(self, request):
+        """
+        **Rilascia in blocco gli IP usati ma disattivi da più di X giorni.**
+
+        Equivale a chiamare `POST /api/ips/{ip}/libera/` con `force=true` per ogni
+        IP candidato, con lo stesso storico, ma i candidati sono selezionati in SQL
+        e lo storico è scritto con poche query per blocco.
+
+        **Parametri:**
+        - `days` (int): Soglia di inattività in giorni (default: 30)
+        - `dry_run` (boolean): Conta i candidati senza modificarli
+        - `motivo` (string): Motivo della liberazione (default: 'inattivita')
+        - `note` (string): Note aggiuntive per lo storico
+        - `created_by` (string): Chi ha effettuato l'operazione
+        - `sample_size` (int): Numero di IP restituiti come campione (default: 20, max: 1000)
+
+        **Esempio:**
+        ```
+        POST /api/ips/release_inactive/
+        {
+            "days": 30,
+            "note": "Liberazione automatica per inattività prolungata",
+            "created_by": "script_release_old_ips"
+        }
+        ```
+
+        **Risposta:**
+        ```json
+        {
+            "days": 30,
+            "dry_run": false,
+            "soglia": "2025-04-30T14:30:00Z",
+            "rilasciati": 12,
+            "campione": [
+                {"ip": "192.168.1.100", "era_assegnato_a": "user@uniroma1.it", "ultimo_controllo": "2025-04-01T10:00:00Z"}
+            ]
+        }
+        ```
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono liberare gli IP in blocco'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        try:
+            days = int(request.data.get('days', 30))
+            sample_size = min(int(request.data.get('sample_size', 20)), 1000)
+        except (TypeError, ValueError):
+            return Response(
+                {'error': 'I parametri days e sample_size devono essere numeri interi'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if days < 1 or sample_size < 0:
+            return Response(
+                {'error': 'days deve essere almeno 1 e sample_size non negativo'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+
+        motivo = request.data.get('motivo', 'inattivita')
+        if motivo not in dict(StoricoResponsabile.MOTIVO_CHOICES):
+            return Response(
+                {'error': f'Motivo non valido. Valori permessi: {[c[0] for c in StoricoResponsabile.MOTIVO_CHOICES]}'},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        dry_run = _to_bool(request.data.get('dry_run', False))
+        # Stessi default dell'azione libera
+        note = request.data.get('note', None) or f"IP liberato automaticamente - {motivo}"
+        created_by = request.data.get('created_by', None) or request.user.username
+
+        try:
+            risultato = IndirizzoIP.rilascia_ip_inattivi(
+                days,
+                motivo=motivo,
+                note=note,
+                created_by=created_by,
+                dry_run=dry_run,
+                sample_size=sample_size
+            )
+        except Exception as e:
+            logger.error(f"Errore nella liberazione in blocco degli IP inattivi: {str(e)}")
+            return Response(
+                {'error': f'Errore nella liberazione: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        if not dry_run:
+            logger.info(f"Rilasciati {risultato['rilasciati']} IP inattivi da più di {days} giorni")
+
+        return Response({
+            'days': days,
+            'dry_run': dry_run,
+            **risultato
+        })
+
+class VlanViewSet(CampiSparsiMixin, viewsets.ModelViewSet):
+    """
+    API REST per le VLAN
+
+    `?fields=` / `?omit=` limitano i campi della risposta (e le colonne lette).
+    """
     queryset = Vlan.objects.all()
     serializer_class = VlanSerializer
     lookup_field = 'numero'
     permission_classes = [IsAuthenticatedOrReadOnly]
 
+    def get_queryset(self):
+        queryset = self.limita_colonne(super().get_queryset())
+        campi = self.campi_inclusi()
+        if campi is None or 'reti' in campi:
+            queryset = queryset.prefetch_related('reti')
+        return queryset
+
+    def list(self, request, *args, **kwargs):
+        # In cache per URL completo (filtri, pagina, campi); invalidata da ogni modifica di VLAN e contatori
+        dati = risposta_in_cache(
+            'vlan_elenco', lambda: super(VlanViewSet, self).list(request, *args, **kwargs).data,
+            'vlan', variante=request.build_absolute_uri()
+        )
+        return Response(dati)
+
+    def retrieve(self, request, *args, **kwargs):
+        dati = risposta_in_cache(
+            'vlan_dettaglio', lambda: super(VlanViewSet, self).retrieve(request, *args, **kwargs).data,
+            'vlan', variante=request.build_absolute_uri()
+        )
+        return Response(dati)
+
+    @action(detail=False, methods=['post'])
+    def recount(self, request):
+        """
+        **Ricalcola i contatori di tutte le VLAN.**
+
+        Associa gli IP senza VLAN in base alle subnet (una sola passata) e
+        riconcilia i contatori (totale, attivi, usati, liberi, riservati,
+        anomali) con un'unica aggregazione e un bulk_update.
+
+        **Parametri:**
+        - `associa` (boolean): Associa gli IP senza VLAN prima del conteggio (default: true)
+
+        **Esempio:**
+        ```
+        POST /api/vlans/recount/
+        {
+            "associa": true
+        }
+        ```
+
+        **Risposta:**
+        ```json
+        {
+            "ip_associati": 3,
+            "vlan_aggiornate": 1,
+            "variazioni": [
+                {"numero": 100, "nome": "Rete Uffici", "precedente": 250, "attuale": 253}
+            ]
+        }
+        ```
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono ricalcolare i conteggi delle VLAN'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        associa = _to_bool(request.data.get('associa', True))
+
+        try:
+            risultato = Vlan.ricalcola_num_indirizzi(associa_ip_senza_vlan=associa)
+        except Exception as e:
+            logger.error(f"Errore nel ricalcolo dei conteggi VLAN: {str(e)}")
+            return Response(
+                {'error': f'Errore durante il ricalcolo: {str(e)}'},
+                status=status.HTTP_500_INTERNAL_SERVER_ERROR
+            )
+
+        return Response(risultato)
+
+class StoricoArchivioViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API REST in sola lettura per lo storico dei responsabili archiviato
+
+    Contiene i record chiusi spostati fuori dalla tabella principale dal
+    comando `archivia_storico`.
+
+    **Filtri:**
+    - `ip`: Indirizzo IP
+    - `responsabile`: Mail del responsabile
+    - `dal`, `al`: Periodo di assegnazione (ISO 8601)
+    """
+    queryset = StoricoResponsabileArchivio.objects.select_related('vlan')
+    serializer_class = StoricoResponsabileArchivioSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        if params.get('ip'):
+            queryset = queryset.filter(indirizzo_ip_id=params['ip'].strip())
+        if params.get('responsabile'):
+            queryset = queryset.filter(responsabile=params['responsabile'].strip())
+        if params.get('dal'):
+            inizio = parse_datetime(params['dal'])
+            if inizio:
+                queryset = queryset.filter(data_fine__gte=inizio)
+        if params.get('al'):
+            fine = parse_datetime(params['al'])
+            if fine:
+                queryset = queryset.filter(data_inizio__lte=fine)
+        return queryset
+
+class MacViewSet(viewsets.ViewSet):
+    """
+    Ricerca inversa MAC -> IP
+
+    `GET /api/macs/{mac}/` restituisce gli IP attualmente associati al MAC
+    (ricerca esatta sull'indice mac_numerico) e quelli su cui è stato visto
+    in passato secondo lo storico degli avvistamenti. Il MAC è accettato nei
+    formati aa:bb:cc:dd:ee:ff, aa-bb-cc-dd-ee-ff, aabb.ccdd.eeff e aabbccddeeff.
+    """
+    permission_classes = [IsAuthenticated]
+    lookup_value_regex = '[^/]+'
+
+    def retrieve(self, request, pk=None):
+        valore = mac_a_intero(pk)
+        if valore is None:
+            return Response({'error': f'MAC address non valido: {pk}'}, status=status.HTTP_400_BAD_REQUEST)
+        mac_address = intero_a_mac(valore)
+
+        attuali = IndirizzoIP.objects.filter(mac_numerico=valore).ordinati_per_ip().values(
+            'ip', 'stato', 'disponibilita', 'responsabile', 'vlan', ultimo_controllo=F('controllo__ultimo_controllo')
+        )
+        storici = AvvistamentoIP.objects.per_mac(mac_address).values('ip').annotate(
+            primo_avvistamento=Min('primo_avvistamento'),
+            ultimo_avvistamento=Max('ultimo_avvistamento'),
+            num_avvistamenti=Sum('num_avvistamenti'),
+        ).order_by('-ultimo_avvistamento')
+
+        return Response({
+            'mac_address': mac_address,
+            'indirizzi_attuali': list(attuali),
+            'avvistamenti': list(storici),
+        })
+
+def _leggi_passaggio_raccolta(dati, campo):
+    """
+    Legge sorgente, coppie IP/MAC e istante di un passaggio di raccolta
+
+    Le coppie possono arrivare come oggetto {ip: mac} o come lista di
+    {"ip": ..., "mac": ...}.
+
+    Returns:
+        tuple: (sorgente, coppie, quando, errore) con errore None se i dati sono validi
+    """
+    sorgente = (dati.get('sorgente') or '').strip()
+    coppie = dati.get(campo) or {}
+    if not sorgente:
+        return None, None, None, 'Il parametro sorgente è obbligatorio'
+    if isinstance(coppie, list):
+        try:
+            coppie = [(voce['ip'], voce.get('mac')) for voce in coppie]
+        except (TypeError, KeyError):
+            return None, None, None, f'Ogni elemento di {campo} deve essere un oggetto con il campo ip'
+    elif not isinstance(coppie, dict):
+        return None, None, None, f'{campo} deve essere un oggetto {{ip: mac}} o una lista'
+
+    quando = None
+    if dati.get('quando'):
+        quando = parse_datetime(str(dati['quando']))
+        if quando is None:
+            return None, None, None, 'Formato di quando non valido'
+        if timezone.is_naive(quando):
+            quando = timezone.make_aware(quando)
+    return sorgente, coppie, quando, None
+
+class AvvistamentoIPViewSet(viewsets.ReadOnlyModelViewSet):
+    """
+    API REST per lo storico degli avvistamenti degli IP
+
+    Ogni record è un intervallo in cui un IP è stato visto con un certo MAC
+    da una sorgente (router, firewall, ...).
+
+    **Filtri:**
+    - `ip`: Indirizzo IP
+    - `mac`: MAC address
+    - `sorgente`: Dispositivo che ha rilevato l'IP
+    - `dal`, `al`: Periodo (ISO 8601); restituisce gli intervalli che vi si sovrappongono
+
+    **Esempio:** chi ha usato l'IP 192.168.1.100 il 30 maggio
+    ```
+    GET /api/sightings/?ip=192.168.1.100&dal=2025-05-30T00:00:00Z&al=2025-05-30T23:59:59Z
+    ```
+    """
+    queryset = AvvistamentoIP.objects.all()
+    serializer_class = AvvistamentoIPSerializer
+    permission_classes = [IsAuthenticated]
+
+    def get_queryset(self):
+        queryset = super().get_queryset()
+        params = self.request.query_params
+
+        if params.get('ip'):
+            queryset = queryset.per_ip(params['ip'].strip())
+        if params.get('mac'):
+            queryset = queryset.per_mac(params['mac'])
+        if params.get('sorgente'):
+            queryset = queryset.filter(sorgente=params['sorgente'])
+
+        inizio = parse_datetime(params['dal']) if params.get('dal') else None
+        fine = parse_datetime(params['al']) if params.get('al') else None
+        return queryset.nel_periodo(inizio, fine)
+
+    @action(detail=False, methods=['post'])
+    def registra(self, request):
+        """
+        **Registra in blocco gli avvistamenti di un passaggio di raccolta.**
+
+        Le coppie IP/MAC già viste di recente dalla stessa sorgente estendono
+        l'intervallo aperto, le altre aprono un nuovo intervallo.
+
+        **Parametri:**
+        - `sorgente` (string): Dispositivo che ha rilevato gli IP (obbligatorio)
+        - `avvistamenti`: Oggetto `{ip: mac}` o lista di `{"ip": ..., "mac": ...}`
+        - `quando` (datetime): Momento della rilevazione (default: adesso)
+
+        **Esempio:**
+        ```
+        POST /api/sightings/registra/
+        {
+            "sorgente": "router-core-1",
+            "avvistamenti": {"192.168.1.100": "aa:bb:cc:dd:ee:ff"}
+        }
+        ```
+
+        **Risposta:**
+        ```json
+        {"estesi": 1, "nuovi": 0, "scartati": 0}
+        ```
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono registrare avvistamenti'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        sorgente, avvistamenti, quando, errore = _leggi_passaggio_raccolta(request.data, 'avvistamenti')
+        if errore:
+            return Response({'error': errore}, status=status.HTTP_400_BAD_REQUEST)
+
+        risultato = AvvistamentoIP.registra(avvistamenti, sorgente, quando=quando)
+        logger.info(f"Avvistamenti da {sorgente}: {risultato['estesi']} estesi, {risultato['nuovi']} nuovi")
+        return Response(risultato)
+
+class OsservazioneIPViewSet(viewsets.ViewSet):
+    """
+    API di ingestione delle osservazioni grezze dei collector
+
+    Le osservazioni vengono solo accodate nella tabella di appoggio
+    OsservazioneIP, senza toccare IP e avvistamenti: il comando
+    `unisci_osservazioni` (o l'azione `unisci`) le riversa periodicamente
+    sulle tabelle principali con poche istruzioni in blocco.
+
+    **Esempio:**
+    ```
+    POST /api/observations/
+    {
+        "sorgente": "f5-lb-1",
+        "osservazioni": {"192.168.1.100": "aa:bb:cc:dd:ee:ff"}
+    }
+    ```
+
+    **Risposta (202):**
+    ```json
+    {"accodate": 1, "scartate": 0}
+    ```
+    """
+    permission_classes = [IsAuthenticated]
+
+    def create(self, request):
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono inviare osservazioni'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+
+        sorgente, osservazioni, quando, errore = _leggi_passaggio_raccolta(request.data, 'osservazioni')
+        if errore:
+            return Response({'error': errore}, status=status.HTTP_400_BAD_REQUEST)
+
+        risultato = OsservazioneIP.accoda(osservazioni, sorgente, quando=quando)
+        return Response(risultato, status=status.HTTP_202_ACCEPTED)
+
+    @action(detail=False, methods=['post'])
+    def unisci(self, request):
+        """
+        **Riversa subito le osservazioni accodate sulle tabelle principali.**
+
+        Normalmente l'unione è eseguita ogni pochi secondi dal comando
+        `python manage.py unisci_osservazioni --intervallo N`.
+        """
+        if not request.user.is_staff:
+            return Response(
+                {'error': 'Solo gli staff possono avviare l\'unione delle osservazioni'},
+                status=status.HTTP_403_FORBIDDEN
+            )
+        return Response(OsservazioneIP.unisci())
+
 # Viste per l'interfaccia web
 def login_view(request):
     """Vista per la pagina di login"""
@@ -596,22 +1615,11 @@ def dashboard(request):
         ).order_by('-data_modifica')[:15]
         
         # 4. Indirizzi IP in scadenza - limita i campi e usa select_related con ordinamento numerico
-        from django.db import connection
-        if 'mysql' in connection.vendor:
-            ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                data_scadenza__range=[oggi, tra_30_giorni]
-            ).extra(
-                select={'ip_as_int': 'INET_ATON(ip)'}, 
-                order_by=['data_scadenza', 'ip_as_int']
-            )[:10]
-        else:
-            ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                data_scadenza__range=[oggi, tra_30_giorni]
-            ).order_by('data_scadenza', 'ip')[:10]
+        ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
+            'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
+        ).filter(
+            data_scadenza__range=[oggi, tra_30_giorni]
+        ).order_by('data_scadenza', 'ip_numerico')[:10]
         
         # 5. IP senza MAC - usa Count direttamente
         ip_senza_mac = IndirizzoIP.objects.filter(
@@ -619,7 +1627,7 @@ def dashboard(request):
         ).count()
         
         # 6. Distribuzione degli IP per subnet/VLAN
-        # Usa il campo preimpostato num_indirizzi invece di calcolare in tempo reale
+        # Usa il contatore num_indirizzi, mantenuto a ogni modifica degli IP
         vlan_stats = Vlan.objects.values(
             'numero', 'nome', 'subnets', 'num_indirizzi'
         ).order_by('-num_indirizzi')[:5]
@@ -650,41 +1658,19 @@ def dashboard(request):
         # *** Dashboard per utenti normali ***
         
         # 1. IP assegnati all'utente corrente - ottimizzato con select_related e only con ordinamento numerico
-        from django.db import connection
-        if 'mysql' in connection.vendor:
-            ip_assegnati = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                assegnato_a_utente=request.user
-            ).extra(
-                select={'ip_as_int': 'INET_ATON(ip)'}, 
-                order_by=['ip_as_int']
-            )
-        else:
-            ip_assegnati = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                assegnato_a_utente=request.user
-            ).order_by('ip')
+        ip_assegnati = IndirizzoIP.objects.select_related('vlan').only(
+            'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
+        ).filter(
+            assegnato_a_utente=request.user
+        ).ordinati_per_ip()
         
         # 2. IP in scadenza assegnati all'utente - ottimizzato con select_related e only con ordinamento numerico
-        if 'mysql' in connection.vendor:
-            ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                assegnato_a_utente=request.user, 
-                data_scadenza__range=[oggi, tra_30_giorni]
-            ).extra(
-                select={'ip_as_int': 'INET_ATON(ip)'}, 
-                order_by=['data_scadenza', 'ip_as_int']
-            )
-        else:
-            ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
-                'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
-            ).filter(
-                assegnato_a_utente=request.user, 
-                data_scadenza__range=[oggi, tra_30_giorni]
-            ).order_by('data_scadenza', 'ip')
+        ip_in_scadenza = IndirizzoIP.objects.select_related('vlan').only(
+            'ip', 'stato', 'mac_address', 'responsabile', 'vlan', 'data_scadenza'
+        ).filter(
+            assegnato_a_utente=request.user, 
+            data_scadenza__range=[oggi, tra_30_giorni]
+        ).order_by('data_scadenza', 'ip_numerico')
         
         # 3. Conteggi per l'utente - usa i conteggi esistenti per evitare query aggiuntive
         ip_assegnati_count = ip_assegnati.count()
@@ -707,20 +1693,10 @@ def ip_assegnati_non_usati(request):
     """Vista per mostrare IP assegnati ma non usati (disponibilita='usato' ma stato='disattivo')"""
     
     # Query per IP assegnati ma non usati con ordinamento numerico
-    from django.db import connection
-    if 'mysql' in connection.vendor:
-        ip_assegnati_non_usati = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente').filter(
-            disponibilita='usato',
-            stato='disattivo'
-        ).extra(
-            select={'ip_as_int': 'INET_ATON(ip)'}, 
-            order_by=['ip_as_int']
-        )
-    else:
-        ip_assegnati_non_usati = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente').filter(
-            disponibilita='usato',
-            stato='disattivo'
-        ).order_by('ip')
+    ip_assegnati_non_usati = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente', 'controllo').filter(
+        disponibilita='usato',
+        stato='disattivo'
+    ).ordinati_per_ip()
     
     # Conteggio per il titolo
     count = ip_assegnati_non_usati.count()
@@ -745,18 +1721,9 @@ def ip_in_scadenza_admin(request):
     tra_30_giorni = oggi + timezone.timedelta(days=30)
     
     # Query per IP in scadenza con ordinamento numerico
-    from django.db import connection
-    if 'mysql' in connection.vendor:
-        ip_in_scadenza = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente').filter(
-            data_scadenza__range=[oggi, tra_30_giorni]
-        ).extra(
-            select={'ip_as_int': 'INET_ATON(ip)'}, 
-            order_by=['data_scadenza', 'ip_as_int']
-        )
-    else:
-        ip_in_scadenza = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente').filter(
-            data_scadenza__range=[oggi, tra_30_giorni]
-        ).order_by('data_scadenza', 'ip')
+    ip_in_scadenza = IndirizzoIP.objects.select_related('vlan', 'assegnato_a_utente', 'controllo').filter(
+        data_scadenza__range=[oggi, tra_30_giorni]
+    ).order_by('data_scadenza', 'ip_numerico')
     
     # Conteggio per il titolo
     count = ip_in_scadenza.count()
@@ -778,8 +1745,7 @@ def indirizzi_ip_list(request):
     ip_cercato_non_esistente = None
 
     # Base queryset ottimizzata con select_related per ridurre query al database
-    from django.db import connection
-    indirizzi = IndirizzoIP.objects.select_related('vlan')
+    indirizzi = IndirizzoIP.objects.select_related('vlan', 'controllo')
     
     # Gestione dell'ordinamento
     order_by = request.GET.get('order_by', 'ip')  # Default: ordina per IP
@@ -794,7 +1760,7 @@ def indirizzi_ip_list(request):
         'vlan': 'vlan__numero',
         'responsabile': 'responsabile',
         'utente_finale': 'utente_finale',
-        'ultimo_controllo': 'ultimo_controllo'
+        'ultimo_controllo': 'controllo__ultimo_controllo'
     }
     
     # Validazione del campo di ordinamento
@@ -810,33 +1776,16 @@ def indirizzi_ip_list(request):
     if order_dir == 'desc':
         field_name = f'-{field_name}'
     
-    # Per l'IP usiamo ordinamento numerico se supportato dal database
+    # Per l'IP usiamo l'ordinamento numerico sulla colonna indicizzata ip_numerico
     if order_by == 'ip':
-        if 'mysql' in connection.vendor:
-            if order_dir == 'asc':
-                indirizzi = indirizzi.extra(
-                    select={'ip_as_int': 'INET_ATON(ip)'}, 
-                    order_by=['ip_as_int']
-                )
-            else:
-                indirizzi = indirizzi.extra(
-                    select={'ip_as_int': 'INET_ATON(ip)'}, 
-                    order_by=['-ip_as_int']
-                )
-        else:
-            indirizzi = indirizzi.order_by(field_name)
+        indirizzi = indirizzi.ordinati_per_ip(decrescente=(order_dir == 'desc'))
     else:
         indirizzi = indirizzi.order_by(field_name)
         
     ip_filtro = request.GET.get('ip', '').strip()
     if ip_filtro:
-        indirizzi = indirizzi.filter(
-            Q(ip__icontains=ip_filtro) |
-            Q(mac_address__icontains=ip_filtro) |
-            Q(responsabile__icontains=ip_filtro) |
-            Q(utente_finale__icontains=ip_filtro) |
-            Q(note__icontains=ip_filtro)
-        )
+        # Senza un ordinamento scelto dall'utente i risultati seguono la rilevanza
+        indirizzi = cerca_indirizzi(ip_filtro, indirizzi, ordina_per_rilevanza='order_by' not in request.GET)
     
     if 'stato' in request.GET and request.GET['stato']:
         indirizzi = indirizzi.filter(stato=request.GET['stato'])
@@ -849,11 +1798,7 @@ def indirizzi_ip_list(request):
     elif disponibilita_anomalo == 'riservato':
         indirizzi = indirizzi.filter(disponibilita='riservato')
     elif disponibilita_anomalo == 'anomalo':
-        indirizzi = indirizzi.filter(
-            stato='attivo'
-        ).filter(
-            Q(disponibilita='libero') | Q(responsabile__isnull=True) | Q(responsabile='')
-        )
+        indirizzi = indirizzi.filter(anomalo=True)
         
     if 'vlan' in request.GET and request.GET['vlan']:
         indirizzi = indirizzi.filter(vlan__numero=request.GET['vlan'])
@@ -914,18 +1859,9 @@ def indirizzi_ip_list(request):
 @login_required
 def indirizzi_ip_assegnati(request):
     """Vista per l'elenco degli indirizzi IP assegnati all'utente corrente"""
-    from django.db import connection
-    if 'mysql' in connection.vendor:
-        indirizzi_assegnati = IndirizzoIP.objects.filter(
-            assegnato_a_utente=request.user
-        ).extra(
-            select={'ip_as_int': 'INET_ATON(ip)'}, 
-            order_by=['ip_as_int']
-        )
-    else:
-        indirizzi_assegnati = IndirizzoIP.objects.filter(
-            assegnato_a_utente=request.user
-        ).order_by('ip')
+    indirizzi_assegnati = IndirizzoIP.objects.filter(
+        assegnato_a_utente=request.user
+    ).ordinati_per_ip()
         
     return render(request, 'reti_app/indirizzi_assegnati.html', {'indirizzi': indirizzi_assegnati})
 
@@ -1097,20 +2033,18 @@ def ricerca_indirizzo(request):
     risultati = []
     
     if query:
-        risultati = IndirizzoIP.objects.filter(
-            Q(ip__icontains=query) | 
-            Q(mac_address__icontains=query) | 
-            Q(responsabile__icontains=query) | 
-            Q(utente_finale__icontains=query) |
-            Q(note__icontains=query)
+        risultati = cerca_indirizzi(
+            query,
+            IndirizzoIP.objects.select_related('vlan').ordinati_per_ip(),
+            limite=settings.RICERCA_MAX_RISULTATI
         )
-        
+
     return render(request, 'reti_app/ricerca.html', {'risultati': risultati, 'query': query})
 
 @login_required
 def vlan_list(request):
     """Vista per l'elenco delle VLAN"""
-    vlans = Vlan.objects.all()
+    vlans = risposta_in_cache('vlan_list', lambda: list(Vlan.objects.all()), 'vlan')
     return render(request, 'reti_app/vlan_list.html', {'vlans': vlans})
 
 @login_required
@@ -1128,20 +2062,13 @@ def vlan_detail(request, vlan_numero):
     vlan = get_object_or_404(Vlan, numero=vlan_numero)
     
     # IP della VLAN con ordinamento numerico
-    from django.db import connection
-    if 'mysql' in connection.vendor:
-        ip_vlan = IndirizzoIP.objects.filter(vlan=vlan).extra(
-            select={'ip_as_int': 'INET_ATON(ip)'}, 
-            order_by=['ip_as_int']
-        )
-    else:
-        ip_vlan = IndirizzoIP.objects.filter(vlan=vlan).order_by('ip')
+    ip_vlan = IndirizzoIP.objects.filter(vlan=vlan).select_related('controllo').ordinati_per_ip()
     
-    # Calcola statistiche per la VLAN
-    total_count = ip_vlan.count()
-    ip_attivi_count = ip_vlan.filter(stato='attivo').count()
-    ip_usati_count = ip_vlan.filter(disponibilita='usato').count()
-    ip_liberi_count = ip_vlan.filter(disponibilita='libero').count()
+    # Statistiche della VLAN dai contatori mantenuti a ogni modifica degli IP
+    total_count = vlan.num_indirizzi
+    ip_attivi_count = vlan.num_attivi
+    ip_usati_count = vlan.num_usati
+    ip_liberi_count = vlan.num_liberi
     
     context = {
         'vlan': vlan,
@@ -1159,6 +2086,7 @@ def vlan_detail(request, vlan_numero):
     
     return render(request, 'reti_app/vlan_detail.html', context)
 
+@lru_cache(maxsize=4096)
 def is_valid_ip_range(ip_str):
     """
     Valida che l'IP sia in un range valido per l'assegnazione.
@@ -1169,6 +2097,8 @@ def is_valid_ip_range(ip_str):
     - 224.0.0.0/4 (multicast)
     - 240.0.0.0/4 (riservato)
     - IP broadcast e di rete
+
+    Non legge il database: i risultati sono memorizzati nel processo (lru_cache).
     """
     try:
         ip = ipaddress.IPv4Address(ip_str)
@@ -1227,22 +2157,21 @@ def check_ip_availability(request):
     if not ip:
         return JsonResponse({'error': 'IP non specificato'}, status=400)
     
-    try:
-        indirizzo = IndirizzoIP.objects.get(ip=ip)
+    indirizzo = _indirizzo_in_cache('check_ip_availability', ip)
+    if indirizzo is not None:
         return JsonResponse({
             'ip': indirizzo.ip,
             'exists': True,
             'stato': indirizzo.stato,
             'disponibilita': indirizzo.disponibilita,
             'responsabile': indirizzo.responsabile or '',
-            'is_anomalo': indirizzo.is_anomalo()
-        })
-    except IndirizzoIP.DoesNotExist:
-        return JsonResponse({
-            'ip': ip,
-            'exists': False,
-            'available': True
+            'is_anomalo': indirizzo.anomalo
         })
+    return JsonResponse({
+        'ip': ip,
+        'exists': False,
+        'available': True
+    })
 
 @login_required
 def rilascia_ip(request, ip):
@@ -1272,6 +2201,55 @@ def rilascia_ip(request, ip):
     # Se GET, mostra una pagina di conferma
     return render(request, 'reti_app/conferma_rilascio.html', {'indirizzo': indirizzo})
 
+@api_view(['GET', 'DELETE'])
+def statistiche_cache(request):
+    """
+    **Hit rate delle risposte in cache (solo staff).**
+
+    I contatori degli endpoint sono condivisi da tutti i processi (sono nella
+    cache stessa); quelli di `validate_ip_range`, che non legge il database,
+    sono del solo processo che risponde. `DELETE` azzera i contatori condivisi.
+
+    **Esempio:**
+    ```
+    GET /api/cache/
+    ```
+
+    **Risposta:**
+    ```json
+    {
+        "backend": "redis",
+        "timeout": 60,
+        "endpoint": {
+            "getbyip": {"hit": 9120, "miss": 310, "hit_rate": 0.9671}
+        },
+        "validate_ip_range": {"hit": 420, "miss": 35, "hit_rate": 0.9231, "voci": 35}
+    }
+    ```
+    """
+    if not request.user.is_staff:
+        return Response(
+            {'error': 'Solo gli staff possono consultare le statistiche della cache'},
+            status=status.HTTP_403_FORBIDDEN
+        )
+    if request.method == 'DELETE':
+        azzera_statistiche_risposte(RISPOSTE_IN_CACHE)
+        return Response(status=status.HTTP_204_NO_CONTENT)
+
+    validazioni = is_valid_ip_range.cache_info()
+    totale = validazioni.hits + validazioni.misses
+    return Response({
+        'backend': settings.CACHE_BACKEND,
+        'timeout': settings.CACHE_RISPOSTE_SECONDI,
+        'endpoint': statistiche_risposte(RISPOSTE_IN_CACHE),
+        'validate_ip_range': {
+            'hit': validazioni.hits,
+            'miss': validazioni.misses,
+            'hit_rate': round(validazioni.hits / totale, 4) if totale else None,
+            'voci': validazioni.currsize,
+        },
+    })
+
 def health_check(request):
     """Health check endpoint for container monitoring"""
     return JsonResponse({'status': 'healthy', 'timestamp': timezone.now().isoformat()}) 
\ No newline at end of file
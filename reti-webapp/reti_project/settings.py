@@ -1,5 +1,6 @@
 import os
 from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
 import ldap
 from django_auth_ldap.config import LDAPSearch, GroupOfNamesType
 
@@ -94,6 +95,39 @@ DATABASES = {
     }
 }
 
+# Cache
+# CACHE_BACKEND: locmem (default, separata per ogni processo), file (cartella
+# condivisa dai worker), redis o memcached (server locale, es. redis://127.0.0.1:6379/1;
+# richiedono rispettivamente i pacchetti redis e pymemcache)
+CACHE_BACKENDS = {
+    'locmem': ('django.core.cache.backends.locmem.LocMemCache', 'reti'),
+    'file': ('django.core.cache.backends.filebased.FileBasedCache', str(BASE_DIR / 'cache')),
+    'redis': ('django.core.cache.backends.redis.RedisCache', 'redis://127.0.0.1:6379/1'),
+    'memcached': ('django.core.cache.backends.memcached.PyMemcacheCache', '127.0.0.1:11211'),
+}
+CACHE_BACKEND = os.environ.get('CACHE_BACKEND', 'locmem')
+if CACHE_BACKEND not in CACHE_BACKENDS:
+    raise ImproperlyConfigured(
+        f"CACHE_BACKEND non valido: {CACHE_BACKEND} (valori ammessi: {', '.join(CACHE_BACKENDS)})"
+    )
+
+CACHES = {
+    'default': {
+        'BACKEND': CACHE_BACKENDS[CACHE_BACKEND][0],
+        'LOCATION': os.environ.get('CACHE_LOCATION', CACHE_BACKENDS[CACHE_BACKEND][1]),
+        'KEY_PREFIX': 'reti',
+    }
+}
+if CACHE_BACKEND in ('locmem', 'file'):
+    # Il default di Django (300 voci) è troppo basso per una voce per IP
+    CACHES['default']['OPTIONS'] = {'MAX_ENTRIES': int(os.environ.get('CACHE_MAX_VOCI', '20000'))}
+
+# Secondi di validità delle risposte in cache (getbyip, check-ip, VLAN); 0 disattiva la cache.
+# Le voci vengono invalidate a ogni modifica di IP e VLAN, ma con locmem solo nel processo
+# che ha fatto la modifica: per default la cache delle risposte è attiva solo con un
+# backend condiviso dai worker
+CACHE_RISPOSTE_SECONDI = int(os.environ.get('CACHE_RISPOSTE_SECONDI', '0' if CACHE_BACKEND == 'locmem' else '60'))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -167,6 +201,26 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': ['django_filters.rest_framework.DjangoFilterBackend'],
 }
 
+# Massimo page_size richiedibile dai client su /api/ips/ (inventari completi a pagine grandi)
+API_IP_MAX_PAGE_SIZE = int(os.environ.get('API_IP_MAX_PAGE_SIZE', '5000'))
+
+# Record dello storico dei responsabili inclusi in ogni IP dell'API (il resto è in /api/ips/{ip}/storico/)
+API_STORICO_MAX_RECORD = int(os.environ.get('API_STORICO_MAX_RECORD', '10'))
+
+# Avvistamenti IP: assenza massima (minuti) oltre la quale un nuovo avvistamento
+# della stessa coppia IP/MAC apre un nuovo intervallo invece di estendere l'ultimo
+AVVISTAMENTI_INTERVALLO_MAX_MINUTI = int(os.environ.get('AVVISTAMENTI_INTERVALLO_MAX_MINUTI', '120'))
+
+# Osservazioni dei collector: secondi tra due unioni della tabella di appoggio
+# (default del comando unisci_osservazioni --intervallo)
+OSSERVAZIONI_INTERVALLO_UNIONE_SECONDI = int(os.environ.get('OSSERVAZIONI_INTERVALLO_UNIONE_SECONDI', '30'))
+
+# Ricerca testuale: numero massimo di risultati mostrati dalla pagina di ricerca
+RICERCA_MAX_RISULTATI = int(os.environ.get('RICERCA_MAX_RISULTATI', '500'))
+
+# Statistiche API: secondi per cui il risultato di /api/ips/statistiche/ resta in cache
+STATISTICHE_CACHE_SECONDI = int(os.environ.get('STATISTICHE_CACHE_SECONDI', '30'))
+
 # CORS settings
 CORS_ALLOWED_ORIGINS = os.environ.get('CSRF_TRUSTED_ORIGINS', 'http://localhost:8000').split(',')
 CORS_ALLOW_CREDENTIALS = True
@@ -8,12 +8,19 @@ from django.conf.urls.static import static
 from django.contrib.auth.views import LoginView, LogoutView
 from rest_framework.routers import DefaultRouter
 
-from reti_app.views import IndirizzoIPViewSet, health_check, VlanViewSet
+from reti_app.views import (
+    IndirizzoIPViewSet, health_check, VlanViewSet, AvvistamentoIPViewSet, StoricoArchivioViewSet, MacViewSet,
+    OsservazioneIPViewSet, statistiche_cache
+)
 
 # Configurazione API router
 router = routers.DefaultRouter()
 router.register(r'ips', IndirizzoIPViewSet)
 router.register(r'vlans', VlanViewSet, basename='vlan')
+router.register(r'sightings', AvvistamentoIPViewSet)
+router.register(r'history-archive', StoricoArchivioViewSet)
+router.register(r'macs', MacViewSet, basename='mac')
+router.register(r'observations', OsservazioneIPViewSet, basename='observation')
 
 # Configurazione Swagger/OpenAPI
 schema_view = get_schema_view(
@@ -36,6 +43,7 @@ urlpatterns = [
     # API REST
     path('api/', include(router.urls)),
     path('api/health/', health_check, name='api_health_check'),
+    path('api/cache/', statistiche_cache, name='api_statistiche_cache'),
     path('api-auth/', include('rest_framework.urls', namespace='rest_framework')),
     
     # Documentazione API